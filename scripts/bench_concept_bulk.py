@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from services.model.concept_graph import ConceptGraph
+
+def bulk_load(cg, n_concepts, n_relations, chunk, rng):
+    """
+    link_batch لـ n_concepts proto ثم add_relations_batch لـ n_relations علاقة عشوائية
+    على دفعات بحجم chunk. يعيد (ثواني link، ثواني relations).
+    """
+    t0 = time.perf_counter()
+    concepts = []
+    for start in range(0, n_concepts, chunk):
+        pids = [f"p_{i:07d}" for i in range(start, min(start + chunk, n_concepts))]
+        concepts += cg.link_batch(pids, labels=[["bulk"]] * len(pids))
+    t1 = time.perf_counter()
+    types = ["is_a", "part_of", "near", "causes"]
+    for start in range(0, n_relations, chunk):
+        m = min(chunk, n_relations - start)
+        a = rng.integers(0, n_concepts, m).tolist()
+        b = rng.integers(0, n_concepts, m).tolist()
+        r = rng.integers(0, len(types), m).tolist()
+        w = rng.random(m).tolist()
+        cg.add_relations_batch([(concepts[x], concepts[y], types[t], v) for x, y, t, v in zip(a, b, r, w)])
+    cg.flush()
+    return t1 - t0, time.perf_counter() - t1
+
+def per_call(cg, n, rng):
+    # المسار القديم: link/add_relation لكل عنصر (للمقارنة على عينة صغيرة)
+    t0 = time.perf_counter()
+    concepts = [cg.link(f"q_{i:07d}", None, labels=["single"]) for i in range(n)]
+    for x, y in zip(rng.integers(0, n, n).tolist(), rng.integers(0, n, n).tolist()):
+        cg.add_relation(concepts[x], concepts[y], "near")
+    cg.flush()
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="ConceptGraph bulk ingestion benchmark (link_batch / add_relations_batch)")
+    ap.add_argument("--concepts", type=int, default=200000)
+    ap.add_argument("--relations", type=int, default=1000000)
+    ap.add_argument("--chunk", type=int, default=100000)
+    ap.add_argument("--backends", default="networkx,csr")
+    ap.add_argument("--single", type=int, default=20000, help="items for the per-call baseline (0 = skip)")
+    args = ap.parse_args()
+
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cg.jsonl")
+            rng = np.random.default_rng(0)
+            cg = ConceptGraph(path=path, backend=backend)
+            t_link, t_rel = bulk_load(cg, args.concepts, args.relations, args.chunk, rng)
+            print(f"[{backend}] link_batch {args.concepts}: {t_link:.2f}s  "
+                  f"add_relations_batch {args.relations}: {t_rel:.2f}s ({args.relations / t_rel:,.0f} rel/s)  "
+                  f"edges={cg.G.number_of_edges()} journal={os.path.getsize(path) / 2**20:.1f} MiB")
+            t0 = time.perf_counter()
+            cg.checkpoint()
+            t_ckpt = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            ConceptGraph(path=path, backend=backend)
+            print(f"[{backend}] checkpoint: {t_ckpt:.2f}s  reload: {time.perf_counter() - t0:.2f}s")
+            if args.single:
+                t = per_call(ConceptGraph(path=os.path.join(d, "single.jsonl"), backend=backend), args.single, rng)
+                print(f"[{backend}] per-call link+add_relation x{args.single}: {t:.2f}s ({2 * args.single / t:,.0f} ops/s)")
+
+if __name__ == "__main__":
+    main()
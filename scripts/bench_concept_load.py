@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from services.model.concept_graph import ConceptGraph
+
+def write_legacy(path, n_concepts, n_relations, rng):
+    # journal بالصيغة السطرية القديمة: سجل لكل عقدة ولكل حافة
+    types = ["is_a", "part_of", "near", "causes"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_concepts):
+            f.write(json.dumps({"op": "node", "concept_id": f"c_{i:07d}", "labels": [f"l_{i % 1000}"],
+                                "proto_refs": [f"p_{i:07d}"], "confidence": 0.5, "provenance": {},
+                                "last_updated": 1.7e9}) + "\n")
+        a = rng.integers(0, n_concepts, n_relations).tolist()
+        b = rng.integers(0, n_concepts, n_relations).tolist()
+        r = rng.integers(0, len(types), n_relations).tolist()
+        w = rng.random(n_relations).tolist()
+        for x, y, t, v in zip(a, b, r, w):
+            f.write(json.dumps({"op": "edge", "a": f"c_{x:07d}", "b": f"c_{y:07d}", "rel_type": types[t],
+                                "weight": v}) + "\n")
+
+def cold_load(path, backend, mmap=True):
+    t0 = time.perf_counter()
+    cg = ConceptGraph(path=path, backend=backend, mmap=mmap)
+    return cg, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="ConceptGraph cold-start load: JSONL journal vs binary snapshot")
+    ap.add_argument("--concepts", type=int, default=200000)
+    ap.add_argument("--relations", type=int, default=1000000)
+    ap.add_argument("--backends", default="networkx,csr")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        legacy = os.path.join(d, "legacy.jsonl")
+        write_legacy(legacy, args.concepts, args.relations, np.random.default_rng(0))
+        print(f"legacy journal: {os.path.getsize(legacy) / 2**20:.1f} MiB")
+        for backend in args.backends.split(","):
+            path = os.path.join(d, f"{backend}.jsonl")
+            with open(legacy, "rb") as src, open(path, "wb") as dst:
+                dst.write(src.read())
+            cg, t_jsonl = cold_load(path, backend)
+            cg.checkpoint()
+            snap = os.path.getsize(cg.snapshot_file) / 2**20
+            _, t_read = cold_load(path, backend, mmap=False)
+            cg2, t_mmap = cold_load(path, backend, mmap=True)
+            assert cg2.G.number_of_edges() == cg.G.number_of_edges()
+            print(f"[{backend}] jsonl: {t_jsonl:.2f}s  snapshot ({snap:.1f} MiB): read {t_read:.2f}s "
+                  f"({t_jsonl / t_read:.1f}x)  mmap {t_mmap:.2f}s ({t_jsonl / t_mmap:.1f}x)")
+
+if __name__ == "__main__":
+    main()
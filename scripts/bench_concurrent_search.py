@@ -0,0 +1,68 @@
+import argparse
+import tempfile
+import threading
+import time
+import os
+import numpy as np
+import faiss
+from services.model.proto_memory import ProtoMemory
+
+def run(pm, queries, n_threads, seconds, writer):
+    """
+    n_threads يبحثون بالتوازي لمدة seconds؛ writer=True يضيف خيط كاتب
+    يرسل دفعات assign_batch صغيرة طوال المدة. يعيد (عمليات بحث/ثانية، دفعات كتابة).
+    """
+    stop = threading.Event()
+    counts = [0] * n_threads
+    writes = [0]
+
+    def reader(t):
+        i = t
+        while not stop.is_set():
+            pm.search(queries[i % len(queries)], k=5)
+            counts[t] += 1
+            i += n_threads
+
+    def write_loop():
+        rng = np.random.default_rng(1)
+        while not stop.is_set():
+            pm.assign_batch(rng.standard_normal((32, queries.shape[1])).astype(np.float32), "text")
+            writes[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(t,)) for t in range(n_threads)]
+    if writer:
+        threads.append(threading.Thread(target=write_loop))
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    time.sleep(seconds)
+    stop.set()
+    for th in threads:
+        th.join()
+    return sum(counts) / (time.perf_counter() - start), writes[0]
+
+def main():
+    ap = argparse.ArgumentParser(description="ProtoMemory.search throughput vs reader threads")
+    ap.add_argument("--protos", type=int, default=50000)
+    ap.add_argument("--threads", default="1,2,4,8")
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--writer", action="store_true", help="add a concurrent assign_batch writer")
+    args = ap.parse_args()
+
+    # كل بحث خيط واحد: التوازي يأتي من خيوط الطلبات لا من OpenMP داخل FAISS
+    faiss.omp_set_num_threads(1)
+    with tempfile.TemporaryDirectory() as d:
+        pm = ProtoMemory(index_file=os.path.join(d, "faiss.bin"), meta_file=os.path.join(d, "protos.jsonl"))
+        rng = np.random.default_rng(0)
+        X = rng.standard_normal((args.protos, pm.faiss.dim)).astype(np.float32)
+        pm.faiss.add_batch(X, [f"p_{i:07d}" for i in range(args.protos)], "text")
+        queries = X[rng.integers(0, args.protos, 1000)]
+        print(f"cpus={os.cpu_count()} protos={args.protos} writer={args.writer}")
+        base = None
+        for n in [int(t) for t in args.threads.split(",")]:
+            qps, writes = run(pm, queries, n, args.seconds, args.writer)
+            base = base or qps
+            print(f"threads={n:3d}  {qps:10.1f} searches/s  x{qps / base:5.2f}  write batches={writes}")
+
+if __name__ == "__main__":
+    main()
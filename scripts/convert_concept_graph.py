@@ -0,0 +1,30 @@
+import argparse
+import os
+import shutil
+import time
+from services.model.concept_graph import ConceptGraph
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert a JSONL ConceptGraph journal to the binary snapshot format")
+    ap.add_argument("path", nargs="?", default="data/concept_graph.jsonl")
+    ap.add_argument("--backend", default="csr", help="in-memory backend used for the conversion")
+    ap.add_argument("--no-backup", action="store_true", help="do not keep the original journal as <path>.bak")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.path):
+        raise SystemExit(f"{args.path} not found")
+    if not args.no_backup:
+        shutil.copy2(args.path, args.path + ".bak")
+    size = os.path.getsize(args.path)
+    t0 = time.perf_counter()
+    cg = ConceptGraph(path=args.path, backend=args.backend)
+    t1 = time.perf_counter()
+    # checkpoint يكتب اللقطة ويقص الـ journal (لا سجلات جديدة هنا، فيبقى فارغًا)
+    cg.checkpoint()
+    t2 = time.perf_counter()
+    print(f"nodes={cg.G.number_of_nodes()} edges={cg.G.number_of_edges()}  "
+          f"jsonl {size / 2**20:.1f} MiB -> {cg.snapshot_file} {os.path.getsize(cg.snapshot_file) / 2**20:.1f} MiB  "
+          f"(load {t1 - t0:.2f}s, write {t2 - t1:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+from services.model.config import PROTO_META_FILE, FAISS_THRESHOLD, FAISS_PQ_M
+from services.model.faiss_store import build_index, normalize_rows
+
+def load_data(path, n, dim, seed=0):
+    """
+    centroids الحقيقية من لقطة ProtoMemory إن وُجدت، وإلا بيانات عنقودية
+    اصطناعية بنفس البعد (أسوأ من الحقيقية: العناقيد متقاربة).
+    """
+    if path and os.path.exists(path):
+        X = np.load(path, mmap_mode="r")
+        return normalize_rows(X[:n] if n else X), path
+    rng = np.random.default_rng(seed)
+    n = n or 50000
+    centers = rng.standard_normal((max(n // 20, 1), dim)).astype(np.float32)
+    X = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(X), "synthetic"
+
+def rerank(X, Q, I, k):
+    # نفس ما يفعله ProtoMemory._search_batch: cosine دقيق مع centroids المرشحين
+    S = np.einsum("qkd,qd->qk", X[np.maximum(I, 0)], Q)
+    S[I < 0] = -np.inf
+    order = np.argsort(-S, axis=1)[:, :k]
+    return np.take_along_axis(S, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall vs memory for compressed FAISS index types")
+    ap.add_argument("--centroids", default=PROTO_META_FILE + ".centroids.npy")
+    ap.add_argument("--n", type=int, default=0, help="limit number of vectors (0 = all / 50000 synthetic)")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--types", default="flat,fp16,sq8,pq,ivf_pq")
+    ap.add_argument("--pq-m", type=int, default=FAISS_PQ_M)
+    ap.add_argument("--rerank", type=int, default=16)
+    ap.add_argument("--threshold", type=float, default=FAISS_THRESHOLD)
+    args = ap.parse_args()
+
+    X, source = load_data(args.centroids, args.n, 384)
+    n, dim = X.shape
+    rng = np.random.default_rng(1)
+    # الاستعلامات: أعضاء مشوشة قليلًا (مثل embeddings جديدة قرب proto موجود)
+    Q = X[rng.integers(0, n, args.queries)] + 0.05 * rng.standard_normal((args.queries, dim)).astype(np.float32)
+    Q = normalize_rows(Q)
+    ids = np.arange(n, dtype=np.int64)
+
+    exact = build_index("flat", dim)
+    exact.add_with_ids(X, ids)
+    D_ref, I_ref = exact.search(Q, 1)
+    match_ref = D_ref[:, 0] >= args.threshold
+
+    print(f"data={source} n={n} dim={dim} queries={len(Q)} threshold={args.threshold}")
+    print(f"{'type':8s} {'MB':>9s} {'x':>6s} {'recall@1':>9s} {'+rerank':>8s} {'thr agree':>10s} {'+rerank':>8s} {'ms/q':>7s}")
+    flat_bytes = None
+    for kind in args.types.split(","):
+        index = build_index(kind, dim, ntotal=n, pq_m=args.pq_m)
+        if not index.is_trained:
+            index.train(X[rng.choice(n, min(n, 100000), replace=False)])
+        index.add_with_ids(X, ids)
+        if kind.startswith("ivf"):
+            faiss.ParameterSpace().set_index_parameter(index, "nprobe", 16)
+        size = len(faiss.serialize_index(index)) / 2**20
+        flat_bytes = flat_bytes or size
+        t = time.perf_counter()
+        D, I = index.search(Q, max(1, args.rerank))
+        ms = (time.perf_counter() - t) * 1000 / len(Q)
+        Dr, Ir = rerank(X, Q, I, 1)
+        rec = np.mean(I[:, 0] == I_ref[:, 0])
+        rec_r = np.mean(Ir[:, 0] == I_ref[:, 0])
+        agree = np.mean((D[:, 0] >= args.threshold) == match_ref)
+        agree_r = np.mean((Dr[:, 0] >= args.threshold) == match_ref)
+        print(f"{kind:8s} {size:9.1f} {flat_bytes / size:6.1f} {rec:9.4f} {rec_r:8.4f} {agree:10.4f} {agree_r:8.4f} {ms:7.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,151 @@
-import numpy as np
-from services.model.encoders import MultiModalEncoders
-from services.model.faiss_store import FaissStore, normalize
-import random
+import argparse
+import json
 import os
+import numpy as np
+from services.model.config import EMBED_DIM, FAISS_INDEX_FILE, PROTO_META_FILE, FAISS_THRESHOLD
+from services.model.faiss_partitions import PartitionedFaissStore
+from services.model.faiss_store import normalize_rows
+from services.model.proto_table import ProtoTable
+from services.model.centroid_store import CentroidStore
+
+# هستوغرام ثابت على [-1, 1]: الذاكرة لا تعتمد على عدد المتجهات
+BINS = 2000
+EDGES = np.linspace(-1.0, 1.0, BINS + 1)
+
+def histogram(sims):
+    return np.histogram(np.clip(sims, -1.0, 1.0), bins=EDGES)[0]
+
+def open_live(index_file, meta_file, dim):
+    """
+    فتح اللقطة المحفوظة للقراءة فقط: الفهرس بـ mmap بلا ترحيل ولا إعادة كتابة
+    لملفات .ids (الخدمة قد تعمل عليها)، وجدول protos و centroids بـ mmap
+    (بدون إعادة تطبيق الـ WAL).
+    """
+    store = PartitionedFaissStore(dim, index_file, mmap=True, read_only=True)
+    protos = ProtoTable()
+    centroids = CentroidStore(dim)
+    if os.path.exists(ProtoTable.idx_path(meta_file)):
+        protos.open_snapshot(meta_file)
+        centroids.load(meta_file + ".centroids.npy")
+    return store, protos, centroids
+
+def self_join(store, protos, centroids, chunk, sample, rng):
+    """
+    لكل proto في كل partition: التشابه مع أقرب proto آخر في نفس الـ modality
+    (بحث k=2 على دفعات). يعيد {modality: هستوغرام}.
+    """
+    hists = {}
+    for name, part in sorted(store.partitions.items()):
+        keys = part.ids_map.live_keys()
+        if sample and len(keys) > sample:
+            keys = keys[np.sort(rng.choice(len(keys), sample, replace=False))]
+        rows = protos.snapshot_rows(keys)
+        keys, rows = keys[rows >= 0], rows[rows >= 0]
+        hist = np.zeros(BINS, dtype=np.int64)
+        for start in range(0, len(keys), chunk):
+            V = normalize_rows(centroids.get(rows[start:start + chunk]))
+            ids, D = part.search_batch(V, 2)
+            own = [k.decode("utf-8") for k in keys[start:start + chunk].tolist()]
+            # أول نتيجة هي الـ proto نفسه عادةً؛ وإلا فهي أقرب جار
+            nn = np.where([row[0] == pid for row, pid in zip(ids, own)], D[:, 1], D[:, 0])
+            hist += histogram(nn[np.isfinite(nn) & (nn > -2)])
+        hists[name] = hist
+        print(f"[{name}] scanned {len(keys)} protos")
+    return hists
+
+def stream_embeddings(path, modality, chunk):
+    # .npy (mmap) أو .jsonl بسطور {"embedding": [...], "modality": "..."}؛ دفعات بحجم chunk
+    if path.endswith(".npy"):
+        X = np.load(path, mmap_mode="r")
+        for start in range(0, len(X), chunk):
+            yield np.asarray(X[start:start + chunk], dtype=np.float32), [modality] * min(chunk, len(X) - start)
+        return
+    vecs, mods = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            obj = json.loads(line)
+            vecs.append(obj["embedding"])
+            mods.append(obj.get("modality", modality))
+            if len(vecs) == chunk:
+                yield np.asarray(vecs, dtype=np.float32), mods
+                vecs, mods = [], []
+    if vecs:
+        yield np.asarray(vecs, dtype=np.float32), mods
+
+def replay_stream(store, path, modality, chunk):
+    """
+    لكل embedding في الـ dump: التشابه مع أقرب proto في partition الـ modality الخاصة به
+    (ما كان assign سيراه). يعيد {modality: هستوغرام}.
+    """
+    hists = {}
+    for X, mods in stream_embeddings(path, modality, chunk):
+        ids, D = store.search_batch(X, 1, modalities=mods)
+        top = np.where([row[0] is not None for row in ids], D[:, 0], -1.0)
+        for m in set(mods):
+            sel = np.array([x == m for x in mods])
+            name = store.partition_name(m)
+            hists[name] = hists.get(name, np.zeros(BINS, dtype=np.int64)) + histogram(top[sel])
+    return hists
+
+def report(hists, thresholds, existing):
+    """
+    لكل modality وعتبة: assign rate = نسبة المتجهات التي تطابق proto موجودًا،
+    و protos المتوقعة = الموجودة + ما لا يطابق (حد أعلى: يتجاهل الدمج بين الجديدة).
+    """
+    out = {}
+    for name, hist in sorted(hists.items()):
+        total = int(hist.sum())
+        if not total:
+            continue
+        above = hist[::-1].cumsum()[::-1]  # above[i] = عدد القيم >= EDGES[i]
+        centers = (EDGES[:-1] + EDGES[1:]) / 2
+        cdf = hist.cumsum() / total
+        pct = {p: float(centers[np.searchsorted(cdf, p / 100)]) for p in (50, 95, 99)}
+        rows = []
+        for t in thresholds:
+            i = int(np.searchsorted(EDGES, t, side="left"))
+            matched = int(above[i]) if i < BINS else 0
+            rows.append({
+                "threshold": round(float(t), 4),
+                "assign_rate": matched / total,
+                "est_protos": existing.get(name, 0) + total - matched,
+            })
+        out[name] = {"samples": total, "percentiles": pct, "thresholds": rows,
+                     "suggested": pct[99] * 0.98}
+        print(f"\n== {name}: {total} samples, p50={pct[50]:.3f} p95={pct[95]:.3f} p99={pct[99]:.3f}")
+        print(f"{'threshold':>9s} {'assign%':>8s} {'est_protos':>11s}")
+        for r in rows:
+            print(f"{r['threshold']:9.3f} {100 * r['assign_rate']:8.2f} {r['est_protos']:11d}")
+        print(f"Suggested threshold: {out[name]['suggested']:.4f}")
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Tune FAISS_THRESHOLD from the live index or an embedding dump")
+    ap.add_argument("--index-file", default=FAISS_INDEX_FILE)
+    ap.add_argument("--meta-file", default=PROTO_META_FILE)
+    ap.add_argument("--embeddings", help=".npy or .jsonl dump to replay against the index (default: self-join of the index)")
+    ap.add_argument("--modality", default="text", help="modality for .npy dumps / jsonl lines without one")
+    ap.add_argument("--dim", type=int, default=EMBED_DIM)
+    ap.add_argument("--chunk", type=int, default=4096)
+    ap.add_argument("--sample", type=int, default=0, help="max protos per modality in self-join mode (0 = all)")
+    ap.add_argument("--thresholds", default="", help="comma separated (default 0.50..0.975 step 0.025 + current)")
+    ap.add_argument("--json", help="write the report as JSON")
+    args = ap.parse_args()
 
-def main(sample_size=1000):
-    enc = MultiModalEncoders()
-    index_file = "data/tune_faiss.bin"
-    faiss = FaissStore(dim=enc.dim, index_file=index_file)
-
-    vecs = [enc.encode_text(f"sample {i}") for i in range(sample_size)]
-    for i, v in enumerate(vecs):
-        faiss.add(v, f"p_{i:05d}")
-
-    dists = []
-    for v in vecs:
-        ids, sims = faiss.search(v, k=5)
-        for sim in sims[1:]:
-            dists.append(sim)
-
-    dists = np.array(dists)
-    print("mean similarity:", np.mean(dists))
-    print("95% percentile:", np.percentile(dists, 95))
-    print("99% percentile:", np.percentile(dists, 99))
-    print("Suggested threshold:", np.percentile(dists, 99) * 0.98)
-
-    # cleanup: حذف الملف المؤقت
-    try:
-        if os.path.exists(index_file):
-            os.remove(index_file)
-        if os.path.exists(index_file + ".ids"):
-            os.remove(index_file + ".ids")
-    except Exception as e:
-        print("Warning: could not delete temporary files:", e)
+    thresholds = [float(t) for t in args.thresholds.split(",")] if args.thresholds else \
+        sorted(set(np.round(np.arange(0.5, 0.99, 0.025), 3).tolist() + [FAISS_THRESHOLD]))
+    store, protos, centroids = open_live(args.index_file, args.meta_file, args.dim)
+    existing = {name: len(p.ids_map) for name, p in store.partitions.items()}
+    print(f"index partitions: {existing}  current FAISS_THRESHOLD={FAISS_THRESHOLD}")
+    if args.embeddings:
+        hists = replay_stream(store, args.embeddings, args.modality, args.chunk)
+    else:
+        hists = self_join(store, protos, centroids, args.chunk, args.sample, np.random.default_rng(0))
+        existing = {}  # self-join: التقدير لإعادة بناء الفهرس من الصفر بالعتبة المرشحة
+    result = report(hists, thresholds, existing)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
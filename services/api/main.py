@@ -4,11 +4,12 @@ import uuid
 import logging
 import queue
 import uvicorn
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, File, UploadFile, Header, HTTPException, Request, Depends
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 import numpy as np
 
@@ -19,9 +20,12 @@ from services.model.intrinsic import IntrinsicMotivation
 from services.model.consolidation import ConsolidationWorker
 from services.model.teacher import TeacherAPI
 from services.model.concept_graph import ConceptGraph
+from services.model.concept_rank import ConceptRanker
 from services.model.proto_memory import ProtoMemory
+from services.model.proto_merge import ProtoMerger
 from services.model.memory_log import MemoryLogger
 from services.model.encoders import MultiModalEncoders
+from services.model.request_batcher import RequestBatcher
 from services.model.experts import ExpertRouter
 
 # --------------------------------------------------
@@ -33,6 +37,15 @@ logger_py = logging.getLogger("cmsh.api")
 API_KEY = os.getenv("API_KEY", "changeme")
 # Default 4 MiB unless overridden
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 4 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1 << 20
+# حدود /search و /search/batch
+MAX_SEARCH_K = int(os.getenv("MAX_SEARCH_K", 1000))
+MAX_SEARCH_BATCH = int(os.getenv("MAX_SEARCH_BATCH", 1024))
+# /concepts/rank: كل مجموعة بذور صف كثيف بطول عدد المفاهيم، فالحد أصغر من MAX_SEARCH_BATCH
+MAX_RANK_SEEDS = int(os.getenv("MAX_RANK_SEEDS", 64))
+# تجميع طلبات /encode و /assign المتزامنة: أقصى حجم دفعة (1 = تعطيل) وأقصى انتظار بالميلي ثانية
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", 64))
+COALESCE_MAX_WAIT_MS = float(os.getenv("COALESCE_MAX_WAIT_MS", 2.0))
 
 # CORS origins parsing (handle empty string safely)
 _raw_origins = os.getenv("CORS_ALLOW_ORIGINS", "").strip()
@@ -57,13 +70,45 @@ app.add_middleware(
 task_queue = queue.Queue()
 memory_logger = MemoryLogger()
 cg = ConceptGraph()
+ranker = ConceptRanker(cg)
 pm = ProtoMemory()
 gwm = GenerativeWorldModel()
 cf = CounterfactualEngine()
 intrinsic = IntrinsicMotivation()
 encoders = MultiModalEncoders()
+
+
+def _encode_many(payloads):
+    # payload: (input, modality). encode_batch واحد لكل modality مطلوبة؛ إن فشلت الدفعة
+    # (مدخل غير مدعوم) يُعاد ترميز عناصرها فرديًا ليصل الخطأ لطالبه فقط
+    out = [None] * len(payloads)
+    groups = {}
+    for i, (_, modality) in enumerate(payloads):
+        groups.setdefault(modality, []).append(i)
+    for modality, rows in groups.items():
+        try:
+            M = encoders.encode_batch([payloads[i][0] for i in rows], modality=modality)
+            for r, i in enumerate(rows):
+                out[i] = M[r]
+        except ValueError:
+            for i in rows:
+                try:
+                    out[i] = encoders.encode(payloads[i][0], modality=modality)
+                except ValueError as e:
+                    out[i] = e
+    return out
+
+
+def _assign_many(payloads):
+    # payload: (embedding float32 بالبعد الصحيح، modality) -> assign_batch واحد (نفس نتيجة assign بالتتابع)
+    return pm.assign_batch(np.stack([p[0] for p in payloads]), [p[1] for p in payloads])
+
+
+encode_batcher = RequestBatcher(_encode_many, COALESCE_MAX_BATCH, COALESCE_MAX_WAIT_MS, name="EncodeBatcher")
+assign_batcher = RequestBatcher(_assign_many, COALESCE_MAX_BATCH, COALESCE_MAX_WAIT_MS, name="AssignBatcher")
 experts = ExpertRouter(logger=memory_logger)
-consolidation_worker = ConsolidationWorker(task_queue, logger=memory_logger)
+# job {"type": "proto_merge"} عبر /consolidation/trigger يشغّل دمج protos المتقاربة
+consolidation_worker = ConsolidationWorker(task_queue, logger=memory_logger, proto_merger=ProtoMerger(pm, cg))
 consolidation_worker.start()
 teacher = TeacherAPI(cg, pm, api_key=API_KEY)
 
@@ -120,12 +165,21 @@ def metrics():
     try:
         import psutil  # optional dependency for runtime metrics
     except Exception:
-        return {"cpu_percent": 0.0, "memory_percent": 0.0, "queue_len": task_queue.qsize()}
+        return {"cpu_percent": 0.0, "memory_percent": 0.0, "queue_len": task_queue.qsize(),
+                "search_cache": pm.search_cache.stats(), "concept_rank_cache": ranker.cache.stats(),
+                "embedding_cache": encoders.cache.stats(),
+                "encoder_pool": encoders.pool.stats() if encoders.pool is not None else None,
+                "request_batching": {"encode": encode_batcher.stats(), "assign": assign_batcher.stats()}}
 
     return {
         "cpu_percent": psutil.cpu_percent(),
         "memory_percent": psutil.virtual_memory().percent,
         "queue_len": task_queue.qsize(),
+        "search_cache": pm.search_cache.stats(),
+        "concept_rank_cache": ranker.cache.stats(),
+        "embedding_cache": encoders.cache.stats(),
+        "encoder_pool": encoders.pool.stats() if encoders.pool is not None else None,
+        "request_batching": {"encode": encode_batcher.stats(), "assign": assign_batcher.stats()},
     }
 
 # --------------------------------------------------
@@ -141,6 +195,33 @@ class AssignInput(BaseModel):
     modality: str
 
 
+class SearchInput(BaseModel):
+    embedding: list
+    k: int = 5
+    modality: Optional[str] = None  # None = بحث عابر لكل الـ modalities
+
+
+class SearchBatchInput(BaseModel):
+    embeddings: list
+    k: int = 5
+    modality: Optional[str] = None
+    min_sim: Optional[float] = None  # إن وُجد: range search بدل top-k
+
+
+class NearestConceptsInput(BaseModel):
+    embedding: list
+    k: int = 5
+    depth: int = 1
+    types: Optional[list] = None  # تصفية بالـ labels
+
+
+class RankConceptsInput(BaseModel):
+    seeds: list  # قائمة مجموعات بذور: [[concept_id, ...]] أو [{concept_id: وزن}]
+    method: str = "ppr"  # ppr | spread
+    k: int = 20
+    exclude_seeds: bool = False
+
+
 class DreamInput(BaseModel):
     concept_id: str
     T: int = 16
@@ -157,24 +238,100 @@ class TeachInput(BaseModel):
 # --------------------------------------------------
 @app.post("/encode")
 def encode(input: EncodeInput, api_key: str = Depends(get_api_key)):
-    arr = encoders.encode(input.input, modality=input.modality)
+    try:
+        arr = encode_batcher((input.input, input.modality))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # ensure numpy array -> list
     return {"embedding": arr.tolist()}
 
 
 @app.post("/assign")
 def assign(input: AssignInput, api_key: str = Depends(get_api_key)):
-    proto_id = pm.assign(np.array(input.embedding, dtype=np.float32), input.modality)
+    try:
+        vec = np.array(input.embedding, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="embedding must be a list of numbers")
+    if vec.shape != (pm.faiss.dim,):
+        raise HTTPException(status_code=400, detail=f"embedding must have dimension {pm.faiss.dim}")
+    proto_id = assign_batcher((vec, input.modality))
     return {"proto_id": proto_id}
 
 
+def _search_matrix(embeddings, k):
+    if not 1 <= k <= MAX_SEARCH_K:
+        raise HTTPException(status_code=400, detail=f"k must be in [1, {MAX_SEARCH_K}]")
+    if not embeddings or len(embeddings) > MAX_SEARCH_BATCH:
+        raise HTTPException(status_code=400, detail=f"batch size must be in [1, {MAX_SEARCH_BATCH}]")
+    try:
+        X = np.array(embeddings, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="embeddings must be a list of equal-length numeric vectors")
+    if X.ndim != 2 or X.shape[1] != pm.faiss.dim:
+        raise HTTPException(status_code=400, detail=f"embeddings must have dimension {pm.faiss.dim}")
+    return X
+
+
+@app.post("/search")
+def search(input: SearchInput, api_key: str = Depends(get_api_key)):
+    X = _search_matrix([input.embedding], input.k)
+    ids, sims = pm.search_batch(X, k=input.k, modality=input.modality)
+    return {"ids": ids[0], "sims": sims[0].tolist()}
+
+
+@app.post("/search/batch")
+def search_batch(input: SearchBatchInput, api_key: str = Depends(get_api_key)):
+    X = _search_matrix(input.embeddings, input.k)
+    if input.min_sim is not None:
+        if not -1.0 <= input.min_sim <= 1.0:
+            raise HTTPException(status_code=400, detail="min_sim must be in [-1, 1]")
+        # بلا حد: min_sim منخفض يعيد الفهرس كله لكل صف؛ أعلى MAX_SEARCH_K تشابهًا فقط
+        ids, sims = pm.range_search(X, input.min_sim, modality=input.modality, limit=MAX_SEARCH_K)
+    else:
+        ids, sims = pm.search_batch(X, k=input.k, modality=input.modality)
+    return {"results": [{"ids": i, "sims": s.tolist()} for i, s in zip(ids, sims)]}
+
+
 @app.get("/concept/{proto_id}")
 def get_concept(proto_id: str, api_key: str = Depends(get_api_key)):
-    # Get concept node for proto
-    for cid, data in cg.G.nodes(data=True):
-        if proto_id in data.get("proto_refs", []):
-            return {"concept_id": cid, **data}
-    raise HTTPException(status_code=404, detail="Not found")
+    # Get concept node for proto (reverse index, O(1))
+    cid = cg.concept_of(proto_id)
+    if cid is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return {"concept_id": cid, **cg.G.nodes[cid]}
+
+
+@app.post("/concepts/nearest")
+def nearest_concepts(input: NearestConceptsInput, api_key: str = Depends(get_api_key)):
+    # ANN على embeddings المفاهيم + توسيع k-hop في استدعاء واحد
+    X = _search_matrix([input.embedding], input.k)
+    if input.depth < 0:
+        raise HTTPException(status_code=400, detail="depth must be >= 0")
+    return {"results": cg.nearest(X[0], k=input.k, depth=input.depth, types=input.types)}
+
+
+def _valid_seed_set(seeds):
+    if isinstance(seeds, list):
+        return all(isinstance(cid, str) for cid in seeds)
+    if isinstance(seeds, dict):
+        return all(isinstance(cid, str) and isinstance(w, (int, float)) and not isinstance(w, bool)
+                   for cid, w in seeds.items())
+    return False
+
+
+@app.post("/concepts/rank")
+def rank_concepts(input: RankConceptsInput, api_key: str = Depends(get_api_key)):
+    # personalized PageRank أو spreading activation لعدة مجموعات بذور في استدعاء واحد
+    if input.method not in ("ppr", "spread"):
+        raise HTTPException(status_code=400, detail="method must be 'ppr' or 'spread'")
+    if not 1 <= input.k <= MAX_SEARCH_K:
+        raise HTTPException(status_code=400, detail=f"k must be in [1, {MAX_SEARCH_K}]")
+    if not input.seeds or len(input.seeds) > MAX_RANK_SEEDS:
+        raise HTTPException(status_code=400, detail=f"seed sets must be in [1, {MAX_RANK_SEEDS}]")
+    if not all(_valid_seed_set(seeds) for seeds in input.seeds):
+        raise HTTPException(status_code=400, detail="each seed set must be a list of concept ids or {concept_id: weight}")
+    rank = ranker.personalized_pagerank if input.method == "ppr" else ranker.spreading_activation
+    return {"results": rank(input.seeds, top_k=input.k, exclude_seeds=input.exclude_seeds)}
 
 
 @app.post("/expert/run")
@@ -254,16 +411,30 @@ def teach(input: TeachInput, request: Request, api_key: str = Depends(get_api_ke
 # Upload endpoint
 # --------------------------------------------------
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), api_key: str = Depends(get_api_key)):
-    contents = await file.read()
-    if len(contents) > MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=413, detail=f"File too large (>{MAX_UPLOAD_SIZE} bytes)")
+async def upload_file(file: UploadFile = File(...), encode: bool = False, modality: str = "auto",
+                      api_key: str = Depends(get_api_key)):
+    # يُكتب على القرص بقطع ثابتة (لا يُحمَّل الملف كاملًا في الذاكرة)؛ encode=true يعيد embedding الملف تدفقيًا
     os.makedirs("data/uploads", exist_ok=True)
     fname = f"data/uploads/{uuid.uuid4().hex}_{file.filename}"
+    size = 0
     with open(fname, "wb") as f:
-        f.write(contents)
-    safe_log_event("file_upload", {"file": fname, "size": len(contents)})
-    return {"saved_as": fname, "size": len(contents)}
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                break
+            f.write(chunk)
+    if size > MAX_UPLOAD_SIZE:
+        os.remove(fname)
+        raise HTTPException(status_code=413, detail=f"File too large (>{MAX_UPLOAD_SIZE} bytes)")
+    safe_log_event("file_upload", {"file": fname, "size": size})
+    result = {"saved_as": fname, "size": size}
+    if encode:
+        try:
+            vec = await run_in_threadpool(encoders.encode_file, fname, modality)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result["embedding"] = vec.tolist()
+    return result
 
 # --------------------------------------------------
 # Run server (only when executed directly)
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+
+
+class CentroidStore:
+    """
+    مصفوفة centroids متصلة مفهرسة بالـ row.
+    الجزء المحفوظ يُفتح بـ np.load(mmap_mode) فتتشارك العمليات صفحات الـ page cache،
+    والصفوف الجديدة تُلحق في ذيل بالذاكرة يتضاعف حجمه عند الحاجة.
+    التخزين float32 أو float16 (نصف الذاكرة)؛ القراءة دائمًا float32.
+    كل صف متوسط تراكمي غير مطبَّع لمتجهات أعضاء الـ proto.
+    """
+
+    def __init__(self, dim, dtype=np.float32):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._base = np.zeros((0, dim), dtype=self.dtype)
+        self._tail = np.zeros((1024, dim), dtype=self.dtype)
+        self._n_tail = 0
+        # أثناء checkpoint: row -> قيمته لحظة اللقطة، قبل أول تعديل بعدها
+        self._frozen = None
+        self._frozen_rows = 0
+
+    def __len__(self):
+        return len(self._base) + self._n_tail
+
+    def load(self, path):
+        # mmap_mode="c": copy-on-write، لا يُنسخ إلا ما يُعدَّل من الصفحات
+        base = np.load(path, mmap_mode="c")
+        if base.ndim != 2 or base.shape[1] != self.dim:
+            raise ValueError(f"Centroid file {path} has shape {base.shape}, expected (*, {self.dim})")
+        if base.dtype != self.dtype:
+            base = base.astype(self.dtype)
+        self._base = base
+        self._n_tail = 0
+
+    def get(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        nb = len(self._base)
+        if not len(rows) or rows.max() < nb:
+            return np.asarray(self._base[rows], dtype=np.float32)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        in_base = rows < nb
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._tail[rows[~in_base] - nb]
+        return out
+
+    def append(self, vecs):
+        vecs = np.atleast_2d(np.asarray(vecs, dtype=self.dtype))
+        need = self._n_tail + len(vecs)
+        if need > len(self._tail):
+            tail = np.zeros((max(need, 2 * len(self._tail)), self.dim), dtype=self.dtype)
+            tail[: self._n_tail] = self._tail[: self._n_tail]
+            self._tail = tail
+        first = len(self)
+        self._tail[self._n_tail:need] = vecs
+        self._n_tail = need
+        return np.arange(first, first + len(vecs))
+
+    def set(self, rows, vecs):
+        rows = np.asarray(rows, dtype=np.int64)
+        vecs = np.atleast_2d(np.asarray(vecs, dtype=self.dtype))
+        if self._frozen is not None:
+            for r in rows.tolist():
+                if r < self._frozen_rows and r not in self._frozen:
+                    self._frozen[r] = self.get([r])[0]
+        nb = len(self._base)
+        in_base = rows < nb
+        if in_base.any():
+            self._base[rows[in_base]] = vecs[in_base]
+        if not in_base.all():
+            self._tail[rows[~in_base] - nb] = vecs[~in_base]
+
+    def update_means(self, rows, vecs, counts):
+        """
+        تحديث المتوسط التراكمي دفعةً واحدة: rows قد تتكرر، و counts هي العدد
+        النهائي لكل صف بعد إضافة vecs (نفس القيمة لكل تكرار).
+        mean_new = (mean_old * (count - added) + sum(vecs)) / count
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+        counts = np.asarray(counts, dtype=np.float64)
+        uniq, first, inv = np.unique(rows, return_index=True, return_inverse=True)
+        sums = np.zeros((len(uniq), self.dim), dtype=np.float64)
+        np.add.at(sums, inv, vecs)
+        added = np.bincount(inv, minlength=len(uniq)).astype(np.float64)
+        total = counts[first]
+        prev = total - added
+        means = (self.get(uniq) * prev[:, None] + sums) / total[:, None]
+        self.set(uniq, means)
+
+    def put(self, row, vec):
+        # لإعادة تطبيق الـ WAL: الصف موجود (لقطة أحدث) أو هو التالي مباشرة
+        if row >= len(self):
+            self.append(np.zeros((row - len(self), self.dim), dtype=self.dtype))
+            self.append(vec)
+        else:
+            self.set([row], vec)
+
+    def freeze(self):
+        """
+        بداية لقطة (والقفل مأخوذ): الصفوف الموجودة الآن تُحفظ قيمتها القديمة
+        عند أول تعديل لها، فتكتب write() الصفوف كما كانت لحظة freeze.
+        """
+        self._frozen = {}
+        self._frozen_rows = len(self)
+
+    def thaw(self):
+        # نهاية اللقطة (والقفل مأخوذ): يعيد القيم القديمة للصفوف المعدلة
+        frozen, self._frozen = self._frozen, None
+        return frozen or {}
+
+    def write(self, path, n_rows, lock=None):
+        """
+        يكتب أول n_rows صفًا (لقطة الـ checkpoint) بدون أخذ القفل أثناء النسخ.
+        بعد freeze(): الصفوف التي عُدلت أثناء النسخ تُستبدل بقيمها لحظة اللقطة
+        (thaw تحت lock)، فلا تسبق الـ centroids المحفوظة الـ seq المحفوظ.
+        """
+        tmp = path + ".tmp.npy"
+        nb = min(n_rows, len(self._base))
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(n_rows, self.dim))
+        out[:nb] = self._base[:nb]
+        out[nb:] = self._tail[: n_rows - nb]
+        if self._frozen is not None:
+            if lock is not None:
+                with lock:
+                    frozen = self.thaw()
+            else:
+                frozen = self.thaw()
+            for r, vec in frozen.items():
+                if r < n_rows:
+                    out[r] = vec
+        out.flush()
+        del out
+        os.replace(tmp, path)
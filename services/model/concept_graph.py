@@ -1,74 +1,555 @@
+import gc
 import networkx as nx
 import os
 import json
+import logging
 import threading
 import time
-import tempfile
-import shutil
+import numpy as np
+from . import concept_snapshot
+from .csr_graph import CSRGraph, LIST_ATTRS, FLOAT_ATTRS
+from .faiss_store import FaissStore, normalize_rows
+from .proto_memory import encode_vec, decode_vec
+from .config import (
+    EMBED_DIM, CONCEPT_GRAPH_BACKEND, CONCEPT_JOURNAL_GROUP_SIZE, CONCEPT_JOURNAL_GROUP_WAIT,
+    CONCEPT_JOURNAL_FSYNC, CONCEPT_JOURNAL_COMPACT_EVERY, CONCEPT_SNAPSHOT_MMAP,
+)
+
+# مُرمِّز واحد مشترك (json.dumps بخيارات غير افتراضية ينشئ encoder جديدًا لكل سجل)
+_encode = json.JSONEncoder(ensure_ascii=False).encode
 
 class ConceptGraph:
-    def __init__(self, path="data/concept_graph.jsonl"):
+    """
+    الرسم محفوظ كسجل إلحاقي (journal) بدل إعادة كتابة الملف عند كل تعديل:
+      {"op": "node", "concept_id": ..., ...}   عقدة جديدة
+      {"op": "edge", "a": ..., "b": ..., "rel_type": ..., "weight": ...}
+      {"op": "refs", "concept_id": ..., "proto_refs": [...]}   بعد دمج protos
+      {"op": "nodes"|"edges", ...أعمدة}   سجل واحد لكل دفعة (link_batch / add_relations_batch)
+      {"op": "vecs", "concept_id": [...], "vec": [base64...]}   embeddings المفاهيم
+    السطور بدون op (الصيغة القديمة) تُقرأ كعقد. السجلات تُجمع وتُكتب دفعةً
+    واحدة (group commit). الضغط (في الخلفية) يكتب لقطة ثنائية (concept_graph.snap:
+    أعمدة العقد + CSR للحواف، انظر concept_snapshot) ويُبقي في الـ journal ما بعدها فقط؛
+    التحميل = اللقطة (mmap) ثم إعادة تشغيل الـ journal فوقها.
+    backend: "networkx" (افتراضي) أو "csr" (CSRGraph المضغوط لملايين المفاهيم).
+    embedding لكل مفهوم في فهرس FAISS مستقل بجانب الرسم (concept_graph.faiss.bin)
+    يُحفظ مع كل checkpoint؛ nearest() يجمع بحث ANN مع توسيع k-hop.
+    """
+
+    def __init__(self, path="data/concept_graph.jsonl", group_size=CONCEPT_JOURNAL_GROUP_SIZE,
+                 group_wait=CONCEPT_JOURNAL_GROUP_WAIT, fsync=CONCEPT_JOURNAL_FSYNC,
+                 compact_every=CONCEPT_JOURNAL_COMPACT_EVERY, backend=CONCEPT_GRAPH_BACKEND, dim=EMBED_DIM,
+                 mmap=CONCEPT_SNAPSHOT_MMAP):
         self.lock = threading.Lock()
         self.path = path
-        self.G = nx.Graph()
+        self.snapshot_file = os.path.splitext(path)[0] + ".snap"
+        self.mmap = mmap
+        self.G = CSRGraph() if backend == "csr" else nx.Graph()
+        self.vectors = FaissStore(dim, os.path.splitext(path)[0] + ".faiss.bin")
+        self.group_size = group_size
+        self.group_wait = group_wait
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.logger = logging.getLogger("ConceptGraph")
+        # فهارس عكسية: proto_id -> concept_id و label -> {concept_ids}
+        self._proto_index = {}
+        self._label_index = {}
+        self._journal = None
+        self._pending = []
+        self._timer = None
+        self._records = 0  # عدد السجلات في ملف الـ journal
+        self._compact_lock = threading.Lock()
+        self._compact_thread = None
+        # يرتفع مع كل تعديل لبنية الرسم (عقد/حواف)؛ كاش ConceptRanker يقارن به صلاحية نتائجه
+        self.generation = 0
         self._load()
 
     def _load(self):
-        if os.path.exists(self.path):
-            with open(self.path, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        node = json.loads(line)
-                        self.G.add_node(
-                            node["concept_id"],
-                            **{k: v for k, v in node.items() if k != "concept_id"}
-                        )
-                    except Exception:
-                        continue
+        # ملايين القوائم/القواميس الصغيرة تُنشأ ولا تُحرَّر: دورات GC الجيلية أثناء التحميل هدر
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if os.path.exists(self.snapshot_file):
+                self._load_snapshot()
+            if os.path.exists(self.path):
+                self._replay()
+            self._rebuild_indexes()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load_snapshot(self):
+        meta, arrays = concept_snapshot.read(self.snapshot_file, mmap=self.mmap)
+        ids, lists, floats, extras, csr, rel_types, n_edges = concept_snapshot.unpack_graph(meta, arrays)
+        if isinstance(self.G, CSRGraph):
+            self.G.load_arrays(ids, lists, floats, csr, rel_types, n_edges)
+        else:
+            nodes = []
+            for i, cid in enumerate(ids):
+                data = {k: lists[k][i] for k in LIST_ATTRS if lists[k][i] is not None}
+                for k in FLOAT_ATTRS:
+                    if not np.isnan(floats[k][i]):
+                        data[k] = float(floats[k][i])
+                nodes.append((cid, data))
+            self.G.add_nodes_from(nodes)
+            indptr, indices, weights, rels = csr
+            src = np.repeat(np.arange(len(ids)), np.diff(indptr))
+            keep = src <= indices
+            self.G.add_edges_from(
+                (ids[a], ids[b], {"rel_type": rel_types[c], "weight": w})
+                for a, b, w, c in zip(src[keep].tolist(), indices[keep].tolist(), weights[keep].tolist(),
+                                      rels[keep].tolist()))
+        for i, data in extras.items():
+            attrs = self.G.nodes[ids[i]]
+            for key, value in data.items():
+                attrs[key] = value
+
+    def _replay(self):
+        good = 0
+        edges = ([], [], [], [])  # تُضاف دفعةً واحدة بعد القراءة (آخر قيمة للحافة تفوز)
+        vecs = {}  # concept_id -> آخر embedding في الـ journal (قد يكون في الفهرس المحفوظ مسبقًا)
+        skipped, first_error = 0, None
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    rec = None
+                if rec is None or not line.endswith(b"\n"):
+                    # سجل مبتور من انقطاع أثناء الكتابة
+                    self.logger.warning("Truncated concept journal record dropped")
+                    break
+                good += len(line)
+                try:
+                    self._records += self._record_size(rec)
+                    self._apply(rec, edges, vecs)
+                except Exception as e:
+                    # سجل كامل لكن غير صالح: يُتخطى ويُبلَّغ عنه بدل ضياع العقد والحواف بصمت
+                    if first_error is None:
+                        first_error = f"offset {good - len(line)}: {type(e).__name__}: {e}"
+                    skipped += 1
+        if skipped:
+            self.logger.warning(f"Skipped {skipped} invalid concept journal records (first at {first_error})")
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        if edges[0]:
+            self._add_edges(*edges)
+        if vecs:
+            self._put_vectors(list(vecs), np.stack([decode_vec(v) for v in vecs.values()]))
+
+    def _rebuild_indexes(self):
+        # الفهارس العكسية بعد التحميل (أعمدة CSRGraph مباشرة بدل dict لكل عقدة)
+        if isinstance(self.G, CSRGraph):
+            lists = self.G._lists
+            items = zip(self.G._ids, lists["proto_refs"], lists["labels"])
+        else:
+            items = ((n, d.get("proto_refs"), d.get("labels")) for n, d in self.G.nodes(data=True))
+        proto_index, label_index = {}, {}
+        for concept_id, refs, labels in items:
+            for pid in refs or ():
+                proto_index.setdefault(pid, concept_id)
+            for label in labels or ():
+                label_index.setdefault(label, set()).add(concept_id)
+        self._proto_index, self._label_index = proto_index, label_index
+
+    @staticmethod
+    def _record_size(rec):
+        op = rec.get("op")
+        if op == "edges":
+            return len(rec["a"])
+        if op in ("nodes", "vecs"):
+            return len(rec["concept_id"])
+        return 1
+
+    def _apply(self, rec, edges, vecs):
+        op = rec.get("op", "node")
+        if op == "node":
+            self.G.add_node(rec["concept_id"], **{k: v for k, v in rec.items() if k not in ("op", "concept_id")})
+        elif op == "nodes":
+            shared = {k: rec[k] for k in ("confidence", "last_updated")}
+            for cid, refs, labels in zip(rec["concept_id"], rec["proto_refs"], rec["labels"]):
+                self.G.add_node(cid, labels=labels, proto_refs=refs, provenance=dict(rec["provenance"]), **shared)
+        elif op == "edge":
+            for col, v in zip(edges, (rec["a"], rec["b"], rec["rel_type"], rec["weight"])):
+                col.append(v)
+        elif op == "edges":
+            # كل الحقول تُقرأ قبل الإلحاق: سجل ناقص لا يترك الأعمدة بأطوال مختلفة
+            cols = [rec[key] for key in ("a", "b", "rel_type", "weight")]
+            if len(set(map(len, cols))) != 1:
+                raise ValueError("edges columns have different lengths")
+            for col, values in zip(edges, cols):
+                col.extend(values)
+        elif op == "vecs":
+            vecs.update(zip(rec["concept_id"], rec["vec"]))
+        elif op == "refs":
+            if rec["concept_id"] in self.G:
+                self.G.nodes[rec["concept_id"]]["proto_refs"] = rec["proto_refs"]
+
+    def _index_node(self, concept_id, data):
+        for pid in data.get("proto_refs", []):
+            self._proto_index.setdefault(pid, concept_id)
+        for label in data.get("labels", []):
+            self._label_index.setdefault(label, set()).add(concept_id)
+
+    # ---------------- journal ----------------
+    def _append(self, records):
+        # يُستدعى والقفل مأخوذ: السجلات تنتظر حتى تمتلئ الدفعة أو تمر group_wait
+        self._pending.extend(records)
+        if len(self._pending) >= self.group_size or self.group_wait <= 0:
+            self._commit()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.group_wait, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _commit(self):
+        # يُستدعى والقفل مأخوذ؛ كتابة واحدة لكل دفعة
+        if not self._pending:
+            return
+        if self._journal is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._journal = open(self.path, "a", encoding="utf-8")
+        self._journal.write("".join(_encode(r) + "\n" for r in self._pending))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._records += sum(self._record_size(r) for r in self._pending)
+        self._pending = []
+        live = self.G.number_of_nodes() + self.G.number_of_edges()
+        if self._records >= max(self.compact_every, 2 * live) and self._compact_thread is None:
+            self._compact_thread = threading.Thread(target=self._background_compact, daemon=True)
+            self._compact_thread.start()
+
+    def flush(self):
+        with self.lock:
+            self._timer = None
+            self._commit()
+
+    def _background_compact(self):
+        try:
+            self.checkpoint()
+        except Exception:
+            self.logger.exception("Background concept graph compaction failed")
+        finally:
+            self._compact_thread = None
+
+    def _snapshot_arrays(self):
+        # يُستدعى والقفل مأخوذ: أعمدة العقد (بنفس قواعد NodeAttrs) + CSR -> (arrays, meta)
+        G = self.G
+        if isinstance(G, CSRGraph):
+            n = len(G._ids)
+            ids = list(G._ids)
+            lists = {k: list(G._lists[k]) for k in LIST_ATTRS}
+            floats = {k: G._floats[k][:n].copy() for k in FLOAT_ATTRS}
+            extras = {i: e for i, e in G._extras.items() if e}
+        else:
+            ids = list(G.nodes())
+            n = len(ids)
+            lists = {k: [None] * n for k in LIST_ATTRS}
+            floats = {k: np.full(n, np.nan) for k in FLOAT_ATTRS}
+            extras = {}
+            for i, (_, data) in enumerate(G.nodes(data=True)):
+                for key, value in data.items():
+                    if key in FLOAT_ATTRS and isinstance(value, (int, float)):
+                        floats[key][i] = value
+                    elif key in LIST_ATTRS and value is not None:
+                        lists[key][i] = value
+                    else:
+                        extras.setdefault(i, {})[key] = value
+        _, indptr, indices, weights, rels, rel_types = self._csr_arrays()
+        return concept_snapshot.pack_graph(ids, lists, floats, extras, (indptr, indices, weights, rels), rel_types)
+
+    def _put_vectors(self, concept_ids, matrix):
+        # المفاهيم الموجودة في الفهرس تُستبدل متجهاتها (نفس int ids)، والجديدة تُضاف
+        known = [i for i, cid in enumerate(concept_ids) if cid in self.vectors.ids_map]
+        new = [i for i, cid in enumerate(concept_ids) if cid not in self.vectors.ids_map]
+        if known:
+            self.vectors.update_batch(matrix[known], [concept_ids[i] for i in known])
+        if new:
+            self.vectors.add_batch(matrix[new], [concept_ids[i] for i in new])
+
+    def _as_matrix(self, embeddings, n):
+        X = np.asarray(embeddings, dtype=np.float32).reshape(n, -1)
+        if X.shape[1] != self.vectors.dim:
+            raise ValueError(f"concept embedding must have dimension {self.vectors.dim}, got {X.shape[1]}")
+        return X
+
+    def _set_vectors(self, concept_ids, X):
+        # يُستدعى والقفل مأخوذ
+        self._put_vectors(concept_ids, X)
+        self._append([{"op": "vecs", "concept_id": list(concept_ids), "vec": [encode_vec(v) for v in X]}])
+
+    def _hops(self, node, depth):
+        if isinstance(self.G, CSRGraph):
+            return self.G.k_hop(node, cutoff=depth)
+        return nx.single_source_shortest_path_length(self.G, node, cutoff=depth)
+
+    def _labeled(self, types):
+        return set().union(*(self._label_index.get(t, ()) for t in types))
+
+    def _csr_arrays(self):
+        """
+        يُستدعى والقفل مأخوذ: الرسم بصيغة CSR متماثلة (الاتجاهان)
+        (concept_ids, indptr, indices, weights, rel codes, rel_types).
+        """
+        if isinstance(self.G, CSRGraph):
+            self.G.compact()
+            return (list(self.G._ids), self.G.indptr.copy(), self.G.indices.copy(), self.G.weights.copy(),
+                    self.G.rels.copy(), list(self.G.rel_types))
+        ids = list(self.G.nodes())
+        pos = {n: i for i, n in enumerate(ids)}
+        rel_types, codes = [None], {None: 0}
+        src, dst, w, code = [], [], [], []
+        for a, b, data in self.G.edges(data=True):
+            src.append(pos[a])
+            dst.append(pos[b])
+            w.append(data.get("weight", 1.0))
+            t = data.get("rel_type")
+            if t not in codes:
+                codes[t] = len(rel_types)
+                rel_types.append(t)
+            code.append(codes[t])
+        src, dst = np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+        w, code = np.array(w, dtype=np.float32), np.array(code, dtype=np.int64)
+        loops = src == dst
+        rows = np.concatenate([src, dst[~loops]])
+        cols = np.concatenate([dst, src[~loops]])
+        order = np.lexsort((cols, rows))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(ids)))]).astype(np.int64)
+        return (ids, indptr, cols[order].astype(np.int32), np.concatenate([w, w[~loops]])[order],
+                np.concatenate([code, code[~loops]])[order], rel_types)
+
+    def adjacency(self):
+        """
+        لقطة للمصفوفة المتجاورة الموزونة بصيغة CSR متماثلة (الاتجاهان):
+        (concept_ids, indptr, indices, weights, generation). تُستدعى دون القفل.
+        """
+        with self.lock:
+            ids, indptr, indices, weights, _, _ = self._csr_arrays()
+            return ids, indptr, indices, weights, self.generation
+
+    def _add_edges(self, us, vs, types, weights):
+        if isinstance(self.G, CSRGraph):
+            self.G.add_edges(us, vs, types, weights)
+        else:
+            self.G.add_edges_from((a, b, {"rel_type": t, "weight": w}) for a, b, t, w in zip(us, vs, types, weights))
+
+    # ---------------- API ----------------
+    def concept_of(self, proto_id):
+        # O(1): أول مفهوم يشير إلى الـ proto (نفس نتيجة المسح الخطي القديم)
+        return self._proto_index.get(proto_id)
+
+    def concepts_with_label(self, label):
+        return set(self._label_index.get(label, ()))
 
     def link(self, proto_id, embedding, labels=None, confidence=0.5, provenance=None):
+        # embedding (إن وُجد) يصبح متجه المفهوم الجديد؛ proto مرتبط مسبقًا يعيد مفهومه كما هو
+        X = None if embedding is None else self._as_matrix(embedding, 1)
         with self.lock:
-            for node, data in self.G.nodes(data=True):
-                if proto_id in data.get("proto_refs", []):
-                    data["last_updated"] = time.time()
-                    return node
+            node = self._proto_index.get(proto_id)
+            if node is not None:
+                self.G.nodes[node]["last_updated"] = time.time()
+                return node
             concept_id = f"c_{self.G.number_of_nodes():05d}"
             self.G.add_node(
                 concept_id,
-                proto_refs=[proto_id],
                 labels=labels or [],
+                proto_refs=[proto_id],
                 confidence=confidence,
                 provenance=provenance or {},
                 last_updated=time.time(),
             )
-            self._dump_all()  # تحديث كامل عند كل إضافة
+            self._index_node(concept_id, self.G.nodes[concept_id])
+            self._append([{"op": "node", "concept_id": concept_id, **self.G.nodes[concept_id]}])
+            self.generation += 1
+            if X is not None:
+                self._set_vectors([concept_id], X)
             return concept_id
 
     def add_relation(self, a, b, rel_type, weight=1.0):
         with self.lock:
             self.G.add_edge(a, b, rel_type=rel_type, weight=weight)
-            self._dump_all()
+            self._append([{"op": "edge", "a": a, "b": b, "rel_type": rel_type, "weight": weight}])
+            self.generation += 1
 
-    def query(self, node, depth=1, types=None):
+    def link_batch(self, proto_ids, labels=None, confidence=0.5, provenance=None, embeddings=None):
+        """
+        نسخة دفعية من link: قفل واحد وكتابة واحدة في الـ journal. الـ protos
+        الموجودة (أو المكررة داخل الدفعة) تعيد مفهومها عبر الفهرس العكسي.
+        labels: None أو قائمة labels لكل proto، و embeddings: None أو مصفوفة (N, dim)
+        لمتجهات المفاهيم الجديدة. يعيد concept_id لكل proto بالترتيب.
+        """
+        X = None if embeddings is None else self._as_matrix(embeddings, len(proto_ids))
+        new_rows = []
+        now = time.time()
+        provenance = provenance or {}
+        out = []
+        rec = {"op": "nodes", "concept_id": [], "proto_refs": [], "labels": [],
+               "confidence": confidence, "provenance": provenance, "last_updated": now}
+        with self.lock:
+            for i, proto_id in enumerate(proto_ids):
+                node = self._proto_index.get(proto_id)
+                if node is None:
+                    node = f"c_{self.G.number_of_nodes():05d}"
+                    node_labels = list(labels[i] or []) if labels is not None else []
+                    # نسخة لكل عقدة: في networkx تُخزن القيمة نفسها، فالمشاركة تربط تعديلاتها
+                    self.G.add_node(node, labels=node_labels, proto_refs=[proto_id], confidence=confidence,
+                                    provenance=dict(provenance), last_updated=now)
+                    self._proto_index[proto_id] = node
+                    for label in node_labels:
+                        self._label_index.setdefault(label, set()).add(node)
+                    rec["concept_id"].append(node)
+                    rec["proto_refs"].append([proto_id])
+                    rec["labels"].append(node_labels)
+                    new_rows.append(i)
+                else:
+                    self.G.nodes[node]["last_updated"] = now
+                out.append(node)
+            if rec["concept_id"]:
+                self._append([rec])
+                self.generation += 1
+            if X is not None and new_rows:
+                self._set_vectors(rec["concept_id"], X[new_rows])
+        return out
+
+    def set_embeddings(self, concept_ids, embeddings):
+        # متجهات صريحة لمفاهيم موجودة (تستبدل السابقة)
+        X = self._as_matrix(embeddings, len(concept_ids))
+        with self.lock:
+            missing = [cid for cid in concept_ids if cid not in self.G]
+            if missing:
+                raise KeyError(f"Unknown concepts: {missing[:5]}")
+            self._set_vectors(list(concept_ids), X)
+
+    def embed_from_protos(self, pm, concept_ids=None):
+        """
+        embedding المفهوم = متوسط centroids (المطبَّعة) لـ protos أعضائه في ProtoMemory.
+        concept_ids=None = كل المفاهيم. يعيد عدد المفاهيم المحدَّثة.
+        """
+        with self.lock:
+            items = [(cid, list(self.G.nodes[cid].get("proto_refs", [])))
+                     for cid in (self.G.nodes() if concept_ids is None else concept_ids) if cid in self.G]
+        ids, vecs = [], []
+        for cid, refs in items:
+            rows = [r for r in (pm.protos.row_of(pid) for pid in refs) if r is not None]
+            if rows:
+                ids.append(cid)
+                vecs.append(normalize_rows(pm.centroids.get(rows)).mean(axis=0))
+        if ids:
+            self.set_embeddings(ids, np.stack(vecs))
+        return len(ids)
+
+    def nearest(self, embedding, k=5, depth=1, types=None):
+        """
+        أقرب k مفاهيم بالـ embedding (ANN) ثم توسيع k-hop حول كل منها في استدعاء واحد.
+        كل نتيجة: similarity (تشابه أقرب بذرة وصلت إليها)، distance (عدد القفزات منها)، via (البذرة).
+        الترتيب: similarity تنازليًا ثم distance. types: تصفية بالـ labels.
+        """
+        X = self._as_matrix(embedding, 1)
+        ids, D = self.vectors.search_batch(X, k)
         with self.lock:
-            neighbors = nx.single_source_shortest_path_length(self.G, node, cutoff=depth)
-            result = []
-            for n in neighbors:
-                data = self.G.nodes[n]
-                if not types or any(t in data.get("labels", []) for t in types):
-                    result.append({"concept_id": n, **data})
-            return result
-
-    def _dump_all(self):
+            best = {}
+            for seed, sim in zip(ids[0], D[0].tolist()):
+                if seed is None or seed not in self.G:
+                    continue
+                for n, dist in self._hops(seed, depth).items():
+                    cur = best.get(n)
+                    if cur is None or (sim, -dist) > (cur[0], -cur[1]):
+                        best[n] = (sim, dist, seed)
+            names = list(best)
+            if types:
+                labeled = self._labeled(types)
+                names = [n for n in names if n in labeled]
+            names.sort(key=lambda n: (-best[n][0], best[n][1]))
+            return [{"concept_id": n, "similarity": best[n][0], "distance": best[n][1], "via": best[n][2],
+                     **self.G.nodes[n]} for n in names]
+
+    def add_relations_batch(self, relations):
+        """
+        relations: (a, b, rel_type) أو (a, b, rel_type, weight). قفل واحد وكتابة
+        واحدة (سجل "edges" واحد)؛ مع backend=csr تُدمج الحواف مباشرة في CSR.
+        يعيد عدد العلاقات.
+        """
+        relations = list(relations)
+        us = [rel[0] for rel in relations]
+        vs = [rel[1] for rel in relations]
+        types = [rel[2] for rel in relations]
+        weights = [float(rel[3]) if len(rel) > 3 else 1.0 for rel in relations]
+        if not us:
+            return 0
+        with self.lock:
+            self._add_edges(us, vs, types, weights)
+            self._append([{"op": "edges", "a": us, "b": vs, "rel_type": types, "weight": weights}])
+            self.generation += 1
+        return len(us)
+
+    def remap_protos(self, mapping):
+        """
+        يستبدل proto_refs حسب {proto_id قديم: proto_id جديد} (بعد دمج protos)
+        مع إزالة التكرار والحفاظ على الترتيب. يعيد عدد المفاهيم المعدلة.
+        """
+        if not mapping:
+            return 0
+        records = []
+        with self.lock:
+            for node, data in self.G.nodes(data=True):
+                refs = data.get("proto_refs", [])
+                if any(r in mapping for r in refs):
+                    data["proto_refs"] = list(dict.fromkeys(mapping.get(r, r) for r in refs))
+                    data["last_updated"] = time.time()
+                    records.append({"op": "refs", "concept_id": node, "proto_refs": data["proto_refs"]})
+            for old, new in mapping.items():
+                concept = self._proto_index.pop(old, None)
+                if concept is not None:
+                    self._proto_index.setdefault(new, concept)
+            self._append(records)
+        return len(records)
+
+    def query(self, node, depth=1, types=None):
         with self.lock:
-            tmp = self.path + ".tmp"
-            with open(tmp, "w", encoding="utf-8") as f:
-                for node in self.G.nodes():
-                    data = self.G.nodes[node]
-                    obj = {"concept_id": node, **data}
-                    f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-            os.replace(tmp, self.path)
+            neighbors = self._hops(node, depth)
+            if types:
+                labeled = self._labeled(types)
+                neighbors = [n for n in neighbors if n in labeled]
+            return [{"concept_id": n, **self.G.nodes[n]} for n in neighbors]
 
     def checkpoint(self):
-        # explicit call
-        self._dump_all()
\ No newline at end of file
+        """
+        لقطة ثنائية (عقد + حواف) وحفظ فهرس المتجهات: النسخ تحت القفل، الكتابة بدونه،
+        ثم يُستبدل الـ journal بالسجلات التي وصلت أثناء الكتابة فقط.
+        """
+        with self._compact_lock:
+            with self.lock:
+                self._commit()
+                if self._journal is not None:
+                    pos = self._journal.tell()
+                else:
+                    pos = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                arrays, meta = self._snapshot_arrays()
+                index = self.vectors.snapshot()
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            # الفهرس ثم اللقطة قبل قص الـ journal: انقطاع بينهما يعيد تشغيل الـ journal كاملًا فوق اللقطة
+            self.vectors.write_snapshot(index)
+            concept_snapshot.write(self.snapshot_file, arrays, meta)
+            with self.lock:
+                self._commit()
+                tail = b""
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                if os.path.exists(self.path):
+                    with open(self.path, "rb") as src:
+                        src.seek(pos)
+                        tail = src.read()
+                tmp = self.path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self._records = tail.count(b"\n")
@@ -0,0 +1,158 @@
+import logging
+import threading
+import numpy as np
+from .search_cache import SearchCache
+from .config import (
+    CONCEPT_PPR_ALPHA, CONCEPT_PPR_TOL, CONCEPT_PPR_MAX_ITER, CONCEPT_SPREAD_STEPS, CONCEPT_SPREAD_DECAY,
+    CONCEPT_RANK_CACHE_SIZE, CONCEPT_RANK_CACHE_TTL, CONCEPT_RANK_MEM_BYTES,
+)
+
+
+class ConceptRanker:
+    """
+    تحليلات ترتيب فوق ConceptGraph: personalized PageRank و spreading activation
+    من مجموعات بذور، كضرب مصفوفة متناثرة (CSR بالـ weight) في كتلة متجهات
+    (صف لكل مجموعة بذور) بـ NumPy. المصفوفة تُبنى مرة لكل generation للرسم،
+    والنتائج مخزنة في كاش يُبطَل مع أي تعديل للرسم.
+    الذاكرة محدودة بـ mem_bytes: مجموعات البذور تُحسب في كتل صفوف، وجمع الجيران
+    في كتل حواف، فلا تتناسب الذاكرة مع (عدد المجموعات × عدد الحواف).
+    """
+
+    # مصفوفات (B, n) الحية أثناء تكرار PPR: S و P (float64) و nxt و Pa و Sa و Y، و X بـ float32
+    DENSE_BYTES_PER_CELL = 6 * 8 + 4
+
+    def __init__(self, cg, cache_size=CONCEPT_RANK_CACHE_SIZE, cache_ttl=CONCEPT_RANK_CACHE_TTL,
+                 mem_bytes=CONCEPT_RANK_MEM_BYTES):
+        self.cg = cg
+        self.mem_bytes = mem_bytes
+        self.cache = SearchCache(cache_size, cache_ttl)
+        self.logger = logging.getLogger("ConceptRanker")
+        self._lock = threading.Lock()
+        self._matrix = None
+
+    # ---------------- matrix ----------------
+    def _adjacency(self):
+        # (ids, pos, indptr, indices, weights, deg, nonempty, generation) للـ generation الحالية
+        with self._lock:
+            m = self._matrix
+            if m is None or m[-1] != self.cg.generation:
+                ids, indptr, indices, w, gen = self.cg.adjacency()
+                w = np.maximum(w, 0.0).astype(np.float32)  # أوزان سالبة لا معنى لها في مسار عشوائي
+                indices = indices.astype(np.intp)
+                deg = np.zeros(len(ids))
+                nonempty = indptr[:-1] < indptr[1:]
+                if len(w):
+                    deg[nonempty] = np.add.reduceat(w.astype(np.float64), indptr[:-1][nonempty])
+                m = (ids, {n: i for i, n in enumerate(ids)}, indptr, indices, w, deg, nonempty, gen)
+                self._matrix = m
+            return m
+
+    def _matvec(self, indptr, indices, w, nonempty, X):
+        """
+        Y = (W @ X.T).T لكتلة (B, n) float32: np.take لقيم الجيران، ضرب بالأوزان، ثم جمع
+        مقاطع الصفوف بـ reduceat. الحواف تُعالج في كتل عقد متتالية لا يتجاوز مؤقتها
+        (B, حواف الكتلة) float32 ميزانية mem_bytes (عقدة درجتها أكبر تُعالج وحدها).
+        """
+        Y = np.zeros(X.shape, dtype=np.float64)
+        n = X.shape[1]
+        step = max(1, self.mem_bytes // (4 * max(X.shape[0], 1)))
+        r0 = 0
+        while r0 < n and len(indices):
+            r1 = min(n, max(r0 + 1, int(np.searchsorted(indptr, indptr[r0] + step, side="right")) - 1))
+            lo, hi = indptr[r0], indptr[r1]
+            if hi > lo:
+                rows = np.flatnonzero(nonempty[r0:r1])
+                contrib = np.take(X, indices[lo:hi], axis=1)
+                contrib *= w[lo:hi]
+                Y[:, r0 + rows] = np.add.reduceat(contrib, indptr[r0:r1][rows] - lo, axis=1)
+            r0 = r1
+        return Y
+
+    def _seed_matrix(self, seed_sets, pos, n):
+        # صف لكل مجموعة (B, n): قائمة concept_ids (أوزان متساوية) أو {concept_id: وزن}؛ مجموع الصف = 1
+        S = np.zeros((len(seed_sets), n))
+        for j, seeds in enumerate(seed_sets):
+            items = seeds.items() if isinstance(seeds, dict) else ((s, 1.0) for s in seeds)
+            for cid, weight in items:
+                i = pos.get(cid)
+                if i is not None:
+                    S[j, i] += weight
+        total = S.sum(axis=1)
+        S[total > 0] /= total[total > 0, None]
+        return S
+
+    @staticmethod
+    def _seed_key(seeds):
+        items = seeds.items() if isinstance(seeds, dict) else ((s, 1.0) for s in seeds)
+        merged = {}
+        for cid, weight in items:
+            merged[cid] = merged.get(cid, 0.0) + float(weight)
+        return tuple(sorted(merged.items()))
+
+    # ---------------- algorithms ----------------
+    def _ppr(self, m, S, alpha, tol, max_iter):
+        """
+        p = (1 - alpha) s + alpha * W D^-1 p (الرسم غير موجّه: P^T p = W (p / deg)).
+        كتلة العقد بلا حواف (dangling) تعود إلى البذور.
+        كل مجموعة بذور تتوقف عند تقاربها (L1 < tol) فتصغر الكتلة في التكرارات التالية.
+        """
+        ids, pos, indptr, indices, w, deg, nonempty, gen = m
+        dangling = deg == 0
+        inv = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, deg))
+        P = S.copy()
+        active = np.arange(len(S))
+        for _ in range(max_iter):
+            if not len(active):
+                break
+            Pa, Sa = P[active], S[active]
+            nxt = alpha * self._matvec(indptr, indices, w, nonempty, np.multiply(Pa, inv, dtype=np.float32))
+            nxt += (1 - alpha + alpha * Pa[:, dangling].sum(axis=1))[:, None] * Sa
+            delta = np.abs(nxt - Pa).sum(axis=1)
+            P[active] = nxt
+            active = active[delta >= tol]
+        return P
+
+    def _spread(self, m, S, steps, decay):
+        # تنشيط محدود: a = sum_{t<=steps} decay^t (W D^-1)^t s
+        ids, pos, indptr, indices, w, deg, nonempty, gen = m
+        inv = np.where(deg > 0, 1.0 / np.where(deg > 0, deg, 1.0), 0.0)
+        A, act = S.copy(), S.copy()
+        for _ in range(steps):
+            act = decay * self._matvec(indptr, indices, w, nonempty, np.multiply(act, inv, dtype=np.float32))
+            A += act
+        return A
+
+    def _rank(self, method, params, seed_sets, top_k, exclude_seeds):
+        m = self._adjacency()
+        ids, pos, gen = m[0], m[1], m[-1]
+        keys = [(method, params, self._seed_key(s), top_k, exclude_seeds) for s in seed_sets]
+        results = [self.cache.get(k, gen) if self.cache.enabled else None for k in keys]
+        todo = [j for j, r in enumerate(results) if r is None]
+        # كتل من مجموعات البذور بحيث تبقى المصفوفات الكثيفة (B, n) ضمن mem_bytes
+        block = max(1, self.mem_bytes // (self.DENSE_BYTES_PER_CELL * max(len(ids), 1)))
+        for start in range(0, len(todo), block):
+            chunk = todo[start:start + block]
+            S = self._seed_matrix([seed_sets[j] for j in chunk], pos, len(ids))
+            scores = self._ppr(m, S, *params) if method == "ppr" else self._spread(m, S, *params)
+            for col, j in enumerate(chunk):
+                col_scores = scores[col]
+                if exclude_seeds:
+                    col_scores = np.where(S[col] > 0, 0.0, col_scores)
+                top = np.argsort(-col_scores, kind="stable")[:top_k]
+                top = top[col_scores[top] > 0]
+                results[j] = [{"concept_id": ids[i], "score": float(col_scores[i])} for i in top.tolist()]
+                if self.cache.enabled:
+                    self.cache.put(keys[j], gen, results[j])
+        return results
+
+    def personalized_pagerank(self, seed_sets, top_k=20, alpha=CONCEPT_PPR_ALPHA, tol=CONCEPT_PPR_TOL,
+                              max_iter=CONCEPT_PPR_MAX_ITER, exclude_seeds=False):
+        """
+        seed_sets: قائمة مجموعات بذور (كل مجموعة قائمة concept_ids أو {concept_id: وزن})
+        تُحسب معًا كصفوف كتلة واحدة. يعيد لكل مجموعة أفضل top_k [{concept_id, score}].
+        """
+        return self._rank("ppr", (alpha, tol, max_iter), seed_sets, top_k, exclude_seeds)
+
+    def spreading_activation(self, seed_sets, top_k=20, steps=CONCEPT_SPREAD_STEPS, decay=CONCEPT_SPREAD_DECAY,
+                             exclude_seeds=False):
+        return self._rank("spread", (steps, decay), seed_sets, top_k, exclude_seeds)
@@ -0,0 +1,162 @@
+import json
+import os
+import numpy as np
+
+# لقطة ConceptGraph الثنائية: MAGIC + طول الترويسة (uint64) + ترويسة JSON ثم مصفوفات
+# خام بمحاذاة 64 بايت تُقرأ بـ np.memmap (بدون تحليل سطر بسطر)
+MAGIC = b"OMCGSNP1"
+VERSION = 1
+ALIGN = 64
+
+# بتات attr_mask: أي أعمدة القوائم موجودة لكل عقدة (عقدة أنشأتها add_relation فقط بلا خصائص)؛
+# confidence/last_updated مصفوفات float بـ NaN للغائب
+HAS_LABELS, HAS_PROTO_REFS, HAS_PROVENANCE = 1, 2, 4
+
+
+def pack_strings(strings):
+    # قائمة نصوص -> مصفوفة uint8 (utf-8 مفصولة بـ \0)؛ فك الحزمة split واحد بدل حلقة
+    joined = "\0".join(strings)
+    if joined.count("\0") != max(len(strings) - 1, 0):
+        raise ValueError("snapshot strings must not contain NUL characters")
+    return np.frombuffer(joined.encode("utf-8"), dtype=np.uint8)
+
+
+def unpack_strings(blob, count):
+    if not count:
+        return []
+    return bytes(blob).decode("utf-8").split("\0")
+
+
+def write(path, arrays, meta):
+    """
+    كتابة ذرية (tmp ثم replace). arrays: {name: ndarray}، meta: قيم JSON إضافية في الترويسة.
+    """
+    table, offset = {}, 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        table[name] = [arr.dtype.str, list(arr.shape), offset]
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"version": VERSION, "arrays": table, **meta}, ensure_ascii=False).encode("utf-8")
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(start + table[name][2])
+            f.write(arr.tobytes())
+        f.truncate(start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read(path, mmap=True):
+    """
+    يعيد (meta, arrays). mmap=True: المصفوفات np.memmap بوضع copy-on-write
+    (تتشارك العمليات صفحات الـ page cache، والكتابة تنسخ الصفحة فقط).
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a ConceptGraph snapshot")
+        size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        meta = json.loads(f.read(size).decode("utf-8"))
+        if meta.get("version") != VERSION:
+            raise ValueError(f"Unsupported ConceptGraph snapshot version: {meta.get('version')}")
+        start = -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+        arrays = {}
+        for name, (dtype, shape, offset) in meta.pop("arrays").items():
+            count = int(np.prod(shape))
+            if not count:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="c", offset=start + offset, shape=tuple(shape))
+            else:
+                f.seek(start + offset)
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+    return meta, arrays
+
+
+def pack_graph(ids, lists, floats, extras, csr, rel_types):
+    """
+    أعمدة الرسم -> (arrays, meta) لـ write.
+    ids: concept_ids، lists: {labels|proto_refs|provenance: قيمة لكل عقدة أو None}،
+    floats: {confidence|last_updated: مصفوفة}، extras: {idx: {key: value}} لبقية الخصائص،
+    csr: (indptr, indices, weights, rels) متماثلة، rel_types: code -> rel_type.
+    labels مُختزنة كرموز في قاموس واحد؛ القيم بغير الصيغة المعتادة تذهب إلى extras (JSON).
+    """
+    extras = {i: dict(e) for i, e in extras.items()}
+    mask = []
+    vocab, label_idx, label_ptr = {}, [], [0]
+    refs, ref_ptr = [], [0]
+    for i, (labels, proto_refs, provenance) in enumerate(zip(lists["labels"], lists["proto_refs"],
+                                                             lists["provenance"])):
+        m = 0
+        if labels is not None:
+            if isinstance(labels, list) and all(isinstance(x, str) for x in labels):
+                m |= HAS_LABELS
+                label_idx.extend([vocab.setdefault(x, len(vocab)) for x in labels])
+            else:
+                extras.setdefault(i, {})["labels"] = labels
+        if proto_refs is not None:
+            if isinstance(proto_refs, list) and all(isinstance(x, str) for x in proto_refs):
+                m |= HAS_PROTO_REFS
+                refs.extend(proto_refs)
+            else:
+                extras.setdefault(i, {})["proto_refs"] = proto_refs
+        if provenance is not None:
+            if provenance == {}:
+                m |= HAS_PROVENANCE
+            else:
+                extras.setdefault(i, {})["provenance"] = provenance
+        mask.append(m)
+        label_ptr.append(len(label_idx))
+        ref_ptr.append(len(refs))
+    indptr, indices, weights, rels = csr
+    loops = int(np.count_nonzero(np.repeat(np.arange(len(ids)), np.diff(indptr)) == indices))
+    arrays = {
+        "node_ids": pack_strings(ids),
+        "attr_mask": np.array(mask, dtype=np.uint8),
+        "label_vocab": pack_strings(list(vocab)),
+        "label_ptr": np.array(label_ptr, dtype=np.int64),
+        "label_idx": np.array(label_idx, dtype=np.int32),
+        "proto_refs": pack_strings(refs),
+        "ref_ptr": np.array(ref_ptr, dtype=np.int64),
+        "confidence": np.asarray(floats["confidence"], dtype=np.float64),
+        "last_updated": np.asarray(floats["last_updated"], dtype=np.float64),
+        "extras": np.frombuffer(json.dumps({str(i): e for i, e in extras.items()},
+                                           ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+        "indptr": np.asarray(indptr, dtype=np.int64),
+        "indices": np.asarray(indices, dtype=np.int32),
+        "weights": np.asarray(weights, dtype=np.float32),
+        "rels": np.asarray(rels, dtype=np.uint8 if len(rel_types) <= 256 else np.uint16),
+    }
+    meta = {"nodes": len(ids), "edges": (len(indices) + loops) // 2, "labels": len(vocab),
+            "proto_refs": len(refs), "rel_types": list(rel_types)}
+    return arrays, meta
+
+
+def unpack_graph(meta, arrays):
+    """
+    عكس pack_graph: (ids, lists, floats, extras, csr, rel_types, n_edges).
+    مصفوفات CSR تبقى كما قُرئت (np.memmap عند mmap=True).
+    """
+    n = meta["nodes"]
+    ids = unpack_strings(arrays["node_ids"], n)
+    mask = arrays["attr_mask"].tolist()
+    vocab = np.array(unpack_strings(arrays["label_vocab"], meta["labels"]), dtype=object)
+    flat = vocab[arrays["label_idx"]].tolist()
+    ptr = arrays["label_ptr"].tolist()
+    labels = [flat[ptr[i]:ptr[i + 1]] if m & HAS_LABELS else None for i, m in enumerate(mask)]
+    flat = unpack_strings(arrays["proto_refs"], meta["proto_refs"])
+    ptr = arrays["ref_ptr"].tolist()
+    proto_refs = [flat[ptr[i]:ptr[i + 1]] if m & HAS_PROTO_REFS else None for i, m in enumerate(mask)]
+    provenance = [{} if m & HAS_PROVENANCE else None for m in mask]
+    lists = {"labels": labels, "proto_refs": proto_refs, "provenance": provenance}
+    floats = {"confidence": np.array(arrays["confidence"]), "last_updated": np.array(arrays["last_updated"])}
+    blob = bytes(arrays["extras"]).decode("utf-8")
+    extras = {int(i): e for i, e in json.loads(blob).items()} if blob else {}
+    csr = (arrays["indptr"], arrays["indices"], arrays["weights"], arrays["rels"])
+    return ids, lists, floats, extras, csr, meta["rel_types"], meta["edges"]
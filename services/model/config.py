@@ -1,4 +1,91 @@
+import os
+
 EMBED_DIM = 384
 FAISS_INDEX_FILE = "data/faiss_index.bin"
 PROTO_META_FILE = "data/protos.jsonl"
-FAISS_THRESHOLD = 0.75
\ No newline at end of file
+FAISS_THRESHOLD = 0.75
+
+# نوع فهرس FAISS: flat | sq8 | fp16 | pq | ivf_flat | ivf_pq | hnsw
+# يبدأ الفهرس دائمًا flat ثم يُرحَّل تلقائيًا عند تجاوز FAISS_MIGRATE_AT
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_MIGRATE_AT = int(os.getenv("FAISS_MIGRATE_AT", 200000))
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", 0))  # 0 = تلقائي (~4*sqrt(ntotal))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 48))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+# مفاتيح ضبط البحث
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+# تحميل الفهرس بـ mmap (للعمليات التي تقرأ غالبًا)؛ يُنسخ إلى الذاكرة عند أول كتابة
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+
+# سجل الكتابة المسبقة (WAL) لـ ProtoMemory
+PROTO_WAL_COMPACT_EVERY = int(os.getenv("PROTO_WAL_COMPACT_EVERY", 50000))  # checkpoint خلفي بعد N حدث
+PROTO_WAL_FSYNC = os.getenv("PROTO_WAL_FSYNC", "0") == "1"
+
+# centroids: float32 أو float16 (نصف الذاكرة)، ومزامنة متجهات FAISS كل N تحديث للمتوسط
+PROTO_CENTROID_DTYPE = os.getenv("PROTO_CENTROID_DTYPE", "float32")
+CENTROID_SYNC_EVERY = int(os.getenv("CENTROID_SYNC_EVERY", 4096))
+
+# الفهارس المضغوطة (sq8/fp16/pq/ivf_pq): أفضل N مرشح يُعاد ترتيبها بالتشابه الدقيق مع centroids (0 = تعطيل)
+FAISS_RERANK = int(os.getenv("FAISS_RERANK", 16))
+
+# فهرس FAISS لكل modality؛ 1 = assign يطابق protos من أي modality (السلوك القديم)
+PROTO_CROSS_MODAL = os.getenv("PROTO_CROSS_MODAL", "0") == "1"
+# الـ modalities المعروفة (partition لكل منها)؛ أي modality أخرى تذهب إلى partition "other"
+PROTO_MODALITIES = [m.strip() for m in os.getenv("PROTO_MODALITIES", "text,image,audio").split(",") if m.strip()]
+
+# كاش نتائج البحث (LRU + TTL بالثواني) أمام FAISS؛ SEARCH_CACHE_SIZE=0 يعطله
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 100000))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 300))
+
+# كاش embeddings بالمحتوى أمام MultiModalEncoders: ميزانية الذاكرة بالبايت (0 = تعطيل)، ومجلد الطبقة
+# الثانية على القرص (فارغ = بدون قرص). ENCODER_VERSION (أوزان/نموذج جديد) جزء من مفتاح الكاش
+EMBED_CACHE_BYTES = int(os.getenv("EMBED_CACHE_BYTES", 64 * 2**20))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")
+ENCODER_VERSION = os.getenv("ENCODER_VERSION", "stub-1")
+
+# ترميز الملفات الكبيرة تدفقيًا (encode_file): حجم النافذة بالبايت، وعدد النوافذ لكل استدعاء للمُرمِّز
+# (الذاكرة القصوى ~ النافذة × الدفعة مهما كان حجم الملف)
+ENCODE_WINDOW_BYTES = int(os.getenv("ENCODE_WINDOW_BYTES", 1 << 20))
+ENCODE_STREAM_BATCH = int(os.getenv("ENCODE_STREAM_BATCH", 8))
+
+# أين يعمل المُرمِّز: inprocess (افتراضي، للاختبارات والـ stubs) | process (EncoderPool: عمليات منفصلة
+# خارج الـ GIL)؛ عدد العمليات، وحدود الـ micro-batch (عناصر، وأقصى انتظار بالميلي ثانية)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "inprocess")
+ENCODER_WORKERS = int(os.getenv("ENCODER_WORKERS", 2))
+ENCODER_MAX_BATCH = int(os.getenv("ENCODER_MAX_BATCH", 64))
+ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", 2.0))
+
+# دمج protos المتقاربة (مهمة proto_merge): عتبة الدمج، جيران kNN لكل proto،
+# حجم دفعة المسح، توقف بين الدفعات (ثوانٍ)، وعدد العناقيد لكل أخذ لقفل ProtoMemory
+PROTO_MERGE_THRESHOLD = float(os.getenv("PROTO_MERGE_THRESHOLD", 0.92))
+PROTO_MERGE_K = int(os.getenv("PROTO_MERGE_K", 8))
+PROTO_MERGE_CHUNK = int(os.getenv("PROTO_MERGE_CHUNK", 1024))
+PROTO_MERGE_PAUSE = float(os.getenv("PROTO_MERGE_PAUSE", 0.05))
+PROTO_MERGE_APPLY_BATCH = int(os.getenv("PROTO_MERGE_APPLY_BATCH", 64))
+
+# سجل ConceptGraph الإلحاقي: عدد السجلات لكل group commit، أقصى انتظار قبل الكتابة (ثوانٍ، 0 = فوري)،
+# fsync لكل دفعة، وضغط خلفي إلى لقطة بعد N سجل (أو عند تجاوز ضعف حجم الرسم)
+CONCEPT_JOURNAL_GROUP_SIZE = int(os.getenv("CONCEPT_JOURNAL_GROUP_SIZE", 256))
+CONCEPT_JOURNAL_GROUP_WAIT = float(os.getenv("CONCEPT_JOURNAL_GROUP_WAIT", 0.05))
+CONCEPT_JOURNAL_FSYNC = os.getenv("CONCEPT_JOURNAL_FSYNC", "0") == "1"
+CONCEPT_JOURNAL_COMPACT_EVERY = int(os.getenv("CONCEPT_JOURNAL_COMPACT_EVERY", 100000))
+# تحميل لقطة ConceptGraph الثنائية بـ mmap (copy-on-write) بدل قراءتها كاملة
+CONCEPT_SNAPSHOT_MMAP = os.getenv("CONCEPT_SNAPSHOT_MMAP", "1") == "1"
+
+# تخزين ConceptGraph في الذاكرة: networkx | csr (مصفوفات CSR مضغوطة + BFS متجه)،
+# وعدد الحواف في الـ delta buffer قبل دمجها في CSR
+CONCEPT_GRAPH_BACKEND = os.getenv("CONCEPT_GRAPH_BACKEND", "networkx")
+CONCEPT_CSR_DELTA_MAX = int(os.getenv("CONCEPT_CSR_DELTA_MAX", 65536))
+
+# ترتيب المفاهيم (ConceptRanker): personalized PageRank (damping، التقارب، أقصى تكرارات)،
+# spreading activation (عدد الخطوات والاضمحلال)، وكاش النتائج حتى يتغير الرسم
+CONCEPT_PPR_ALPHA = float(os.getenv("CONCEPT_PPR_ALPHA", 0.85))
+CONCEPT_PPR_TOL = float(os.getenv("CONCEPT_PPR_TOL", 1e-6))
+CONCEPT_PPR_MAX_ITER = int(os.getenv("CONCEPT_PPR_MAX_ITER", 100))
+CONCEPT_SPREAD_STEPS = int(os.getenv("CONCEPT_SPREAD_STEPS", 3))
+CONCEPT_SPREAD_DECAY = float(os.getenv("CONCEPT_SPREAD_DECAY", 0.5))
+CONCEPT_RANK_CACHE_SIZE = int(os.getenv("CONCEPT_RANK_CACHE_SIZE", 10000))
+CONCEPT_RANK_CACHE_TTL = float(os.getenv("CONCEPT_RANK_CACHE_TTL", 3600))
+# ذاكرة العمل لكل حساب ترتيب (المصفوفات الكثيفة (B, n) ومؤقت جمع الجيران)
+CONCEPT_RANK_MEM_BYTES = int(os.getenv("CONCEPT_RANK_MEM_BYTES", 64 * 2**20))
@@ -17,7 +17,8 @@ class ConsolidationWorker(threading.Thread):
         logger=None,
         logs_dir="data/logs",
         exports_dir="data/exports",
-        control_dir="data/control"
+        control_dir="data/control",
+        proto_merger=None
     ):
         super().__init__(daemon=True)
         self.q = task_queue
@@ -26,6 +27,7 @@ class ConsolidationWorker(threading.Thread):
         self.exports_dir = Path(exports_dir)
         self.control_dir = Path(control_dir)
         self.logger = logger
+        self.proto_merger = proto_merger
         self._running = True
 
         # تأكد من المجلدات
@@ -70,6 +72,14 @@ class ConsolidationWorker(threading.Thread):
         shutil.make_archive(str(base_name), "zip", root_dir=str(self.logs_dir))
         return {"result": "export_done", "archive": f"{base_name}.zip"}
 
+    def _handle_proto_merge(self, trace_id):
+        """
+        دمج protos المتقاربة (ProtoMerger) وتحديث proto_refs في ConceptGraph.
+        """
+        if self.proto_merger is None:
+            return {"result": "skipped", "reason": "no proto_merger configured"}
+        return {"result": "proto_merge_done", **self.proto_merger.run_once()}
+
     def _handle_generic(self, job, trace_id):
         """
         معالجة عامة لأي job آخر — يُخزّن كـ artifact (قابلة للتوسيع لاحقًا).
@@ -95,6 +105,8 @@ class ConsolidationWorker(threading.Thread):
                     result_record.update(self._handle_admin_restart(trace_id))
                 elif jtype == "export_logs":
                     result_record.update(self._handle_export_logs(trace_id))
+                elif jtype == "proto_merge":
+                    result_record.update(self._handle_proto_merge(trace_id))
                 else:
                     result_record.update(self._handle_generic(job, trace_id))
 
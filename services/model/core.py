@@ -194,6 +194,10 @@ class CMSHModel:
                 self.proto_memory.checkpoint()
             except Exception:
                 self.logger.exception("proto_memory.checkpoint failed")
+            try:
+                self.concept_graph.checkpoint()
+            except Exception:
+                self.logger.exception("concept_graph.checkpoint failed")
             try:
                 self.memory_logger.log_event(event_type="shutdown", meta={"signal": signum})
             except Exception:
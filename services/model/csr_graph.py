@@ -0,0 +1,378 @@
+from collections.abc import MutableMapping
+import math
+import networkx as nx
+import numpy as np
+from .config import CONCEPT_CSR_DELTA_MAX
+
+# أعمدة خصائص المفاهيم (ما يكتبه ConceptGraph.link)؛ أي خاصية أخرى تُحفظ في extras
+LIST_ATTRS = ("labels", "proto_refs", "provenance")
+FLOAT_ATTRS = {"confidence": np.float32, "last_updated": np.float64}
+
+
+class NodeAttrs(MutableMapping):
+    # واجهة dict فوق أعمدة CSRGraph لعقدة واحدة (بديل G.nodes[n] في networkx)
+    def __init__(self, graph, idx):
+        self._g = graph
+        self._i = idx
+
+    def __getitem__(self, key):
+        g, i = self._g, self._i
+        if key in FLOAT_ATTRS:
+            v = g._floats[key][i]
+            if not math.isnan(v):
+                return float(v)
+        elif key in LIST_ATTRS:
+            v = g._lists[key][i]
+            if v is not None:
+                return v
+        extras = g._extras.get(i, {})
+        if key not in extras:
+            raise KeyError(key)
+        return extras[key]
+
+    def __setitem__(self, key, value):
+        g, i = self._g, self._i
+        if key in FLOAT_ATTRS and isinstance(value, (int, float)):
+            g._floats[key][i] = value
+        elif key in LIST_ATTRS and value is not None:
+            g._lists[key][i] = value
+        else:
+            g._extras.setdefault(i, {})[key] = value
+            return
+        g._extras.get(i, {}).pop(key, None)
+
+    def __delitem__(self, key):
+        self[key]
+        g, i = self._g, self._i
+        if key in g._extras.get(i, ()):
+            del g._extras[i][key]
+        elif key in FLOAT_ATTRS:
+            g._floats[key][i] = np.nan
+        else:
+            g._lists[key][i] = None
+
+    def __iter__(self):
+        g, i = self._g, self._i
+        for key in LIST_ATTRS:
+            if g._lists[key][i] is not None:
+                yield key
+        for key in FLOAT_ATTRS:
+            if not math.isnan(g._floats[key][i]):
+                yield key
+        yield from list(g._extras.get(i, ()))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class NodeView:
+    # G.nodes / G.nodes() / G.nodes(data=True) / G.nodes[n]
+    def __init__(self, graph):
+        self._g = graph
+
+    def __getitem__(self, node):
+        return NodeAttrs(self._g, self._g._index[node])
+
+    def __iter__(self):
+        return iter(list(self._g._ids))
+
+    def __len__(self):
+        return len(self._g._ids)
+
+    def __contains__(self, node):
+        return node in self._g._index
+
+    def __call__(self, data=False):
+        if not data:
+            return list(self._g._ids)
+        return [(n, NodeAttrs(self._g, i)) for i, n in enumerate(list(self._g._ids))]
+
+
+class EdgeView:
+    # G.edges(data=True) (كل حافة مرة واحدة) و G.edges[a, b]
+    def __init__(self, graph):
+        self._g = graph
+
+    def __getitem__(self, edge):
+        found = self._g._edge(*edge)
+        if found is None:
+            raise KeyError(edge)
+        w, code = found
+        return {"rel_type": self._g.rel_types[code], "weight": float(w)}
+
+    def __iter__(self):
+        return ((a, b) for a, b, _ in self(data=True))
+
+    def __len__(self):
+        return self._g.number_of_edges()
+
+    def __call__(self, data=False):
+        g = self._g
+        src, dst, w, code = g._edge_arrays()
+        ids = g._ids
+        if not data:
+            return [(ids[a], ids[b]) for a, b in zip(src.tolist(), dst.tolist())]
+        return [(ids[a], ids[b], {"rel_type": g.rel_types[c], "weight": float(x)})
+                for a, b, x, c in zip(src.tolist(), dst.tolist(), w.tolist(), code.tolist())]
+
+
+class CSRGraph:
+    """
+    رسم غير موجّه مضغوط بديل لـ networkx.Graph في ConceptGraph:
+    الجوار بصيغة CSR (indptr int64، indices int32، weights float32، rel_type
+    كرموز uint8) + delta buffer للحواف الحديثة يُدمج في CSR عند امتلائه.
+    خصائص العقد أعمدة (قوائم ومصفوفات) بدل dict لكل عقدة.
+    k_hop: BFS متجه على frontiers من NumPy.
+    """
+
+    def __init__(self, delta_max=CONCEPT_CSR_DELTA_MAX):
+        self.delta_max = delta_max
+        self._ids = []       # idx -> concept_id
+        self._index = {}     # concept_id -> idx
+        self._lists = {k: [] for k in LIST_ATTRS}
+        self._floats = {k: np.empty(0, dtype=t) for k, t in FLOAT_ATTRS.items()}
+        self._extras = {}
+        self.rel_types = [None]  # code -> rel_type (0 = بدون نوع)
+        self._rel_codes = {None: 0}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self.rels = np.empty(0, dtype=np.uint8)
+        self._delta = {}       # (min idx, max idx) -> (weight, code)
+        self._delta_new = 0    # حواف في الـ delta غير موجودة في CSR
+        self._delta_arrays = None
+        self._csr_edges = 0
+        self.nodes = NodeView(self)
+        self.edges = EdgeView(self)
+
+    # ---------------- nodes ----------------
+    def _node_idx(self, node):
+        idx = self._index.get(node)
+        if idx is None:
+            idx = len(self._ids)
+            self._ids.append(node)
+            self._index[node] = idx
+            for col in self._lists.values():
+                col.append(None)
+            for key, arr in self._floats.items():
+                if idx >= len(arr):
+                    grown = np.full(max(16, 2 * len(arr)), np.nan, dtype=arr.dtype)
+                    grown[:len(arr)] = arr
+                    self._floats[key] = grown
+                self._floats[key][idx] = np.nan
+        return idx
+
+    def add_node(self, node, **attrs):
+        data = NodeAttrs(self, self._node_idx(node))
+        for key, value in attrs.items():
+            data[key] = value
+
+    def __contains__(self, node):
+        return node in self._index
+
+    def __len__(self):
+        return len(self._ids)
+
+    def number_of_nodes(self):
+        return len(self._ids)
+
+    def load_arrays(self, ids, lists, floats, csr, rel_types, n_edges):
+        """
+        يستبدل محتوى الرسم بأعمدة جاهزة (من لقطة ثنائية): lists {attr: قائمة لكل عقدة}،
+        floats {attr: مصفوفة بـ NaN للغائب}، csr (indptr, indices, weights, rels) متماثلة
+        وقد تكون np.memmap (copy-on-write؛ _merge ينشئ مصفوفات جديدة عند الحاجة).
+        """
+        if len(rel_types) > 256:
+            raise ValueError("CSRGraph supports at most 255 relation types")
+        n = len(ids)
+        self._ids = list(ids)
+        self._index = dict(zip(self._ids, range(n)))
+        self._lists = {k: list(lists.get(k) or [None] * n) for k in LIST_ATTRS}
+        self._floats = {k: np.array(floats[k], dtype=t) for k, t in FLOAT_ATTRS.items()}
+        self._extras = {}
+        self.rel_types = list(rel_types)
+        self._rel_codes = {t: code for code, t in enumerate(self.rel_types)}
+        self.indptr, self.indices, self.weights, rels = csr
+        self.rels = rels.astype(np.uint8, copy=False)
+        self._delta = {}
+        self._delta_new = 0
+        self._delta_arrays = None
+        self._csr_edges = n_edges
+
+    # ---------------- edges ----------------
+    def _rel_code(self, rel_type):
+        code = self._rel_codes.get(rel_type)
+        if code is None:
+            if len(self.rel_types) > 255:
+                raise ValueError("CSRGraph supports at most 255 relation types")
+            code = len(self.rel_types)
+            self.rel_types.append(rel_type)
+            self._rel_codes[rel_type] = code
+        return code
+
+    def _csr_pos(self, a, b):
+        # موضع b في صف a داخل CSR (الصفوف مرتبة)، أو None
+        if a + 1 >= len(self.indptr):
+            return None
+        lo, hi = self.indptr[a], self.indptr[a + 1]
+        j = lo + int(np.searchsorted(self.indices[lo:hi], b))
+        return j if j < hi and self.indices[j] == b else None
+
+    def _edge(self, u, v):
+        a, b = self._index.get(u), self._index.get(v)
+        if a is None or b is None:
+            return None
+        found = self._delta.get((min(a, b), max(a, b)))
+        if found is not None:
+            return found
+        j = self._csr_pos(a, b)
+        return None if j is None else (self.weights[j], self.rels[j])
+
+    def has_edge(self, u, v):
+        return self._edge(u, v) is not None
+
+    def add_edge(self, u, v, rel_type=None, weight=1.0):
+        a, b = self._node_idx(u), self._node_idx(v)
+        key = (min(a, b), max(a, b))
+        if key not in self._delta and self._csr_pos(a, b) is None:
+            self._delta_new += 1
+        self._delta[key] = (float(weight), self._rel_code(rel_type))
+        self._delta_arrays = None
+        if len(self._delta) >= self.delta_max:
+            self.compact()
+
+    def number_of_edges(self):
+        return self._csr_edges + self._delta_new
+
+    def add_edges(self, us, vs, rel_types, weights):
+        """
+        إضافة دفعة حواف مباشرة إلى CSR (بدون المرور بالـ delta): تكرارات الدفعة
+        تُحسم بآخر قيمة، والحواف الموجودة تُحدَّث في مكانها.
+        """
+        self.compact()
+        index = self._index
+        a = np.array([index[u] if u in index else self._node_idx(u) for u in us], dtype=np.int64)
+        b = np.array([index[v] if v in index else self._node_idx(v) for v in vs], dtype=np.int64)
+        codes = {t: self._rel_code(t) for t in set(rel_types)}
+        code = np.fromiter((codes[t] for t in rel_types), dtype=np.uint8, count=len(rel_types))
+        keys = np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1)
+        self._merge(keys, np.asarray(weights, dtype=np.float32), code)
+
+    def compact(self):
+        # دمج الـ delta في CSR
+        if not self._delta:
+            self._grow_indptr()
+            return
+        keys = np.array(list(self._delta.keys()), dtype=np.int64).reshape(-1, 2)
+        vals = list(self._delta.values())
+        w = np.array([x[0] for x in vals], dtype=np.float32)
+        code = np.array([x[1] for x in vals], dtype=np.uint8)
+        self._delta = {}
+        self._delta_new = 0
+        self._delta_arrays = None
+        self._merge(keys, w, code)
+
+    def _merge(self, keys, w, code):
+        """
+        keys: (m, 2) بـ a <= b. الحواف الموجودة تُحدَّث في مكانها (بالاتجاهين)،
+        والجديدة تُضاف بالاتجاهين ثم يُعاد ترتيب الصفوف بـ lexsort.
+        """
+        self._grow_indptr()
+        n = len(self._ids)
+        if not len(keys):
+            return
+        # تكرارات داخل الدفعة: آخر قيمة تفوز
+        flat = keys[:, 0] * n + keys[:, 1]
+        _, last = np.unique(flat[::-1], return_index=True)
+        keep = len(flat) - 1 - last
+        keys, w, code, flat = keys[keep], w[keep], code[keep], flat[keep]
+        old_src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+        old_dst = self.indices.astype(np.int64)
+        # مفتاح كل مدخل CSR بصيغة (min, max): موضعا الاتجاهين لكل حافة موجودة
+        old_flat = np.minimum(old_src, old_dst) * n + np.maximum(old_src, old_dst)
+        order = np.argsort(old_flat, kind="stable")
+        sorted_flat = old_flat[order]
+        lo = np.searchsorted(sorted_flat, flat, side="left")
+        hi = np.searchsorted(sorted_flat, flat, side="right")
+        exists = hi > lo
+        for side in (lo, hi - 1):
+            pos = order[side[exists]]
+            self.weights[pos] = w[exists]
+            self.rels[pos] = code[exists]
+        keys, w, code = keys[~exists], w[~exists], code[~exists]
+        loops = keys[:, 0] == keys[:, 1]
+        src = np.concatenate([old_src, keys[:, 0], keys[~loops, 1]])
+        dst = np.concatenate([old_dst, keys[:, 1], keys[~loops, 0]])
+        order = np.lexsort((dst, src))
+        self.indices = dst[order].astype(np.int32)
+        self.weights = np.concatenate([self.weights, w, w[~loops]])[order]
+        self.rels = np.concatenate([self.rels, code, code[~loops]])[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]).astype(np.int64)
+        self._csr_edges += len(keys)
+
+    def _grow_indptr(self):
+        # عقد أضيفت بعد آخر compact: صفوف فارغة
+        n = len(self._ids)
+        if len(self.indptr) < n + 1:
+            self.indptr = np.concatenate([self.indptr, np.full(n + 1 - len(self.indptr), self.indptr[-1])])
+
+    def _delta_edges(self):
+        if self._delta_arrays is None:
+            keys = np.array(list(self._delta.keys()), dtype=np.int64).reshape(-1, 2)
+            self._delta_arrays = (np.concatenate([keys[:, 0], keys[:, 1]]), np.concatenate([keys[:, 1], keys[:, 0]]))
+        return self._delta_arrays
+
+    def _edge_arrays(self):
+        # كل حافة مرة واحدة (a <= b): CSR ثم ما في الـ delta فوقها
+        n = len(self.indptr) - 1
+        src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+        keep = src <= self.indices
+        src, dst, w, code = src[keep], self.indices[keep].astype(np.int64), self.weights[keep], self.rels[keep]
+        if self._delta:
+            keys = np.array(list(self._delta.keys()), dtype=np.int64).reshape(-1, 2)
+            vals = list(self._delta.values())
+            if len(src):
+                stale = np.isin(src * len(self._ids) + dst, keys[:, 0] * len(self._ids) + keys[:, 1])
+                src, dst, w, code = src[~stale], dst[~stale], w[~stale], code[~stale]
+            src = np.concatenate([src, keys[:, 0]])
+            dst = np.concatenate([dst, keys[:, 1]])
+            w = np.concatenate([w, np.array([x[0] for x in vals], dtype=np.float32)])
+            code = np.concatenate([code, np.array([x[1] for x in vals], dtype=np.uint8)])
+        return src, dst, w, code
+
+    # ---------------- traversal ----------------
+    def k_hop(self, node, cutoff=None):
+        """
+        BFS متجه: كل مستوى = جمع صفوف CSR للـ frontier دفعةً واحدة + حواف الـ delta.
+        يعيد {concept_id: المسافة} مرتبًا بالمسافة (مثل single_source_shortest_path_length).
+        """
+        start = self._index.get(node)
+        if start is None:
+            raise nx.NodeNotFound(f"Source {node} is not in G")
+        n = len(self._ids)
+        visited = np.zeros(n, dtype=bool)
+        visited[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        result = {node: 0}
+        d_src, d_dst = self._delta_edges()
+        rows = len(self.indptr) - 1
+        depth = 0
+        while len(frontier) and (cutoff is None or depth < cutoff):
+            depth += 1
+            f = frontier[frontier < rows]
+            starts = self.indptr[f]
+            lens = self.indptr[f + 1] - starts
+            total = int(lens.sum())
+            if total:
+                offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lens)[:-1]]), lens)
+                nbrs = self.indices[offsets + np.arange(total)].astype(np.int64)
+            else:
+                nbrs = np.empty(0, dtype=np.int64)
+            if len(d_src):
+                nbrs = np.concatenate([nbrs, d_dst[np.isin(d_src, frontier)]])
+            nbrs = np.unique(nbrs)
+            frontier = nbrs[~visited[nbrs]]
+            visited[frontier] = True
+            for i in frontier.tolist():
+                result[self._ids[i]] = depth
+        return result
@@ -0,0 +1,227 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from .config import EMBED_DIM, EMBED_CACHE_BYTES, EMBED_CACHE_DIR, ENCODER_VERSION
+
+KEY_SIZE = 16  # content_digest(modality, data, version): blake2b بـ personalization = modality و salt = الإصدار
+
+
+class DiskEmbeddingTier:
+    """
+    الطبقة الثانية: vectors.f32 (مصفوفة (capacity, dim) float32 بـ np.memmap) + keys.bin
+    (مفتاح KEY_SIZE بايت لكل صف بنفس الترتيب، إلحاقي) + meta.json (dim + إصدار المُرمِّز).
+    الصف يُكتب قبل مفتاحه، فانقطاع بينهما يترك صفًا بلا مفتاح فقط. لا حذف: الحجم يتبع المحتوى الفريد.
+    عدة عمليات (workers) تتشارك المجلد: الكتابة تحت flock على keys.bin، وكل عملية تلحق
+    بمفاتيح غيرها من نهاية الملف. الإصدار جزء من المفتاح؛ meta.json يسجل إصدار من أنشأ
+    المجلد فقط، فمجلد قديم (إصدار أو dim مختلف) يُفرَّغ عند الفتح لا أثناء الخدمة.
+    """
+
+    def __init__(self, path, dim, version):
+        self.path = path
+        self.dim = dim
+        self.logger = logging.getLogger("DiskEmbeddingTier")
+        os.makedirs(path, exist_ok=True)
+        self._vec_file = os.path.join(path, "vectors.f32")
+        self._key_file = os.path.join(path, "keys.bin")
+        self._meta_file = os.path.join(path, "meta.json")
+        self._rows = {}
+        self._vecs = None
+        self.version = None
+        self._open(version)
+
+    def _open(self, version):
+        meta = None
+        if os.path.exists(self._meta_file):
+            with open(self._meta_file, encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta != {"dim": self.dim, "version": version}:
+            if meta is not None:
+                self.logger.info(f"Embedding cache at {self.path} is stale ({meta}); resetting")
+            for name in (self._vec_file, self._key_file):
+                if os.path.exists(name):
+                    os.remove(name)
+            tmp = self._meta_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "version": version}, f)
+            os.replace(tmp, self._meta_file)
+        self.version = version
+        keys = b""
+        if os.path.exists(self._key_file):
+            with open(self._key_file, "rb") as f:
+                keys = f.read()
+        capacity = os.path.getsize(self._vec_file) // (4 * self.dim) if os.path.exists(self._vec_file) else 0
+        n = min(len(keys) // KEY_SIZE, capacity)
+        if n * KEY_SIZE < len(keys):
+            with open(self._key_file, "r+b") as f:
+                f.truncate(n * KEY_SIZE)
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(n)}
+        self._key_bytes = n * KEY_SIZE
+        self._map(max(capacity, 1024))
+
+    def _sync(self):
+        # مفاتيح ألحقتها عمليات أخرى منذ آخر قراءة
+        size = os.path.getsize(self._key_file) if os.path.exists(self._key_file) else 0
+        if size - self._key_bytes < KEY_SIZE:
+            return
+        with open(self._key_file, "rb") as f:
+            f.seek(self._key_bytes)
+            keys = f.read((size - self._key_bytes) // KEY_SIZE * KEY_SIZE)
+        start = self._key_bytes // KEY_SIZE
+        for i in range(len(keys) // KEY_SIZE):
+            self._rows[keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = start + i
+        self._key_bytes += len(keys)
+        rows = self._key_bytes // KEY_SIZE
+        if rows > len(self._vecs):
+            self._map(os.path.getsize(self._vec_file) // (4 * self.dim))
+
+    def _map(self, capacity):
+        if self._vecs is not None:
+            self._vecs.flush()
+            self._vecs = None
+        with open(self._vec_file, "ab") as f:
+            if f.tell() < capacity * 4 * self.dim:
+                f.truncate(capacity * 4 * self.dim)
+        self._vecs = np.memmap(self._vec_file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def get_many(self, keys):
+        self._sync()
+        rows = [self._rows.get(k) for k in keys]
+        return [None if row is None else np.array(self._vecs[row]) for row in rows]
+
+    def put_many(self, keys, vectors):
+        with open(self._key_file, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                new = {}
+                for k, v in zip(keys, vectors):
+                    if k not in self._rows:
+                        new.setdefault(k, v)
+                if not new:
+                    return
+                start = self._key_bytes // KEY_SIZE
+                if start + len(new) > len(self._vecs):
+                    self._map(max(2 * len(self._vecs), start + len(new)))
+                self._vecs[start:start + len(new)] = np.stack(list(new.values()))
+                self._vecs.flush()
+                f.write(b"".join(new))
+                f.flush()
+                for i, k in enumerate(new):
+                    self._rows[k] = start + i
+                self._key_bytes += len(new) * KEY_SIZE
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class EmbeddingCache:
+    """
+    كاش embeddings بمفتاح المحتوى: content_digest(modality, data, version)، فالإصدار
+    داخل المفتاح ومُرمِّزات بإصدارات مختلفة تتشارك الكاش بلا تصادم ولا مسح.
+    الطبقة الأولى LRU في الذاكرة بميزانية بايتات، والثانية (اختيارية) DiskEmbeddingTier
+    تبقى بعد إعادة التشغيل وتتشاركها العمليات عبر الـ page cache. إصابة القرص تُرفع إلى الذاكرة.
+    مفاتيح الإصدارات القديمة تخرج من الذاكرة بالـ LRU؛ مجلد القرص يُفرَّغ عند فتحه بإصدار آخر.
+    """
+
+    def __init__(self, max_bytes=EMBED_CACHE_BYTES, disk_dir=EMBED_CACHE_DIR, dim=EMBED_DIM,
+                 version=ENCODER_VERSION):
+        self.max_bytes = max_bytes
+        self.dim = dim
+        self.version = version
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.disk = DiskEmbeddingTier(disk_dir, dim, version) if disk_dir else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 or self.disk is not None
+
+    def _remember(self, key, vec):
+        if self.max_bytes <= 0:
+            return
+        if key in self._data:
+            self._data.move_to_end(key)
+            return
+        self._data[key] = vec
+        self._bytes += vec.nbytes
+        while self._bytes > self.max_bytes and self._data:
+            _, old = self._data.popitem(last=False)
+            self._bytes -= old.nbytes
+            self.evictions += 1
+
+    def get_many(self, keys):
+        # قائمة بطول keys: متجه (للقراءة فقط) أو None
+        with self._lock:
+            out = [self._data.get(key) for key in keys]
+            for key, vec in zip(keys, out):
+                if vec is not None:
+                    self._data.move_to_end(key)
+            self.memory_hits += sum(vec is not None for vec in out)
+            missing = [j for j, vec in enumerate(out) if vec is None]
+            if missing and self.disk is not None:
+                for j, vec in zip(missing, self.disk.get_many([keys[j] for j in missing])):
+                    if vec is not None:
+                        vec.flags.writeable = False
+                        self._remember(keys[j], vec)
+                        self.disk_hits += 1
+                        out[j] = vec
+            self.misses += sum(vec is None for vec in out)
+        return out
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vec in zip(keys, vectors):
+                vec = vec.copy()
+                vec.flags.writeable = False
+                self._remember(key, vec)
+            if self.disk is not None:
+                self.disk.put_many(list(keys), vectors)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    # كاش واحد لكل عملية تتشاركه كل نسخ MultiModalEncoders (API و core و experts)
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EmbeddingCache()
+        return _shared
@@ -0,0 +1,259 @@
+import atexit
+import logging
+import multiprocessing as mp
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+from .config import EMBED_DIM, ENCODER_WORKERS, ENCODER_MAX_BATCH, ENCODER_MAX_WAIT_MS
+
+
+def default_encoder():
+    # يُستدعى داخل العامل: المُرمِّز المحلي (بدون كاش ولا pool) يُحمَّل مرة واحدة لكل عملية
+    from .embedding_cache import EmbeddingCache
+    from .encoders import MultiModalEncoders
+    return MultiModalEncoders(cache=EmbeddingCache(max_bytes=0, disk_dir=""), backend="inprocess")
+
+
+def _worker(conn, shm_name, max_batch, dim, factory):
+    # الكتلة ملك العملية الأم (هي من يحررها)؛ العامل يتشارك resource tracker الخاص بها
+    shm = shared_memory.SharedMemory(name=shm_name)
+    out = np.ndarray((max_batch, dim), dtype=np.float32, buffer=shm.buf)
+    encoder = factory()
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            modality, items = job
+            try:
+                out[:len(items)] = encoder._encode_local(modality, items)
+                conn.send(("ok", len(items)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        del out
+        shm.close()
+
+
+class EncoderPool:
+    """
+    تشغيل المُرمِّز في عمليات منفصلة (خارج الـ GIL الخاص بالـ API). كل عامل يحمّل
+    النموذج مرة واحدة، ولكل عامل كتلة shared memory بحجم (max_batch, dim) float32
+    يكتب فيها المتجهات بدل إرجاعها كقوائم pickle. لكل عامل thread في العملية الأم
+    يجمع الطلبات المنتظرة في micro-batch (نفس modality، حتى max_batch عنصر أو max_wait_ms
+    من أقدم طلب) ثم يرسلها وينتظر النتيجة ويحل الـ futures.
+    """
+
+    def __init__(self, workers=ENCODER_WORKERS, max_batch=ENCODER_MAX_BATCH, max_wait_ms=ENCODER_MAX_WAIT_MS,
+                 dim=EMBED_DIM, factory=default_encoder):
+        self.workers = max(1, workers)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.dim = dim
+        self.factory = factory
+        self.logger = logging.getLogger("EncoderPool")
+        self._ctx = mp.get_context("spawn")  # fork غير آمن مع threads الـ API و FAISS
+        self._cond = threading.Condition()
+        self._pending = deque()  # (modality, items, future, وقت الوصول)
+        self._closed = False
+        self._procs = [None] * self.workers
+        self._conns = [None] * self.workers
+        self._shms = [shared_memory.SharedMemory(create=True, size=max_batch * dim * 4) for _ in range(self.workers)]
+        # العدادات تُحدَّث من thread لكل عامل
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.errors = 0
+        self.restarts = 0
+        for i in range(self.workers):
+            self._start_worker(i)
+        self._threads = [threading.Thread(target=self._dispatch, args=(i,), daemon=True, name=f"EncoderPool-{i}")
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+
+    def _start_worker(self, i):
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker, args=(child, self._shms[i].name, self.max_batch, self.dim, self.factory),
+                                 daemon=True, name=f"encoder-worker-{i}")
+        proc.start()
+        child.close()
+        self._procs[i], self._conns[i] = proc, parent
+
+    # ---------------- API ----------------
+    def submit(self, modality, items):
+        """
+        Future بمصفوفة (len(items), dim) float32. الطلبات الأكبر من max_batch تُقسَّم
+        وتُجمع نتائجها بالترتيب.
+        """
+        items = list(items)
+        result = Future()
+        if not items:
+            result.set_result(np.empty((0, self.dim), dtype=np.float32))
+            return result
+        parts = [Future() for _ in range(0, len(items), self.max_batch)]
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EncoderPool is closed")
+            for k, part in enumerate(parts):
+                self._pending.append((modality, items[k * self.max_batch:(k + 1) * self.max_batch], part, now))
+            self._cond.notify_all()
+        if len(parts) == 1:
+            return parts[0]
+        remaining = [len(parts)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                result.set_result(np.concatenate([p.result() for p in parts]))
+            except Exception as e:
+                result.set_exception(e)
+        for part in parts:
+            part.add_done_callback(done)
+        return result
+
+    def encode(self, modality, items):
+        return self.submit(modality, items).result()
+
+    # ---------------- dispatch ----------------
+    def _next_batch(self):
+        # أقدم طلب يحدد الـ modality؛ الانتظار حتى يمتلئ الـ batch أو تنقضي max_wait من وصوله
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._closed and not self._pending:
+                return None
+            modality, _, _, first = self._pending[0]
+            while not self._closed:
+                queued = sum(len(req[1]) for req in self._pending if req[0] == modality)
+                left = first + self.max_wait - time.monotonic()
+                if queued >= self.max_batch or left <= 0:
+                    break
+                self._cond.wait(left)
+            batch, size, keep = [], 0, deque()
+            while self._pending:
+                req = self._pending.popleft()
+                if req[0] == modality and size + len(req[1]) <= self.max_batch:
+                    batch.append(req)
+                    size += len(req[1])
+                else:
+                    keep.append(req)
+            self._pending = keep
+            return modality, batch
+
+    def _dispatch(self, i):
+        while True:
+            nxt = self._next_batch()
+            if nxt is None:
+                return
+            modality, batch = nxt
+            items = [x for req in batch for x in req[1]]
+            start = time.monotonic()
+            try:
+                vecs = self._run(i, modality, items)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                for req in batch:
+                    req[2].set_exception(e)
+                continue
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(items)
+                self.requests += len(batch)
+                self.wait_total += sum(start - req[3] for req in batch)
+            offset = 0
+            for req in batch:
+                req[2].set_result(vecs[offset:offset + len(req[1])])
+                offset += len(req[1])
+
+    def _run(self, i, modality, items):
+        conn = self._conns[i]
+        try:
+            conn.send((modality, items))
+            while not conn.poll(1.0):
+                if not self._procs[i].is_alive():
+                    raise EOFError
+            status, value = conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            if self._closed:
+                raise RuntimeError("EncoderPool is closed")
+            self.logger.error(f"Encoder worker {i} died; restarting")
+            with self._stats_lock:
+                self.restarts += 1
+            dead = self._procs[i]
+            self._start_worker(i)
+            # الطرف القديم من الـ Pipe وكائن العملية الميتة يُحرران (وإلا fd مسرَّب لكل إعادة تشغيل)
+            conn.close()
+            dead.join(timeout=1)
+            if not dead.is_alive():
+                dead.close()
+            raise RuntimeError("Encoder worker died while encoding")
+        if status != "ok":
+            raise RuntimeError(value)
+        view = np.ndarray((self.max_batch, self.dim), dtype=np.float32, buffer=self._shms[i].buf)
+        vecs = np.array(view[:value])
+        del view
+        return vecs
+
+    def stats(self):
+        with self._stats_lock:
+            batches, items, requests = self.batches, self.items, self.requests
+            wait_total, errors, restarts = self.wait_total, self.errors, self.restarts
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for p in self._procs if p is not None and p.is_alive()),
+            "queued": len(self._pending),
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": items / batches if batches else 0.0,
+            "avg_wait_ms": 1000.0 * wait_total / requests if requests else 0.0,
+            "errors": errors,
+            "restarts": restarts,
+        }
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
+        for conn, proc in zip(self._conns, self._procs):
+            try:
+                conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+            conn.close()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        atexit.unregister(self.close)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool():
+    # pool واحد لكل عملية (يبدأ عند أول استخدام) تتشاركه كل نسخ MultiModalEncoders
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EncoderPool()
+        return _shared
@@ -1,35 +1,67 @@
+import hashlib
+import mmap
+import os
 import numpy as np
-from .config import EMBED_DIM
+from .config import EMBED_DIM, ENCODER_VERSION, ENCODE_WINDOW_BYTES, ENCODE_STREAM_BATCH, ENCODER_BACKEND
+from .embedding_cache import shared_cache
+from .encoder_pool import shared_pool
 from typing import Union
 
+MODALITIES = ("text", "image", "audio")
+HEADER_BYTES = 16  # enough for every magic number _is_image/_is_audio check
+
+
+def version_salt(version: str) -> bytes:
+    # blake2b salt is at most 16 bytes, so longer version strings are hashed down; "" keeps the unsalted digest
+    return hashlib.blake2b(version.encode("utf-8"), digest_size=16).digest() if version else b""
+
+
+def content_digest(modality: str, data: Union[str, bytes], digest_size=16, version: str = "") -> bytes:
+    """
+    Stable across processes/restarts (unlike the salted built-in hash()). The modality is the blake2b
+    personalization and the encoder version the salt, so cache keys of different versions never collide.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.blake2b(data, digest_size=digest_size, person=modality.encode("ascii"),
+                           salt=version_salt(version)).digest()
+
+
 class MultiModalEncoders:
-    def __init__(self):
+    def __init__(self, cache=None, version=ENCODER_VERSION, backend=ENCODER_BACKEND, pool=None):
         self.dim = EMBED_DIM
+        # version identifies the weights/model and is part of every cache key: bump it when they change
+        self.version = version
+        self.cache = cache if cache is not None else shared_cache()
+        # backend="process": _encode_group runs in EncoderPool worker processes (see encoder_pool)
+        if pool is None and backend == "process":
+            pool = shared_pool()
+        elif backend not in ("inprocess", "process"):
+            raise ValueError(f"Unknown encoder backend: {backend}")
+        self.pool = pool
 
     def encode(self, input_data: Union[str, bytes], modality="auto"):
-        if modality == "text" or (modality == "auto" and isinstance(input_data, str)):
-            return self.encode_text(input_data)
-        elif modality == "image" or (modality == "auto" and self._is_image(input_data)):
-            return self.encode_image(input_data)
-        elif modality == "audio" or (modality == "auto" and self._is_audio(input_data)):
-            return self.encode_audio(input_data)
-        else:
-            raise ValueError(f"Unsupported modality or input type: {modality}")
+        if isinstance(input_data, os.PathLike) or hasattr(input_data, "read"):
+            return self.encode_file(input_data, modality)
+        return self.encode_batch([input_data], modality)[0]
 
     def encode_text(self, text: str):
-        np.random.seed(hash(text) % 2**32)
-        return np.random.rand(self.dim).astype(np.float32)
+        return self._encode_cached("text", [text])[0]
 
     def encode_image(self, img_bytes: bytes):
-        # Stub: hash over bytes to give deterministic vector
-        h = hash(img_bytes)
-        np.random.seed(h % 2**32)
-        return np.random.rand(self.dim).astype(np.float32)
+        return self._encode_cached("image", [img_bytes])[0]
 
     def encode_audio(self, audio_bytes: bytes):
-        h = hash(audio_bytes)
-        np.random.seed(h % 2**32)
-        return np.random.rand(self.dim).astype(np.float32)
+        return self._encode_cached("audio", [audio_bytes])[0]
+
+    def _modality(self, input_data, modality="auto"):
+        if modality == "text" or (modality == "auto" and isinstance(input_data, str)):
+            return "text"
+        elif modality == "image" or (modality == "auto" and self._is_image(input_data)):
+            return "image"
+        elif modality == "audio" or (modality == "auto" and self._is_audio(input_data)):
+            return "audio"
+        raise ValueError(f"Unsupported modality or input type: {modality}")
 
     def _is_image(self, inp):
         if isinstance(inp, bytes):
@@ -46,5 +78,166 @@ class MultiModalEncoders:
             return inp.lower().endswith(('.wav', '.mp3', '.ogg'))
         return False
 
+    def _sniff(self, header, name, modality="auto"):
+        # modality from the first HEADER_BYTES bytes, then the file extension
+        if modality != "auto":
+            return self._modality(header, modality)
+        for probe in (header, name):
+            if probe and self._is_image(probe):
+                return "image"
+            if probe and self._is_audio(probe):
+                return "audio"
+        raise ValueError(f"Unsupported modality or input type: {modality}")
+
+    @staticmethod
+    def _read_windows(f, window, prefix=b""):
+        # fixed-size windows from a file-like object (short reads are topped up)
+        buf = prefix
+        while True:
+            chunk = f.read(window - len(buf))
+            if not chunk:
+                break
+            buf += chunk
+            if len(buf) >= window:
+                yield buf
+                buf = b""
+        if buf:
+            yield buf
+
+    @staticmethod
+    def _mmap_windows(mm, window):
+        # windows of a read-only mmap; pages already consumed are dropped so RSS stays ~one window
+        for i in range(0, len(mm), window):
+            yield mm[i:i + window]
+            start = i - i % mmap.PAGESIZE
+            mm.madvise(mmap.MADV_DONTNEED, start, min(i + window, len(mm)) - start)
+
+    def encode_file(self, source, modality="auto", window=ENCODE_WINDOW_BYTES):
+        """
+        Encodes a file path or a binary file-like object without materializing it: the content is cut into
+        fixed windows of `window` bytes (read through mmap for regular files), ENCODE_STREAM_BATCH windows
+        go through _encode_group at a time, and their embeddings are mean-pooled incrementally, so peak
+        memory is ~window * ENCODE_STREAM_BATCH whatever the file size. The modality is sniffed from the
+        header (then the file name). A source that fits in one window encodes exactly like encode(bytes).
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                header = f.read(HEADER_BYTES)
+                mod = self._sniff(header, os.fspath(source), modality)
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):  # empty file or not mmap-able
+                    return self._encode_windows(mod, window, self._rewinder(f, 0, window), True)
+                with mm:
+                    return self._encode_windows(mod, window, lambda: self._mmap_windows(mm, window), True)
+        if getattr(source, "seekable", lambda: False)():
+            start = source.tell()
+            header = source.read(HEADER_BYTES)
+            mod = self._sniff(header, getattr(source, "name", None), modality)
+            return self._encode_windows(mod, window, self._rewinder(source, start, window), True)
+        header = source.read(HEADER_BYTES)
+        mod = self._sniff(header, getattr(source, "name", None), modality)
+        return self._encode_windows(mod, window, lambda: self._read_windows(source, window, header), False)
+
+    def _rewinder(self, f, start, window):
+        def windows():
+            f.seek(start)
+            return self._read_windows(f, window)
+        return windows
+
+    def _encode_windows(self, modality, window, open_windows, replayable):
+        """
+        Pools the window embeddings. The cache key is a blake2b digest of the whole stream, salted with the
+        encoder version and the window size (the pooled vector depends on it). When the source can be re-read
+        (`replayable`) the digest is taken in a cheap first pass so a cached file is never encoded.
+        """
+        salt = hashlib.blake2b(window.to_bytes(8, "little"), digest_size=16, key=version_salt(self.version)).digest()
+        h = hashlib.blake2b(digest_size=16, person=modality.encode("ascii"), salt=salt)
+        key = None
+        if replayable and self.cache.enabled:
+            for w in open_windows():
+                h.update(w)
+            key = h.digest()
+            cached = self.cache.get_many([key])[0]
+            if cached is not None:
+                return np.array(cached)
+        total = np.zeros(self.dim, dtype=np.float64)
+        count = 0
+        batch = []
+        for w in open_windows():
+            if key is None:
+                h.update(w)
+            batch.append(w)
+            if len(batch) >= ENCODE_STREAM_BATCH:
+                total += self._encode_group(modality, batch).sum(axis=0, dtype=np.float64)
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            batch = batch or [b""]
+            total += self._encode_group(modality, batch).sum(axis=0, dtype=np.float64)
+            count += len(batch)
+        vec = (total / count).astype(np.float32)
+        if self.cache.enabled:
+            self.cache.put_many([key or h.digest()], vec[None, :])
+        return vec
+
+    def _encode_group(self, modality, items):
+        # (len(items), dim) float32 for one modality: in this process, or micro-batched through the pool
+        if self.pool is not None:
+            return self.pool.encode(modality, items)
+        return self._encode_local(modality, items)
+
+    def _encode_local(self, modality, items):
+        """
+        The model call itself — what a real model replaces with one batched forward pass.
+        Stub: each item gets its own PCG64 stream whose state/increment come from its blake2b digest
+        (already uniformly mixed, so SeedSequence hashing is skipped). The generator is local to the call:
+        no shared np.random state (safe on the FastAPI threadpool), and vectors are identical across processes.
+        """
+        out = np.empty((len(items), self.dim), dtype=np.float32)
+        bitgen = np.random.PCG64(0)
+        gen = np.random.Generator(bitgen)
+        for row, item in zip(out, items):
+            d = content_digest(modality, item, 32)
+            bitgen.state = {"bit_generator": "PCG64", "has_uint32": 0, "uinteger": 0,
+                            "state": {"state": int.from_bytes(d[:16], "little"),
+                                      "inc": int.from_bytes(d[16:], "little") | 1}}
+            gen.random(dtype=np.float32, out=row)
+        return out
+
+    def _encode_cached(self, modality, items):
+        """
+        Looks items up in the embedding cache by content digest; only misses reach _encode_group,
+        and repeated content within the batch is encoded once.
+        """
+        if not self.cache.enabled:
+            return self._encode_group(modality, items)
+        keys = [content_digest(modality, item, version=self.version) for item in items]
+        cached = self.cache.get_many(keys)
+        out = np.empty((len(items), self.dim), dtype=np.float32)
+        todo = {}
+        for j, vec in enumerate(cached):
+            if vec is None:
+                todo.setdefault(keys[j], []).append(j)
+            else:
+                out[j] = vec
+        if todo:
+            first = [rows[0] for rows in todo.values()]
+            vecs = self._encode_group(modality, [items[j] for j in first])
+            self.cache.put_many(list(todo), vecs)
+            for vec, rows in zip(vecs, todo.values()):
+                out[rows] = vec
+        return out
+
     def encode_batch(self, list_inputs, modality="auto"):
-        return [self.encode(i, modality) for i in list_inputs]
\ No newline at end of file
+        """
+        Groups inputs by (detected) modality, encodes each group in one call and returns a
+        contiguous (N, dim) float32 matrix in input order. encode(x) == encode_batch([x])[0].
+        """
+        out = np.empty((len(list_inputs), self.dim), dtype=np.float32)
+        groups = {}
+        for i, inp in enumerate(list_inputs):
+            groups.setdefault(self._modality(inp, modality), []).append(i)
+        for mod, rows in groups.items():
+            out[rows] = self._encode_cached(mod, [list_inputs[i] for i in rows])
+        return out
@@ -0,0 +1,225 @@
+import glob
+import os
+import re
+import threading
+import numpy as np
+from .faiss_store import FaissStore
+from .config import PROTO_MODALITIES
+
+DEFAULT_PARTITION = "other"
+
+
+class PartitionedFaissStore:
+    """
+    فهرس FAISS مستقل لكل modality خلف واجهة FaissStore نفسها تقريبًا.
+    البحث في modality واحدة يكلّف حجم partition-ها فقط؛ modality=None
+    بحث عابر للـ modalities (cross-modal) يدمج نتائج كل الـ partitions.
+    الملفات: data/faiss.bin -> data/faiss.text.bin, data/faiss.image.bin, ...
+    partition لكل modality معروفة (PROTO_MODALITIES + ما على القرص)؛ غيرها يذهب إلى
+    DEFAULT_PARTITION، فنصوص modality القادمة من الـ API لا تنشئ ملفات جديدة.
+    partitions تُستبدل ولا تُعدَّل (copy-on-write): البحث بلا قفل يمر على dict ثابت.
+    """
+
+    def __init__(self, dim, index_file, modalities=PROTO_MODALITIES, **store_kwargs):
+        self.dim = dim
+        self.index_file = index_file
+        self.store_kwargs = store_kwargs
+        self._root, self._ext = os.path.splitext(index_file)
+        self._lock = threading.Lock()
+        self.partitions = {}
+        self.known = {self._sanitize(m) for m in modalities} | {DEFAULT_PARTITION}
+        for name in self._discover():
+            self.known.add(name)
+            self.partition(name)
+
+    # ---------------- partitions ----------------
+    @staticmethod
+    def _sanitize(modality):
+        return re.sub(r"[^A-Za-z0-9_-]", "_", str(modality)) or "_"
+
+    def partition_name(self, modality):
+        name = self._sanitize(modality)
+        return name if name in self.known else DEFAULT_PARTITION
+
+    def partition_file(self, modality):
+        return f"{self._root}.{self.partition_name(modality)}{self._ext}"
+
+    def _discover(self):
+        prefix = glob.escape(self._root) + "."
+        names = set()
+        for pattern, suffix in ((prefix + "*" + self._ext, self._ext), (prefix + "*" + self._ext + ".ids", self._ext + ".ids")):
+            for path in glob.glob(pattern):
+                name = path[len(self._root) + 1: -len(suffix)]
+                if name and name == self._sanitize(name):
+                    names.add(name)
+        return sorted(names)
+
+    def partition(self, modality, create=True):
+        name = self.partition_name(modality)
+        store = self.partitions.get(name)
+        if store is None and create:
+            with self._lock:
+                store = self.partitions.get(name)
+                if store is None:
+                    store = FaissStore(self.dim, self.partition_file(name), **self.store_kwargs)
+                    self.partitions = {**self.partitions, name: store}
+        return store
+
+    def owner(self, proto_id):
+        for store in self.partitions.values():
+            if proto_id in store.ids_map:
+                return store
+        return None
+
+    # ---------------- mutations ----------------
+    def add(self, vector, proto_id, modality):
+        self.partition(modality).add(vector, proto_id)
+
+    def add_batch(self, vectors, proto_ids, modalities):
+        if isinstance(modalities, str):
+            modalities = [modalities] * len(proto_ids)
+        for name, rows in self._group(modalities).items():
+            self.partition(name).add_batch(np.asarray(vectors)[rows], [proto_ids[i] for i in rows])
+
+    def update_batch(self, vectors, proto_ids):
+        groups = {}
+        for i, pid in enumerate(proto_ids):
+            store = self.owner(pid)
+            if store is not None:
+                groups.setdefault(id(store), (store, []))[1].append(i)
+        for store, rows in groups.values():
+            store.update_batch(np.asarray(vectors)[rows], [proto_ids[i] for i in rows])
+
+    def remove(self, proto_id):
+        store = self.owner(proto_id)
+        if store is not None:
+            store.remove(proto_id)
+
+    def remove_batch(self, proto_ids):
+        groups = {}
+        for pid in proto_ids:
+            store = self.owner(pid)
+            if store is not None:
+                groups.setdefault(id(store), (store, []))[1].append(pid)
+        for store, pids in groups.values():
+            store.remove_batch(pids)
+
+    def _group(self, modalities):
+        groups = {}
+        for i, m in enumerate(modalities):
+            groups.setdefault(self.partition_name(m), []).append(i)
+        return groups
+
+    # ---------------- search ----------------
+    def search_batch(self, matrix, k=5, modalities=None):
+        """
+        modalities: None = كل الـ partitions (cross-modal)، نص = partition واحدة،
+        أو قائمة بطول N (كل صف في partition-ه؛ بحث واحد لكل partition).
+        يعيد نفس شكل FaissStore.search_batch: (N قوائم بطول k، مصفوفة (N, k)).
+        """
+        X = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+        n = X.shape[0]
+        ids = [[None] * k for _ in range(n)]
+        D = np.full((n, k), -np.inf, dtype=np.float32)
+        if modalities is None:
+            stores = list(self.partitions.values())
+            if not stores:
+                return ids, D
+            parts = [s.search_batch(X, k) for s in stores]
+            all_ids = [sum((p[0][i] for p in parts), []) for i in range(n)]
+            all_D = np.hstack([p[1] for p in parts])
+            order = np.argsort(-all_D, axis=1, kind="stable")[:, :k]
+            ids = [[all_ids[i][j] for j in order[i]] for i in range(n)]
+            return ids, np.take_along_axis(all_D, order, axis=1)
+        if isinstance(modalities, str):
+            modalities = [modalities] * n
+        for name, rows in self._group(modalities).items():
+            store = self.partition(name, create=False)
+            if store is None:
+                continue
+            p_ids, p_D = store.search_batch(X[rows], k)
+            for r, row_ids in zip(rows, p_ids):
+                ids[r] = row_ids
+            D[rows] = p_D
+        return ids, D
+
+    def range_search(self, matrix, min_sim, modalities=None, limit=None):
+        # نفس اختيار الـ partitions في search_batch؛ النتائج المدموجة مرتبة تنازليًا (أول limit لكل صف)
+        X = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+        n = X.shape[0]
+        ids = [[] for _ in range(n)]
+        sims = [np.empty(0, dtype=np.float32) for _ in range(n)]
+        if modalities is None or isinstance(modalities, str):
+            modalities = [modalities] * n
+        groups = {}
+        for i, m in enumerate(modalities):
+            names = list(self.partitions) if m is None else [self.partition_name(m)]
+            for name in names:
+                groups.setdefault(name, []).append(i)
+        for name, rows in groups.items():
+            store = self.partition(name, create=False)
+            if store is None:
+                continue
+            p_ids, p_sims = store.range_search(X[rows], min_sim, limit=limit)
+            for r, r_ids, r_sims in zip(rows, p_ids, p_sims):
+                ids[r] = ids[r] + r_ids
+                sims[r] = np.concatenate([sims[r], r_sims])
+        for r in range(n):
+            order = np.argsort(-sims[r], kind="stable")[:limit]
+            ids[r] = [ids[r][j] for j in order]
+            sims[r] = sims[r][order]
+        return ids, sims
+
+    def search(self, vector, k=5, modality=None):
+        ids, D = self.search_batch(np.asarray(vector, dtype=np.float32).reshape(1, -1), k, modality)
+        keep = [j for j, pid in enumerate(ids[0]) if pid is not None]
+        return [ids[0][j] for j in keep], D[0, keep].tolist()
+
+    def generation(self, modality=None):
+        # None = كل الـ partitions (البحث العابر يتأثر بأي تعديل)
+        if modality is None:
+            return tuple((name, s.generation) for name, s in sorted(list(self.partitions.items())))
+        store = self.partition(modality, create=False)
+        return None if store is None else store.generation
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        for store in self.partitions.values():
+            store.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    # ---------------- state ----------------
+    def __contains__(self, proto_id):
+        return self.owner(proto_id) is not None
+
+    def __len__(self):
+        return sum(len(s.ids_map) for s in self.partitions.values())
+
+    def live_keys(self):
+        keys = [s.ids_map.live_keys() for s in self.partitions.values()]
+        return np.concatenate(keys) if keys else np.empty(0, dtype="S32")
+
+    @property
+    def ids_loaded(self):
+        return bool(self.partitions) and all(s.ids_loaded for s in self.partitions.values())
+
+    @property
+    def ntotal(self):
+        return sum(s.index.ntotal for s in self.partitions.values())
+
+    @property
+    def compressed(self):
+        return any(s.compressed for s in self.partitions.values())
+
+    def wait_for_migration(self, timeout=None):
+        for store in list(self.partitions.values()):
+            store.wait_for_migration(timeout)
+
+    # ---------------- persistence ----------------
+    def snapshot(self):
+        return {name: store.snapshot() for name, store in list(self.partitions.items())}
+
+    def write_snapshot(self, snap):
+        for name, index in snap.items():
+            self.partitions[name].write_snapshot(index)
+
+    def save(self):
+        self.write_snapshot(self.snapshot())
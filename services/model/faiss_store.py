@@ -1,90 +1,435 @@
 import faiss
 import numpy as np
 import os
-import pickle
 import threading
 import logging
+from .id_map import IdMap
+from .rwlock import RWLock
+from .config import (
+    FAISS_INDEX_TYPE, FAISS_MIGRATE_AT, FAISS_NLIST, FAISS_PQ_M, FAISS_HNSW_M,
+    FAISS_NPROBE, FAISS_EF_SEARCH, FAISS_MMAP,
+)
+
+INDEX_TYPES = ("flat", "sq8", "fp16", "pq", "ivf_flat", "ivf_pq", "hnsw")
+# فهارس تخزن متجهات مضغوطة: التشابه فيها تقريبي ويُعاد ترتيبه بدقة من centroids
+COMPRESSED_TYPES = ("sq8", "fp16", "pq", "ivf_pq")
 
 def normalize(vec):
     v = np.asarray(vec, dtype=np.float32)
     norm = np.linalg.norm(v)
     return (v / norm) if norm > 0 else v
 
+def normalize_rows(mat):
+    m = np.ascontiguousarray(np.atleast_2d(np.asarray(mat, dtype=np.float32)))
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+def build_index(index_type, dim, ntotal=0, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M):
+    """
+    مصنع الفهارس (inner product) حسب النوع المطلوب.
+    IVF يدعم add_with_ids/remove_ids مباشرة فلا يُغلَّف بـ IDMap
+    (IDMap فوق IVF يفسد الـ ids بعد الحذف). فهارس IVF و sq8/pq تحتاج train قبل الإضافة.
+    sq8 = بايت لكل بعد (4x أصغر)، fp16 = 2x أصغر، pq = pq_m بايت لكل متجه.
+    """
+    if index_type == "flat":
+        desc = "IDMap,Flat"
+    elif index_type == "sq8":
+        desc = "IDMap,SQ8"
+    elif index_type == "fp16":
+        desc = "IDMap,SQfp16"
+    elif index_type == "pq":
+        desc = f"IDMap,PQ{pq_subquantizers(dim, pq_m)}"
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or max(1, int(4 * np.sqrt(max(ntotal, 1))))
+        if index_type == "ivf_flat":
+            desc = f"IVF{nlist},Flat"
+        else:
+            desc = f"IVF{nlist},PQ{pq_subquantizers(dim, pq_m)}"
+    elif index_type == "hnsw":
+        desc = f"IDMap,HNSW{hnsw_m},Flat"
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    return faiss.index_factory(dim, desc, faiss.METRIC_INNER_PRODUCT)
+
+def pq_subquantizers(dim, pq_m):
+    # عدد الـ subquantizers يجب أن يقسم البعد
+    return max(d for d in range(1, min(pq_m, dim) + 1) if dim % d == 0)
+
+def index_type_of(index):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return {faiss.ScalarQuantizer.QT_8bit: "sq8", faiss.ScalarQuantizer.QT_fp16: "fp16"}.get(inner.sq.qtype, "sq")
+    if isinstance(inner, faiss.IndexPQ):
+        return "pq"
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat"
+    return type(inner).__name__
+
+def supports_remove(index):
+    # HNSW لا يدعم remove_ids: المتجه يبقى في الرسم البياني
+    return index_type_of(index) != "hnsw"
+
+def index_ids(index):
+    # كل الـ int ids المخزنة فعليًا في الفهرس
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    parts = [
+        faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+        for l in range(ivf.nlist) if invlists.list_size(l)
+    ]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
 class FaissStore:
-    def __init__(self, dim, index_file):
+    def __init__(self, dim, index_file, index_type=FAISS_INDEX_TYPE, migrate_at=FAISS_MIGRATE_AT,
+                 nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M,
+                 mmap=FAISS_MMAP, read_only=False):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
         self.dim = dim
         self.index_file = index_file
-        self.lock = threading.Lock()
-        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
-        self.ids_map = {}  # int64 -> external proto_id
-        self._next_int_id = 1
+        self.index_type = index_type
+        self.migrate_at = migrate_at
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.mmap = mmap
+        # read_only: أدوات تحليل على ملفات الخدمة الحية؛ لا ترحيل ولا إعادة كتابة لـ .ids
+        self.read_only = read_only
+        self._mmapped = False
+        # البحث يأخذ قفل قراءة (يتوازى)، وكل تعديل أو تبديل للفهرس يأخذ قفل كتابة
+        self.lock = RWLock()
+        self.logger = logging.getLogger("FaissStore")
+        self.index = build_index("flat", dim)
         self._ids_file = self.index_file + ".ids"
+        self.ids_map = IdMap(self._ids_file)  # int64 <-> external proto_id
+        self._next_int_id = 1
+        self._migration = None
+        self._migration_failed = False
+        # يرتفع مع كل تعديل للفهرس؛ كاش البحث يقارن به صلاحية نتائجه
+        self.generation = 0
+        self._updated_in_migration = set()
         self._load()
+        self._apply_search_params(self.index)
+        with self.lock:
+            self._maybe_migrate()
+
+    @property
+    def compressed(self):
+        return index_type_of(self.index) in COMPRESSED_TYPES
 
     def _get_next_id(self):
         val = self._next_int_id
         self._next_int_id += 1
         return val
 
+    def _ensure_writable(self):
+        # الفهرس المحمّل بـ mmap للقراءة فقط: يُقرأ كاملًا إلى الذاكرة قبل أول تعديل
+        if self.read_only:
+            raise RuntimeError(f"FaissStore {self.index_file} is read-only")
+        if self._mmapped:
+            self.index = faiss.read_index(self.index_file)
+            self._apply_search_params(self.index)
+            self._mmapped = False
+
     def add(self, vector, proto_id):
+        v = normalize(vector).reshape(1, -1)
         with self.lock:
-            v = normalize(vector).reshape(1, -1)
+            self._ensure_writable()
             int_id = self._get_next_id()
             self.index.add_with_ids(v, np.array([int_id], dtype=np.int64))
-            self.ids_map[int_id] = proto_id
+            self.ids_map.add(int_id, proto_id)
+            self.generation += 1
             self._save_ids()
+            self._maybe_migrate()
 
-    def search(self, vector, k=5):
+    def add_batch(self, vectors, proto_ids):
+        # إضافة دفعة كاملة باستدعاء add_with_ids واحد وحفظ ids مرة واحدة
+        if len(proto_ids) == 0:
+            return
+        X = normalize_rows(vectors)
         with self.lock:
-            v = normalize(vector).reshape(1, -1)
-            D, I = self.index.search(v, k)
-            out_ids = []
-            for int_id in I[0]:
-                if int_id == -1:
-                    continue
-                proto_id = self.ids_map.get(int_id)
-                out_ids.append(proto_id)
-            return out_ids, D[0].tolist()
+            self._ensure_writable()
+            int_ids = np.arange(self._next_int_id, self._next_int_id + len(proto_ids), dtype=np.int64)
+            self._next_int_id += len(proto_ids)
+            self.index.add_with_ids(X, int_ids)
+            self.ids_map.add_many(int_ids, proto_ids)
+            self.generation += 1
+            self._save_ids()
+            self._maybe_migrate()
+
+    def update_batch(self, vectors, proto_ids):
+        """
+        استبدال متجهات protos موجودة بنفس int ids (مزامنة centroids):
+        remove_ids واحد ثم add_with_ids واحد، فلا يتغير ملف .ids.
+        HNSW لا يحذف: الإضافة تكرر الـ id مع كل مزامنة فيكبر الفهرس بلا حد،
+        لذا يبقى فيه المتجه الأول للـ proto (الـ centroid الدقيق يبقى في CentroidStore).
+        """
+        with self.lock:
+            if not supports_remove(self.index):
+                return
+            int_ids = self.ids_map.lookup_many(proto_ids)
+            rows = np.flatnonzero(int_ids > 0)
+            if not len(rows):
+                return
+            self._ensure_writable()
+            int_ids = int_ids[rows]
+            X = normalize_rows(np.asarray(vectors)[rows])
+            self._remove_int_ids(self.index, int_ids)
+            self.index.add_with_ids(X, int_ids)
+            self.generation += 1
+            if self._migration is not None:
+                self._updated_in_migration.update(int_ids.tolist())
+
+    def search(self, vector, k=5):
+        # ids و sims متطابقان: النتائج الفارغة (-1) أو بلا mapping تُسقط من الاثنين
+        ids, D = self.search_batch(np.asarray(vector).reshape(1, -1), k)
+        keep = [j for j, pid in enumerate(ids[0]) if pid is not None]
+        return [ids[0][j] for j in keep], D[0, keep].tolist()
+
+    def search_batch(self, matrix, k=5):
+        """
+        بحث واحد لمصفوفة (N, D). يعيد (ids, sims) حيث ids قائمة من N قوائم
+        بطول k (None مكان -1) و sims مصفوفة (N, k) متطابقة معها.
+        """
+        X = normalize_rows(matrix)
+        with self.lock.read():
+            D, I = self.index.search(X, k)
+            ghosts = self.index.ntotal - len(self.ids_map)
+            if ghosts > 0:
+                D, I = self._skip_ghosts(X, k, D, I, ghosts)
+            return self.ids_map.get_many(I), D
+
+    def _skip_ghosts(self, X, k, D, I, ghosts):
+        """
+        يُستدعى وقفل القراءة مأخوذ. HNSW لا يحذف فتبقى متجهات بلا mapping قد تحتل
+        أفضل k (k=1 في assign يعيد None فيُنشأ proto مكرر): k يتضاعف حتى يجد كل صف
+        k نتائج حية أو يبلغ k + ghosts، ثم تُقدَّم الحية بترتيبها وتُملأ البقية بـ -1.
+        """
+        fetch, limit = k, min(k + ghosts, self.index.ntotal)
+        want = min(k, len(self.ids_map))
+        live = self.ids_map.mapped(I)
+        while fetch < limit and (live.sum(axis=1) < want).any():
+            fetch = min(2 * fetch, limit)
+            D, I = self.index.search(X, fetch)
+            live = self.ids_map.mapped(I)
+        order = np.argsort(~live, axis=1, kind="stable")[:, :k]
+        keep = np.take_along_axis(live, order, axis=1)
+        I = np.where(keep, np.take_along_axis(I, order, axis=1), -1)
+        D = np.where(keep, np.take_along_axis(D, order, axis=1), -np.finfo(np.float32).max).astype(np.float32)
+        return D, I
+
+    def range_search(self, matrix, min_sim, limit=None):
+        """
+        كل المتجهات بتشابه >= min_sim لكل صف. يعيد (ids, sims): N قوائم ids
+        و N مصفوفات sims بنفس الطول، مرتبة تنازليًا (أول limit فقط إن وُجد).
+        الفهارس التي لا تدعم range_search (PQ مثلًا) تُبحث بـ k متضاعف.
+        """
+        X = normalize_rows(matrix)
+        with self.lock.read():
+            try:
+                lims, D, I = self.index.range_search(X, float(min_sim))
+            except RuntimeError:
+                lims, D, I = self._range_by_knn(X, min_sim)
+            ids_flat = self.ids_map.get_many(I)[0] if len(I) else []
+        ids, sims = [], []
+        for q in range(X.shape[0]):
+            seg = range(int(lims[q]), int(lims[q + 1]))
+            keep = [j for j in seg if ids_flat[j] is not None and D[j] >= min_sim]
+            keep.sort(key=lambda j: -D[j])
+            keep = keep[:limit]
+            ids.append([ids_flat[j] for j in keep])
+            sims.append(D[keep].astype(np.float32))
+        return ids, sims
+
+    def _range_by_knn(self, X, min_sim):
+        # يُستدعى وقفل القراءة مأخوذ: k يتضاعف حتى تنزل آخر نتيجة تحت العتبة
+        k = min(64, max(self.index.ntotal, 1))
+        while True:
+            D, I = self.index.search(X, k)
+            if k >= self.index.ntotal or not (D[:, -1] >= min_sim).any():
+                break
+            k = min(2 * k, self.index.ntotal)
+        mask = (I >= 0) & (D >= min_sim)
+        lims = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+        return lims, D[mask], I[mask]
 
     def remove(self, proto_id):
         with self.lock:
-            int_id = None
-            for k, v in self.ids_map.items():
-                if v == proto_id:
-                    int_id = k
-                    break
+            int_id = self.ids_map.pop(proto_id)
             if int_id is not None:
-                faiss_id = np.array([int_id], dtype=np.int64)
-                self.index.remove_ids(faiss_id)
-                del self.ids_map[int_id]
+                self._ensure_writable()
+                self._remove_int_ids(self.index, np.array([int_id], dtype=np.int64))
+                self.generation += 1
                 self._save_ids()
 
+    def remove_batch(self, proto_ids):
+        # remove_ids واحد (مسح واحد للفهرس) وحفظ ids مرة واحدة للدفعة كلها
+        with self.lock:
+            int_ids = self.ids_map.pop_many(proto_ids)
+            if len(int_ids):
+                self._ensure_writable()
+                self._remove_int_ids(self.index, int_ids)
+                self.generation += 1
+                self._save_ids()
+
+    def _remove_int_ids(self, index, int_ids):
+        try:
+            index.remove_ids(int_ids)
+        except RuntimeError:
+            # HNSW لا يدعم الحذف: يبقى المتجه في الفهرس لكن بدون mapping،
+            # و search_batch يتخطاه (_skip_ghosts)
+            pass
+
+    def _apply_search_params(self, index):
+        kind = index_type_of(index)
+        ps = faiss.ParameterSpace()
+        if kind in ("ivf_flat", "ivf_pq"):
+            ps.set_index_parameter(index, "nprobe", self.nprobe)
+        elif kind == "hnsw":
+            ps.set_index_parameter(index, "efSearch", self.ef_search)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        with self.lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            self._apply_search_params(self.index)
+
+    # ---------------- online migration ----------------
+    def _maybe_migrate(self):
+        # يُستدعى والقفل مأخوذ
+        if self._migration is not None or self._migration_failed or self.index_type == "flat" or self.read_only:
+            return
+        if self.index.ntotal < self.migrate_at or index_type_of(self.index) != "flat":
+            return
+        self._migration = threading.Thread(target=self._migrate, name="faiss-migrate", daemon=True)
+        self._migration.start()
+
+    def _migrate(self):
+        """
+        يبني الفهرس الجديد في الخلفية من لقطة للمتجهات الحالية بينما يستمر
+        الفهرس flat في الخدمة، ثم يلحق بالإضافات/الحذوفات الأخيرة ويبدّل ذريًا.
+        """
+        try:
+            with self.lock:
+                snap_ids = faiss.vector_to_array(self.index.id_map).copy()
+                X = self.index.index.reconstruct_n(0, self.index.ntotal)
+            new_index = build_index(self.index_type, self.dim, ntotal=len(snap_ids), nlist=self.nlist, pq_m=self.pq_m)
+            if not new_index.is_trained:
+                new_index.train(X)
+            new_index.add_with_ids(X, snap_ids)
+            del X
+            with self.lock:
+                cur_ids = faiss.vector_to_array(self.index.id_map)
+                added = np.flatnonzero(~np.isin(cur_ids, snap_ids))
+                if len(added):
+                    flat = self.index.index
+                    V = np.vstack([flat.reconstruct(int(pos)) for pos in added])
+                    new_index.add_with_ids(V, cur_ids[added].astype(np.int64))
+                # متجهات حُدّثت أثناء البناء بنفس الـ id تُنسخ من جديد
+                updated = np.array(sorted(self._updated_in_migration), dtype=np.int64)
+                updated = updated[np.isin(updated, snap_ids) & np.isin(updated, cur_ids)]
+                if len(updated) and supports_remove(new_index):
+                    pos = {int(v): i for i, v in enumerate(cur_ids.tolist())}
+                    V = np.vstack([self.index.index.reconstruct(pos[int(u)]) for u in updated])
+                    self._remove_int_ids(new_index, updated)
+                    new_index.add_with_ids(V, updated)
+                removed = snap_ids[~np.isin(snap_ids, cur_ids)]
+                if len(removed):
+                    self._remove_int_ids(new_index, removed.astype(np.int64))
+                self._apply_search_params(new_index)
+                self.index = new_index
+                self.generation += 1
+                self._mmapped = False
+                self.logger.info(f"FAISS index migrated to {self.index_type} (ntotal={new_index.ntotal})")
+        except Exception as e:
+            # لا نعيد المحاولة مع كل إضافة؛ يبقى flat حتى إعادة التشغيل
+            self._migration_failed = True
+            self.logger.error(f"FAISS index migration failed: {e}")
+        finally:
+            with self.lock:
+                self._migration = None
+                self._updated_in_migration = set()
+
+    def wait_for_migration(self, timeout=None):
+        t = self._migration
+        if t is not None:
+            t.join(timeout)
+
     def save(self):
+        self.write_snapshot(self.snapshot())
+
+    def snapshot(self):
+        # نسخة من الفهرس في الذاكرة (قفل قراءة: البحث لا يتوقف)؛ الكتابة إلى القرص تتم خارج القفل
+        with self.lock.read():
+            return faiss.clone_index(self.index)
+
+    def write_snapshot(self, index):
+        if self.read_only:
+            raise RuntimeError(f"FaissStore {self.index_file} is read-only")
+        tmp = self.index_file + ".tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, self.index_file)
         with self.lock:
-            faiss.write_index(self.index, self.index_file)
-            self._save_ids()
+            self.ids_map.next_int_id = max(self.ids_map.next_int_id, self._next_int_id)
+            self.ids_map.compact()
 
     def _save_ids(self):
-        with open(self._ids_file, "wb") as f:
-            pickle.dump({"ids_map": self.ids_map, "next_int_id": self._next_int_id}, f)
+        # إلحاق السجلات الجديدة فقط؛ الضغط الكامل يتم في save()
+        self.ids_map.flush()
+
+    def _read_index(self):
+        if not self.mmap:
+            return faiss.read_index(self.index_file)
+        with open(self.index_file, "rb") as f:
+            fourcc = f.read(4)
+        # IDMap(Flat/HNSW): mmap لبيانات الـ codes؛ IVF: OnDiskInvertedLists
+        ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        flags = ifc if fourcc == b"IxMp" and ifc else faiss.IO_FLAG_MMAP
+        idx = faiss.read_index(self.index_file, flags)
+        self._mmapped = True
+        return idx
 
     def _load(self):
-        logger = logging.getLogger("FaissStore")
+        logger = self.logger
         if os.path.exists(self.index_file):
             try:
-                idx = faiss.read_index(self.index_file)
-                if not isinstance(idx, faiss.IndexIDMap):
+                idx = self._read_index()
+                if not isinstance(idx, (faiss.IndexIDMap, faiss.IndexIVF)):
                     idx = faiss.IndexIDMap(idx)
                 self.index = idx
             except Exception as e:
                 logger.error(f"Could not read FAISS index: {e}")
+        self.ids_loaded = False
         if os.path.exists(self._ids_file):
             try:
-                with open(self._ids_file, "rb") as f:
-                    d = pickle.load(f)
-                    self.ids_map = d.get("ids_map", {})
-                    self._next_int_id = d.get("next_int_id", 1)
+                self.ids_map.load(read_only=self.read_only)
+                self.ids_loaded = True
             except Exception as e:
                 logger.warning(f"Could not load ids_map: {e}")
+                self.ids_map = IdMap(self._ids_file)
         else:
-            logger.warning("No .ids file found; ids_map is empty, index may be unsynchronized.")
\ No newline at end of file
+            logger.warning("No .ids file found; ids_map is empty, index may be unsynchronized.")
+        present = index_ids(self.index)
+        # ids بلا متجه في الفهرس (فهرس أقدم من ملف .ids بعد انقطاع) تُسقط،
+        # ويعيد ProtoMemory إضافتها من الـ WAL (read_only: في الذاكرة فقط)
+        stale = self.ids_map.retain(present)
+        if stale:
+            logger.warning(f"Dropped {stale} ids not present in the FAISS index")
+            if not self.read_only:
+                self.ids_map.compact()
+        self._next_int_id = self.ids_map.next_int_id
+        if len(present):
+            # لا نعيد استخدام int ids موجودة في الفهرس حتى لو فُقد ملف .ids
+            self._next_int_id = max(self._next_int_id, int(present.max()) + 1)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import os
+import pickle
+import logging
+import numpy as np
+
+PROTO_ID_BYTES = 32
+RECORD = np.dtype([("int_id", "<i8"), ("proto_id", f"S{PROTO_ID_BYTES}")])
+MAGIC = b"OMIDMAP1"
+HEADER = len(MAGIC) + 8  # magic + next_int_id (int64)
+
+
+class IdMap:
+    """
+    ربط ثنائي الاتجاه بين int64 (FAISS) و proto_id:
+    - جدول نصوص متصل (S32) مفهرس بالـ int_id مباشرة
+    - فهرس عكسي مضغوط يُبنى عند أول حاجة إليه: proto_ids الحية مرتبة (S32)
+      مع int ids المقابلة ويُبحث فيه بـ np.searchsorted (~40 بايت لكل proto
+      بدل dict بكائنات str و int)، والإضافات اللاحقة في dict صغير حتى إعادة البناء
+    الملف: header ثم سجلات ثابتة الطول تُلحق تدريجيًا (int_id سالب = حذف)،
+    فيمكن قراءته بـ np.memmap ولا تعتمد كلفة الحفظ على حجم الفهرس.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger("IdMap")
+        self._ext = np.zeros(1024, dtype=RECORD["proto_id"])
+        self._rev = None
+        self._rev_new = {}
+        self._count = 0
+        self._pending = []
+        self.next_int_id = 1
+
+    # ---------------- lookups ----------------
+    def get(self, int_id):
+        int_id = int(int_id)
+        if 0 < int_id < len(self._ext):
+            v = self._ext[int_id]
+            if v:
+                return v.decode("utf-8")
+        return None
+
+    def get_many(self, int_ids):
+        # مصفوفة int ids بأي شكل -> قوائم متداخلة بنفس الشكل (None للمفقود)
+        I = np.asarray(int_ids, dtype=np.int64)
+        valid = (I > 0) & (I < len(self._ext))
+        raw = np.where(valid, self._ext[np.where(valid, I, 0)], b"")
+        return [[v.decode("utf-8") if v else None for v in row] for row in np.atleast_2d(raw).tolist()]
+
+    def mapped(self, int_ids):
+        # قناع bool بنفس شكل int_ids: True لكل id له proto حي
+        I = np.asarray(int_ids, dtype=np.int64)
+        valid = (I > 0) & (I < len(self._ext))
+        return valid & (self._ext[np.where(valid, I, 0)] != b"")
+
+    def lookup(self, proto_id):
+        int_id = int(self.lookup_many([proto_id])[0])
+        return int_id if int_id > 0 else None
+
+    def lookup_many(self, proto_ids):
+        # قائمة proto_ids -> مصفوفة int64 (0 للمفقود)
+        enc = [p.encode("utf-8") for p in proto_ids]
+        if not enc:
+            return np.empty(0, dtype=np.int64)
+        # التحويل إلى S32 يقص الأطول بصمت فقد يطابق id آخر: تُستبعد مسبقًا
+        fits = np.array([len(b) <= PROTO_ID_BYTES for b in enc])
+        keys = np.array([b if ok else b"" for b, ok in zip(enc, fits)], dtype=self._ext.dtype)
+        out = self._find(keys)
+        out[~fits] = 0
+        return out
+
+    def __contains__(self, proto_id):
+        return self.lookup(proto_id) is not None
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        live = np.flatnonzero(self._ext[: self.next_int_id])
+        for int_id, v in zip(live.tolist(), self._ext[live].tolist()):
+            yield int_id, v.decode("utf-8")
+
+    def live_keys(self):
+        # كل proto_ids الحية (S32) بدون فك ترميز
+        ext = self._ext[: self.next_int_id]
+        return ext[np.flatnonzero(ext)]
+
+    def _reverse(self):
+        if self._rev is None:
+            live = np.flatnonzero(self._ext[: self.next_int_id])
+            keys = self._ext[live]
+            order = np.argsort(keys)
+            self._rev = (keys[order], live[order])
+            self._rev_new = {}
+        return self._rev
+
+    def _find(self, keys):
+        """
+        مصفوفة S32 -> int ids (0 للمفقود). الحذف لا يلمس الفهرس المرتب:
+        كل مرشح يُتحقق منه مقابل _ext فتُرفض المدخلات التي حُذفت بعد البناء.
+        """
+        sorted_keys, sorted_ids = self._reverse()
+        out = np.zeros(len(keys), dtype=np.int64)
+        if len(sorted_keys):
+            pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+            hit = sorted_keys[pos] == keys
+            out[hit] = sorted_ids[pos[hit]]
+        if self._rev_new:
+            for j, k in enumerate(keys.tolist()):
+                int_id = self._rev_new.get(k)
+                if int_id is not None:
+                    out[j] = int_id
+        found = out > 0
+        found[found] = self._ext[out[found]] == keys[found]
+        out[~found] = 0
+        return out
+
+    # ---------------- mutations ----------------
+    def add(self, int_id, proto_id):
+        self.add_many([int_id], [proto_id])
+
+    def add_many(self, int_ids, proto_ids):
+        int_ids = np.asarray(int_ids, dtype=np.int64)
+        if len(int_ids) == 0:
+            return
+        enc = [p.encode("utf-8") for p in proto_ids]
+        if any(len(b) > PROTO_ID_BYTES for b in enc):
+            raise ValueError(f"proto_id longer than {PROTO_ID_BYTES} bytes")
+        top = int(int_ids.max())
+        self._grow(top + 1)
+        self._ext[int_ids] = enc
+        self._count += len(enc)
+        self.next_int_id = max(self.next_int_id, top + 1)
+        if self._rev is not None:
+            self._rev_new.update(zip(enc, int_ids.tolist()))
+            if len(self._rev_new) > max(1024, len(self._rev[0]) // 16):
+                # إعادة بناء كسولة عند البحث التالي بدل dict يكبر بلا حد
+                self._rev = None
+                self._rev_new = {}
+        rec = np.empty(len(enc), dtype=RECORD)
+        rec["int_id"] = int_ids
+        rec["proto_id"] = enc
+        self._pending.append(rec)
+
+    def pop(self, proto_id):
+        int_ids = self.pop_many([proto_id])
+        return int(int_ids[0]) if len(int_ids) else None
+
+    def pop_many(self, proto_ids):
+        # نسخة دفعية من pop بسجل حذف واحد؛ تعيد int ids ما كان موجودًا فقط
+        int_ids = self.lookup_many(proto_ids)
+        int_ids = np.unique(int_ids[int_ids > 0])
+        if not len(int_ids):
+            return np.empty(0, dtype=np.int64)
+        self._ext[int_ids] = b""
+        self._count -= len(int_ids)
+        rec = np.empty(len(int_ids), dtype=RECORD)
+        rec["int_id"] = -int_ids
+        rec["proto_id"] = b""
+        self._pending.append(rec)
+        return int_ids
+
+    def retain(self, int_ids):
+        # يبقي فقط الـ ids الموجودة في int_ids؛ يعيد عدد ما أُسقط
+        live = np.flatnonzero(self._ext[: self.next_int_id])
+        stale = live[~np.isin(live, int_ids)]
+        if len(stale):
+            self._ext[stale] = b""
+            self._count -= len(stale)
+            self._rev = None
+        return len(stale)
+
+    def _grow(self, size):
+        if size > len(self._ext):
+            cap = max(size, 2 * len(self._ext))
+            ext = np.zeros(cap, dtype=self._ext.dtype)
+            ext[: len(self._ext)] = self._ext
+            self._ext = ext
+
+    # ---------------- persistence ----------------
+    def _write_header(self, f):
+        f.write(MAGIC)
+        f.write(np.int64(self.next_int_id).tobytes())
+
+    def flush(self):
+        # إلحاق السجلات الجديدة فقط
+        if not self._pending:
+            return
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER
+        with open(self.path, "wb" if new_file else "ab") as f:
+            if new_file:
+                self._write_header(f)
+            for rec in self._pending:
+                rec.tofile(f)
+        self._pending = []
+
+    def compact(self):
+        # إعادة كتابة السجلات الحية فقط (عند checkpoint)
+        live = np.flatnonzero(self._ext[: self.next_int_id])
+        rec = np.empty(len(live), dtype=RECORD)
+        rec["int_id"] = live
+        rec["proto_id"] = self._ext[live]
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            self._write_header(f)
+            rec.tofile(f)
+        os.replace(tmp, self.path)
+        self._pending = []
+
+    def load(self, read_only=False):
+        with open(self.path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                f.seek(0)
+                return self._load_legacy(pickle.load(f), read_only)
+            header_next = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+        n = (os.path.getsize(self.path) - HEADER) // RECORD.itemsize
+        rec = np.memmap(self.path, dtype=RECORD, mode="r", offset=HEADER, shape=(n,)) if n else np.empty(0, RECORD)
+        ids = rec["int_id"]
+        adds = ids > 0
+        top = int(np.abs(ids).max()) if n else 0
+        self._ext = np.zeros(max(top + 1, 1024), dtype=RECORD["proto_id"])
+        self._ext[ids[adds]] = rec["proto_id"][adds]
+        self._ext[-ids[~adds]] = b""
+        self._count = int(np.count_nonzero(self._ext))
+        self._rev = None
+        self._rev_new = {}
+        self._pending = []
+        self.next_int_id = max(header_next, top + 1, 1)
+
+    def _load_legacy(self, d, read_only=False):
+        # صيغة pickle القديمة {"ids_map": {...}, "next_int_id": n}: تحويل ثم إعادة كتابة
+        ids_map = d.get("ids_map", {})
+        self.add_many(list(ids_map.keys()), list(ids_map.values()))
+        self.next_int_id = max(self.next_int_id, d.get("next_int_id", 1))
+        self._pending = []
+        if read_only:
+            return
+        self.compact()
+        self.logger.info(f"Converted legacy pickled ids map ({len(ids_map)} entries)")
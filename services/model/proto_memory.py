@@ -1,61 +1,581 @@
 import threading, time, json, os
-from .faiss_store import FaissStore, normalize
-from .config import EMBED_DIM, FAISS_INDEX_FILE, PROTO_META_FILE, FAISS_THRESHOLD
+from .faiss_store import normalize, normalize_rows
+from .faiss_partitions import PartitionedFaissStore
+from .proto_table import ProtoTable
+from .centroid_store import CentroidStore
+from .id_map import IdMap
+from .search_cache import SearchCache, embedding_key
+from .config import (
+    EMBED_DIM, FAISS_INDEX_FILE, PROTO_META_FILE, FAISS_THRESHOLD,
+    PROTO_WAL_COMPACT_EVERY, PROTO_WAL_FSYNC, PROTO_CENTROID_DTYPE, CENTROID_SYNC_EVERY,
+    FAISS_RERANK, PROTO_CROSS_MODAL, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+)
 import numpy as np
-import tempfile
+import logging
+import base64
+
+def encode_vec(vec):
+    return base64.b64encode(np.asarray(vec, dtype=np.float32).tobytes()).decode("ascii")
+
+def decode_vec(v):
+    if isinstance(v, list):
+        return np.asarray(v, dtype=np.float32)
+    return np.frombuffer(base64.b64decode(v), dtype=np.float32)
+
+def proto_number(proto_id):
+    # "p_00042" -> 42؛ غير ذلك -1
+    if proto_id.startswith("p_") and proto_id[2:].isdigit():
+        return int(proto_id[2:])
+    return -1
 
 class ProtoMemory:
-    def __init__(self, dim=EMBED_DIM, index_file=FAISS_INDEX_FILE, meta_file=PROTO_META_FILE, threshold=FAISS_THRESHOLD):
+    BATCH_BLOCK = 1024
+    RANGE_RERANK_MARGIN = 0.05
+
+    def __init__(self, dim=EMBED_DIM, index_file=FAISS_INDEX_FILE, meta_file=PROTO_META_FILE, threshold=FAISS_THRESHOLD,
+                 rerank=FAISS_RERANK, cross_modal=PROTO_CROSS_MODAL):
         self.lock = threading.Lock()
-        self.faiss = FaissStore(dim=dim, index_file=index_file)
+        self.logger = logging.getLogger("ProtoMemory")
+        # فهرس لكل modality؛ cross_modal=True يعيد سلوك المطابقة عبر كل الـ modalities
+        self.faiss = PartitionedFaissStore(dim, index_file)
+        self.centroids = CentroidStore(dim, dtype=PROTO_CENTROID_DTYPE)
         self.meta_file = meta_file
+        self.centroid_file = meta_file + ".centroids.npy"
         self.threshold = threshold
+        self.rerank = rerank
+        self.cross_modal = cross_modal
+        self.search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self.wal_file = meta_file + ".wal"
+        self._ckpt_file = meta_file + ".ckpt"
+        self._ckpt_lock = threading.Lock()
+        self._ckpt_thread = None
+        self._wal = None
+        self._seq = 0
+        self._wal_events = 0
+        self._dirty = set()
+        self._updates_since_sync = 0
+        # عداد رتيب لأرقام protos: len(protos) يتكرر بعد الدمج/الحذف
+        self._next_proto = 0
         self._load_metadata()
 
     def _load_metadata(self):
-        self.protos = {}
-        if os.path.exists(self.meta_file):
-            with open(self.meta_file, "r", encoding="utf-8") as f:
+        """
+        المسار السريع: لقطة checkpoint متسقة (jsonl + .idx.npy + .centroids.npy)
+        تُفتح بـ mmap وتُفك سجلاتها عند الحاجة فقط. غير ذلك (ملفات قديمة فيها
+        centroid كقوائم JSON أو لقطة غير مكتملة) يُقرأ السطر بسطر.
+        """
+        self.protos = ProtoTable()
+        ckpt = {}
+        if os.path.exists(self._ckpt_file):
+            with open(self._ckpt_file, "r", encoding="utf-8") as f:
+                ckpt = json.load(f)
+        if (
+            os.path.exists(self.meta_file)
+            and os.path.exists(ProtoTable.idx_path(self.meta_file))
+            and os.path.exists(self.centroid_file)
+            and os.path.getsize(self.meta_file) == ckpt.get("meta_bytes")
+        ):
+            self.protos.open_snapshot(self.meta_file)
+            self.centroids.load(self.centroid_file)
+        elif os.path.exists(self.meta_file):
+            self._load_jsonl()
+        self._seq = ckpt.get("seq", 0)
+        if "next_proto" in ckpt:
+            self._next_proto = ckpt["next_proto"]
+        else:
+            self._next_proto = 1 + max((proto_number(pid) for pid in self.protos), default=-1)
+        self._split_legacy_index()
+        self._recover()
+
+    def _split_legacy_index(self):
+        """
+        فهرس عام واحد (قبل التقسيم حسب modality) يُقسَّم مرة واحدة: كل proto
+        موجود فيه يُضاف إلى partition الـ modality الخاصة به من centroids الدقيقة،
+        ثم يُحفظ ويُنقل الملف القديم إلى .bak.
+        """
+        legacy = self.faiss.index_file
+        if self.faiss.partitions or not os.path.exists(legacy):
+            return
+        keep = None
+        if os.path.exists(legacy + ".ids"):
+            ids = IdMap(legacy + ".ids")
+            ids.load()
+            keep = set(ids.live_keys().tolist())
+        groups = {}
+        for pid in self.protos:
+            if keep is None or pid.encode("utf-8") in keep:
+                rec = self.protos[pid]
+                groups.setdefault(rec["modality"], ([], []))
+                groups[rec["modality"]][0].append(pid)
+                groups[rec["modality"]][1].append(rec["row"])
+        for modality, (pids, rows) in groups.items():
+            self.faiss.add_batch(self.centroids.get(rows), pids, modality)
+        self.faiss.save()
+        for path in (legacy, legacy + ".ids"):
+            if os.path.exists(path):
+                os.replace(path, path + ".bak")
+        self.logger.info(f"Split legacy FAISS index into {len(groups)} modality partitions")
+
+    def _load_jsonl(self):
+        if os.path.exists(self.centroid_file):
+            self.centroids.load(self.centroid_file)
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            for line in f:
+                obj = json.loads(line)
+                if "centroid" in obj:
+                    obj["row"] = int(self.centroids.append(obj.pop("centroid"))[0])
+                self.protos[obj["proto_id"]] = obj
+
+    # ---------------- WAL ----------------
+    def _recover(self):
+        """
+        يعيد تطبيق ذيل الـ WAL (الأحداث بعد آخر checkpoint) فوق اللقطة.
+        الأحداث تحمل قيمًا مطلقة فإعادة تطبيقها آمنة (idempotent).
+        """
+        replayed = 0
+        if os.path.exists(self.wal_file):
+            good = 0
+            with open(self.wal_file, "rb") as f:
                 for line in f:
-                    obj = json.loads(line)
-                    self.protos[obj["proto_id"]] = obj
+                    try:
+                        ev = json.loads(line)
+                    except ValueError:
+                        ev = None
+                    if ev is None or not line.endswith(b"\n"):
+                        # سطر مبتور من انقطاع أثناء الكتابة: يُقص حتى لا تلتصق به الإلحاقات التالية
+                        self.logger.warning("Truncated WAL record dropped")
+                        break
+                    good += len(line)
+                    self._wal_events += 1
+                    if ev["seq"] <= self._seq:
+                        continue
+                    self._apply(ev)
+                    self._seq = ev["seq"]
+                    replayed += 1
+            if good < os.path.getsize(self.wal_file):
+                with open(self.wal_file, "r+b") as f:
+                    f.truncate(good)
+        # الفهرس هو المرجع: proto بلا متجه (حُذف من FAISS) لا يُحمَّل
+        # (إذا فُقد ملف .ids لا نعرف الربط فلا نحذف شيئًا)
+        missing = []
+        if self.faiss.ids_loaded and len(self.protos) != len(self.faiss):
+            indexed = self.faiss.live_keys()
+            snap = self.protos.snapshot_ids()
+            missing = [k.decode("utf-8") for k in snap[~np.isin(snap, indexed)].tolist()]
+            indexed = set(indexed.tolist())
+            missing += [pid for pid in self.protos._live if pid.encode("utf-8") not in indexed]
+            for pid in missing:
+                if pid in self.protos:
+                    del self.protos[pid]
+        self._sync_centroids()
+        if replayed or missing:
+            self.logger.info(f"Recovered ProtoMemory: replayed {replayed} WAL events, dropped {len(missing)} protos without vectors")
+
+    def _apply(self, ev):
+        op = ev["op"]
+        if op == "add":
+            proto = ev["proto"]
+            vec = decode_vec(ev["vec"])
+            self._next_proto = max(self._next_proto, proto_number(proto["proto_id"]) + 1)
+            if proto["proto_id"] not in self.protos:
+                self.centroids.put(proto["row"], vec)
+                self.protos[proto["proto_id"]] = proto
+            if proto["proto_id"] not in self.faiss:
+                self.faiss.add(vec, proto["proto_id"], proto["modality"])
+        elif op == "assign":
+            proto = self.protos.get(ev["proto_id"])
+            # count في اللقطة >= count الحدث: الحدث مطبق مسبقًا
+            if proto is not None and proto["count"] < ev["count"]:
+                proto["count"] = ev["count"]
+                proto["last_updated"] = ev["last_updated"]
+                if "vec" in ev:
+                    self.centroids.update_means([proto["row"]], decode_vec(ev["vec"])[None], [ev["count"]])
+                    self._dirty.add(proto["proto_id"])
+        elif op == "update":
+            proto = self.protos.get(ev["proto_id"])
+            if proto is not None:
+                proto.update(ev["fields"])
+        elif op == "remove":
+            self.protos.pop(ev["proto_id"], None)
+            self.faiss.remove(ev["proto_id"])
+        elif op == "merge":
+            proto = self.protos.get(ev["into"])
+            if proto is not None and proto["count"] < ev["count"]:
+                proto["count"] = ev["count"]
+                proto["last_updated"] = ev["last_updated"]
+                self.centroids.set([proto["row"]], decode_vec(ev["vec"])[None])
+                self._dirty.add(ev["into"])
+            for pid in ev["from"]:
+                self.protos.pop(pid, None)
+            self.faiss.remove_batch(ev["from"])
+
+    def _log(self, events):
+        # يُستدعى والقفل مأخوذ؛ كتابة واحدة لكل دفعة أحداث
+        if not events:
+            return
+        if self._wal is None:
+            d = os.path.dirname(self.wal_file)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._wal = open(self.wal_file, "a", encoding="utf-8")
+        lines = []
+        for ev in events:
+            self._seq += 1
+            ev["seq"] = self._seq
+            lines.append(json.dumps(ev, ensure_ascii=False))
+        self._wal.write("\n".join(lines) + "\n")
+        self._wal.flush()
+        if PROTO_WAL_FSYNC:
+            os.fsync(self._wal.fileno())
+        self._wal_events += len(events)
+        if self._wal_events >= PROTO_WAL_COMPACT_EVERY and self._ckpt_thread is None:
+            self._ckpt_thread = threading.Thread(target=self._background_checkpoint, daemon=True)
+            self._ckpt_thread.start()
+
+    def _background_checkpoint(self):
+        try:
+            self.checkpoint()
+        except Exception:
+            self.logger.exception("Background checkpoint failed")
+        finally:
+            self._ckpt_thread = None
+
+    def _assign_event(self, proto, vec):
+        return {
+            "op": "assign", "proto_id": proto["proto_id"], "count": proto["count"],
+            "last_updated": proto["last_updated"], "vec": encode_vec(vec),
+        }
+
+    def _add_event(self, proto, vec):
+        return {"op": "add", "proto": dict(proto), "vec": encode_vec(vec)}
+
+    def _mark_dirty(self, proto_ids, n_updates):
+        # centroids تغيرت: تُزامن متجهات FAISS دفعةً واحدة كل CENTROID_SYNC_EVERY تحديث
+        self._dirty.update(proto_ids)
+        self._updates_since_sync += n_updates
+        if self._updates_since_sync >= CENTROID_SYNC_EVERY:
+            self._sync_centroids()
+
+    def _sync_centroids(self):
+        # يُستدعى والقفل مأخوذ
+        if not self._dirty:
+            return
+        pids = [pid for pid in self._dirty if pid in self.protos]
+        rows = [self.protos.row_of(pid) for pid in pids]
+        self.faiss.update_batch(self.centroids.get(rows), pids)
+        self._dirty.clear()
+        self._updates_since_sync = 0
+
+    def _new_proto_id(self):
+        pid = f"p_{self._next_proto:05d}"
+        self._next_proto += 1
+        return pid
 
-    def assign(self, embedding, modality, meta=None):
+    def _scope(self, modalities, cross_modal):
+        # None = البحث في كل الـ partitions
+        cross_modal = self.cross_modal if cross_modal is None else cross_modal
+        return None if cross_modal else modalities
+
+    def assign(self, embedding, modality, meta=None, cross_modal=None):
         embedding = normalize(embedding)
         with self.lock:
-            proto_ids, sims = self.faiss.search(embedding, k=1)
+            ids, sims = self._search_batch(embedding[None], k=1, modalities=self._scope(modality, cross_modal))
             proto_id = None
-            if proto_ids and sims and sims[0] is not None and sims[0] >= self.threshold and proto_ids[0]:
-                proto_id = proto_ids[0]
-                self.protos[proto_id]["count"] += 1
-                self.protos[proto_id]["last_updated"] = time.time()
+            if ids[0][0] is not None and sims[0, 0] >= self.threshold:
+                proto_id = ids[0][0]
+                proto = self.protos[proto_id]
+                proto["count"] += 1
+                proto["last_updated"] = time.time()
+                self.centroids.update_means([proto["row"]], embedding[None], [proto["count"]])
+                self._log([self._assign_event(proto, embedding)])
+                self._mark_dirty([proto_id], 1)
             else:
-                proto_id = f"p_{len(self.protos):05d}"
-                self.faiss.add(embedding, proto_id)
+                proto_id = self._new_proto_id()
+                self.faiss.add(embedding, proto_id, modality)
                 self.protos[proto_id] = {
                     "proto_id": proto_id,
-                    "centroid": embedding.tolist(),
+                    "row": int(self.centroids.append(embedding)[0]),
                     "modality": modality,
                     "count": 1,
                     "meta": meta,
                     "last_updated": time.time(),
                 }
+                self._log([self._add_event(self.protos[proto_id], embedding)])
             return proto_id
 
-    def search(self, embedding, k=5):
-        embedding = normalize(embedding)
+    def assign_batch(self, matrix, modalities, metas=None, cross_modal=None):
+        """
+        نسخة دفعية من assign: تطبيع المصفوفة (N, D) مرة واحدة، بحث FAISS واحد
+        لكل modality، ثم إضافة الـ protos الجديدة باستدعاء add_with_ids واحد لكل modality.
+        كل متجه يذهب إلى الأقرب بين أفضل مطابقة في الفهرس والـ protos الجديدة التي أنشأتها
+        الدفعة قبله (نفس نتيجة assign بالتتابع)، و centroids تُحدَّث بمتوسط تراكمي متجه واحد للدفعة كلها.
+        """
+        X = normalize_rows(matrix)
+        n = X.shape[0]
+        if isinstance(modalities, str):
+            modalities = [modalities] * n
+        metas = metas if metas is not None else [None] * n
+        if len(modalities) != n or len(metas) != n:
+            raise ValueError("modalities/metas length must match number of embeddings")
+        if n == 0:
+            return []
+        scope = self._scope(modalities, cross_modal)
+        # داخل الدفعة: لا يُدمج متجهان من modalities مختلفة إلا في الوضع العابر
+        mods = None if scope is None else np.array([self.faiss.partition_name(m) for m in modalities])
         with self.lock:
-            return self.faiss.search(embedding, k=k)
+            ids, sims = self._search_batch(X, k=1, modalities=scope)
+            now = time.time()
+            out = [None] * n
+            events = [None] * n
+            # أفضل مطابقة في الفهرس لكل متجه (قبل الدفعة)؛ القرار النهائي بعد مقارنتها بالـ protos
+            # الجديدة التي أنشأتها الدفعة قبله، فالنتيجة نفس assign بالتتابع
+            index_pid = [ids[i][0] if ids[i][0] is not None and ids[i][0] in self.protos else None for i in range(n)]
+            index_sim = np.where([pid is not None for pid in index_pid], sims[:, 0], -np.inf)
 
-    def _dump_all(self):
-        # Write all proto metadata atomically
-        tmp = self.meta_file + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            for proto in self.protos.values():
-                f.write(json.dumps(proto, ensure_ascii=False) + "\n")
-        os.replace(tmp, self.meta_file)
+            # كل متجه يُقارن بالـ protos الجديدة التي أُنشئت قبله، على كتل بضرب مصفوفات
+            reps = np.empty((n, X.shape[1]), dtype=np.float32)
+            new_ids = []
+            new_mods = None if mods is None else np.empty(n, dtype=mods.dtype)
+            first_row = len(self.centroids)
+            for start in range(0, n, self.BATCH_BLOCK):
+                block = list(range(start, min(start + self.BATCH_BLOCK, n)))
+                B = X[block]
+                n_prev = len(new_ids)
+                if n_prev:
+                    S_prev = B @ reps[:n_prev].T
+                    if mods is not None:
+                        S_prev[mods[block][:, None] != new_mods[None, :n_prev]] = -np.inf
+                    best_prev = S_prev.argmax(axis=1)
+                    best_prev_sim = S_prev[np.arange(len(block)), best_prev]
+                S_in = B @ B.T
+                if mods is not None:
+                    S_in[mods[block][:, None] != mods[block][None, :]] = -np.inf
+                created = []  # مواقع داخل الكتلة أصبحت protos جديدة
+                for bi, i in enumerate(block):
+                    best_pid, best_sim = index_pid[i], index_sim[i]
+                    if n_prev and best_prev_sim[bi] > best_sim:
+                        best_pid, best_sim = new_ids[best_prev[bi]], best_prev_sim[bi]
+                    if created:
+                        row = S_in[bi, created]
+                        j = int(row.argmax())
+                        if row[j] > best_sim:
+                            best_pid, best_sim = new_ids[n_prev + j], row[j]
+                    if best_pid is not None and best_sim >= self.threshold:
+                        proto = self.protos[best_pid]
+                        proto["count"] += 1
+                        proto["last_updated"] = now
+                        out[i] = best_pid
+                        events[i] = self._assign_event(proto, X[i])
+                        continue
+                    pid = self._new_proto_id()
+                    reps[len(new_ids)] = X[i]
+                    if new_mods is not None:
+                        new_mods[len(new_ids)] = mods[i]
+                    new_ids.append(pid)
+                    created.append(bi)
+                    self.protos[pid] = {
+                        "proto_id": pid,
+                        "row": first_row + len(new_ids) - 1,
+                        "modality": modalities[i],
+                        "count": 1,
+                        "meta": metas[i],
+                        "last_updated": now,
+                    }
+                    out[i] = pid
+                    events[i] = self._add_event(self.protos[pid], X[i])
+            # centroids قبل FAISS: أي قارئ يجد الـ id الجديد يجد صفه
+            self.centroids.append(reps[:len(new_ids)])
+            self.faiss.add_batch(reps[:len(new_ids)], new_ids, [self.protos[pid]["modality"] for pid in new_ids])
+            rows = [self.protos.row_of(pid) for pid in out]
+            self.centroids.update_means(rows, X, [self.protos[pid]["count"] for pid in out])
+            self._log(events)
+            self._mark_dirty({pid for pid in out if self.protos[pid]["count"] > 1}, n - len(new_ids))
+            return out
 
-    def checkpoint(self):
+    def _search_batch(self, X, k, modalities=None):
+        """
+        البحث عبر كاش النتائج: الصفوف المكررة (نفس المتجه المطبَّع، نفس k و partition)
+        لا تلمس FAISS ما دام الـ generation لم يتغير؛ الباقي بحث واحد.
+        """
+        if not self.search_cache.enabled:
+            return self._search_uncached(X, k, modalities)
+        n = X.shape[0]
+        scopes = modalities if isinstance(modalities, list) else [modalities] * n
+        ids = [None] * n
+        sims = np.empty((n, k), dtype=np.float32)
+        keys, gens, miss = [], [], []
+        for i in range(n):
+            key = (embedding_key(X[i]), k, scopes[i])
+            gen = self.faiss.generation(scopes[i])
+            hit = self.search_cache.get(key, gen)
+            if hit is None:
+                miss.append(i)
+                keys.append(key)
+                gens.append(gen)
+            else:
+                ids[i], sims[i] = hit
+        if miss:
+            m_scope = [scopes[i] for i in miss] if isinstance(modalities, list) else modalities
+            m_ids, m_sims = self._search_uncached(X[miss], k, m_scope)
+            for j, i in enumerate(miss):
+                ids[i], sims[i] = m_ids[j], m_sims[j]
+                self.search_cache.put(keys[j], gens[j], (m_ids[j], m_sims[j].copy()))
+        return ids, sims
+
+    def _search_uncached(self, X, k, modalities=None):
+        """
+        search_batch مع إعادة ترتيب دقيقة في الفهارس المضغوطة: أفضل max(k, rerank)
+        مرشحًا تُعاد مقارنتها بالـ centroids الدقيقة (float32)، فالتشابه المعاد
+        cosine حقيقي وعتبة FAISS_THRESHOLD تحتفظ بنفس معناها في كل الأنواع.
+        """
+        if not self.rerank or not self.faiss.compressed:
+            return self.faiss.search_batch(X, k=k, modalities=modalities)
+        ids, _ = self.faiss.search_batch(X, k=max(k, self.rerank), modalities=modalities)
+        # البحث خارج القفل: proto دُمج بعد البحث يعيد row_of = None فيُعامل كخانة فارغة
+        rows = [[self.protos.row_of(pid) if pid is not None else None for pid in row] for row in ids]
+        cand = np.array([[-1 if r is None else r for r in row] for row in rows], dtype=np.int64)
+        valid = cand >= 0
+        C = normalize_rows(self.centroids.get(cand[valid]))
+        sims = np.full(cand.shape, -np.inf, dtype=np.float32)
+        sims[valid] = np.einsum("ij,ij->i", C, np.repeat(X, cand.shape[1], axis=0)[valid.ravel()])
+        order = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+        out_ids = [[row[j] if np.isfinite(s[j]) else None for j in o] for row, s, o in zip(ids, sims, order)]
+        return out_ids, np.take_along_axis(sims, order, axis=1)
+
+    def search(self, embedding, k=5, modality=None):
+        """
+        modality=None: بحث عابر لكل الـ modalities (cross-modal)؛ غير ذلك
+        partition تلك الـ modality فقط.
+        قراءة فقط: لا تأخذ قفل ProtoMemory، فتتوازى عمليات البحث مع بعضها
+        (قفل القراءة في FaissStore يكفي لحمايتها من تعديلات الفهرس).
+        """
+        ids, sims = self.search_batch(np.asarray(embedding, dtype=np.float32)[None], k, modality=modality)
+        return ids[0], sims[0].tolist()
+
+    def search_batch(self, matrix, k=5, modality=None):
+        """
+        أفضل k لكل صف من (N, D). modality: None (عابر)، نص، أو قائمة بطول N.
+        يعيد (ids, sims): N قوائم و N مصفوفات float32 بنفس الطول (بدون خانات فارغة).
+        """
+        ids, sims = self._search_batch(normalize_rows(matrix), k, modalities=modality)
+        out_ids, out_sims = [], []
+        for row, row_sims in zip(ids, sims):
+            keep = [j for j, pid in enumerate(row) if pid is not None]
+            out_ids.append([row[j] for j in keep])
+            out_sims.append(row_sims[keep])
+        return out_ids, out_sims
+
+    def range_search(self, matrix, min_sim, modality=None, limit=None):
+        """
+        كل الـ protos بتشابه >= min_sim لكل صف، بنفس شكل search_batch (أفضل limit فقط إن وُجد).
+        في الفهارس المضغوطة: مرشحون بهامش RANGE_RERANK_MARGIN ثم تصفية بالتشابه الدقيق.
+        """
+        X = normalize_rows(matrix)
+        if not self.rerank or not self.faiss.compressed:
+            return self.faiss.range_search(X, min_sim, modalities=modality, limit=limit)
+        cand = None if limit is None else max(limit, self.rerank)
+        ids, _ = self.faiss.range_search(X, min_sim - self.RANGE_RERANK_MARGIN, modalities=modality, limit=cand)
+        out_ids, out_sims = [], []
+        for x, row in zip(X, ids):
+            rows = [self.protos.row_of(pid) for pid in row]
+            ok = [j for j, r in enumerate(rows) if r is not None]
+            sims = normalize_rows(self.centroids.get([rows[j] for j in ok])) @ x if ok else np.empty(0, np.float32)
+            order = [j for j in np.argsort(-sims, kind="stable") if sims[j] >= min_sim][:limit]
+            out_ids.append([row[ok[j]] for j in order])
+            out_sims.append(sims[order].astype(np.float32))
+        return out_ids, out_sims
+
+    def update(self, proto_id, **fields):
+        with self.lock:
+            self.protos[proto_id].update(fields)
+            self._log([{"op": "update", "proto_id": proto_id, "fields": fields}])
+
+    def merge(self, groups):
+        """
+        دمج مجموعات protos متقاربة: في كل مجموعة يبقى الأكبر count، و centroid-ه
+        يصبح المتوسط الموزون بالـ counts، والباقي يُحذف من الجدول و FAISS.
+        يعيد {proto_id المدموج: proto_id الباقي}.
+        """
+        mapping = {}
+        events = []
+        removed = []
         with self.lock:
-            self.faiss.save()
-            self._dump_all()
\ No newline at end of file
+            now = time.time()
+            for group in groups:
+                group = [pid for pid in dict.fromkeys(group) if pid in self.protos]
+                if len(group) < 2:
+                    continue
+                group.sort(key=lambda pid: (-self.protos[pid]["count"], pid))
+                recs = [self.protos[pid] for pid in group]
+                counts = np.array([r["count"] for r in recs], dtype=np.float64)
+                C = self.centroids.get([r["row"] for r in recs])
+                mean = (C * counts[:, None]).sum(axis=0) / counts.sum()
+                keep, rec = group[0], recs[0]
+                rec["count"] = int(counts.sum())
+                rec["last_updated"] = now
+                self.centroids.set([rec["row"]], mean[None])
+                for pid in group[1:]:
+                    del self.protos[pid]
+                    self._dirty.discard(pid)
+                    mapping[pid] = keep
+                removed.extend(group[1:])
+                self._dirty.add(keep)
+                events.append({
+                    "op": "merge", "into": keep, "from": group[1:], "count": rec["count"],
+                    "last_updated": now, "vec": encode_vec(mean),
+                })
+            # remove_ids يمسح الفهرس كله: استدعاء واحد لكل partition بدل واحد لكل proto
+            self.faiss.remove_batch(removed)
+            self._log(events)
+            self._sync_centroids()
+        return mapping
+
+    def checkpoint(self):
+        """
+        لقطة تحت القفل (نسخ في الذاكرة فقط)، ثم الكتابة إلى القرص بدون قفل
+        مسار assign، ثم ضغط الـ WAL إلى الأحداث التي جاءت بعد اللقطة.
+        """
+        with self._ckpt_lock:
+            with self.lock:
+                self._sync_centroids()
+                seq = self._seq
+                wal_pos = self._wal.tell() if self._wal is not None else 0
+                frozen = self.protos.freeze()
+                n_protos = len(self.protos)
+                n_rows = len(self.centroids)
+                next_proto = self._next_proto
+                index = self.faiss.snapshot()
+                # assign المتزامن يعدّل الصفوف في مكانها: تُكتب بقيمها عند seq
+                self.centroids.freeze()
+            d = os.path.dirname(self.meta_file)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            try:
+                self.faiss.write_snapshot(index)
+                self.centroids.write(self.centroid_file, n_rows, lock=self.lock)
+            finally:
+                with self.lock:
+                    self.centroids.thaw()
+            meta_bytes = ProtoTable.write_snapshot(self.meta_file, frozen)
+            tmp = self._ckpt_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"seq": seq, "ts": time.time(), "protos": n_protos, "rows": n_rows, "meta_bytes": meta_bytes,
+                           "next_proto": next_proto}, f)
+            os.replace(tmp, self._ckpt_file)
+            with self.lock:
+                self._compact_wal(wal_pos)
+
+    def _compact_wal(self, pos):
+        # يُستدعى والقفل مأخوذ: إبقاء ما بعد pos فقط
+        if self._wal is None:
+            return
+        self._wal.close()
+        with open(self.wal_file, "rb") as src:
+            src.seek(pos)
+            tail = src.read()
+        tmp = self.wal_file + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(tail)
+        os.replace(tmp, self.wal_file)
+        self._wal = open(self.wal_file, "a", encoding="utf-8")
+        self._wal_events = tail.count(b"\n")
\ No newline at end of file
@@ -0,0 +1,104 @@
+import time
+import logging
+import numpy as np
+from .faiss_store import normalize_rows
+from .config import (
+    PROTO_MERGE_THRESHOLD, PROTO_MERGE_K, PROTO_MERGE_CHUNK, PROTO_MERGE_PAUSE, PROTO_MERGE_APPLY_BATCH,
+)
+
+
+class ProtoMerger:
+    """
+    صيانة دورية: self-join بـ kNN على كل partition (modality) على دفعات،
+    ثم دمج العناقيد التي يتجاوز تشابهها merge threshold في ProtoMemory
+    وتحديث proto_refs ومتجهات المفاهيم في ConceptGraph.
+    المسح يأخذ قفل القراءة في FAISS فقط؛ الدمج يأخذ قفل ProtoMemory لدفعات صغيرة
+    مع توقف بينها حتى لا يجوع مسار assign.
+    """
+
+    def __init__(self, pm, cg=None, threshold=PROTO_MERGE_THRESHOLD, k=PROTO_MERGE_K,
+                 chunk=PROTO_MERGE_CHUNK, pause=PROTO_MERGE_PAUSE, apply_batch=PROTO_MERGE_APPLY_BATCH):
+        self.pm = pm
+        self.cg = cg
+        self.threshold = threshold
+        self.k = k
+        self.chunk = chunk
+        self.pause = pause
+        self.apply_batch = apply_batch
+        self.logger = logging.getLogger("ProtoMerger")
+
+    def _vectors(self, pids):
+        # centroids الدقيقة (قد يكون الـ proto قد حُذف منذ بدء المسح)
+        rows = [self.pm.protos.row_of(pid) for pid in pids]
+        ok = [i for i, r in enumerate(rows) if r is not None]
+        V = normalize_rows(self.pm.centroids.get([rows[i] for i in ok])) if ok else np.empty((0, self.pm.faiss.dim), np.float32)
+        return [pids[i] for i in ok], V
+
+    def candidate_pairs(self, store):
+        """
+        self-join على partition واحدة: بحث k+1 لكل proto على دفعات، ثم تحقق
+        بالتشابه الدقيق بين centroids (الفهارس المضغوطة تقريبية). يعيد [(sim, a, b)].
+        """
+        all_ids = [k.decode("utf-8") for k in store.ids_map.live_keys().tolist()]
+        pairs = {}
+        for start in range(0, len(all_ids), self.chunk):
+            pids, V = self._vectors(all_ids[start:start + self.chunk])
+            if not pids:
+                continue
+            ids, _ = store.search_batch(V, self.k + 1)
+            cand = [(i, o) for i, row in enumerate(ids) for o in row if o is not None and o != pids[i]]
+            if cand:
+                others, W = self._vectors([o for _, o in cand])
+                pos = {o: j for j, o in enumerate(others)}
+                for i, o in cand:
+                    j = pos.get(o)
+                    if j is None:
+                        continue
+                    sim = float(V[i] @ W[j])
+                    if sim >= self.threshold:
+                        pairs[tuple(sorted((pids[i], o)))] = sim
+            if self.pause:
+                time.sleep(self.pause)
+        return [(sim, a, b) for (a, b), sim in pairs.items()]
+
+    def clusters(self, pairs):
+        """
+        تجميع جشع بالأعلى تشابهًا أولًا: كل عنقود له قائد، ولا ينضم proto إلا إذا
+        تجاوز تشابهه مع القائد العتبة (يمنع سلاسل single-linkage الطويلة).
+        """
+        leader, members = {}, {}
+        for sim, a, b in sorted(pairs, reverse=True):
+            la, lb = leader.get(a), leader.get(b)
+            if la is not None and lb is not None:
+                continue
+            if la is None and lb is None:
+                leader[a] = leader[b] = a
+                members[a] = [a, b]
+                continue
+            lead, x = (la, b) if la is not None else (lb, a)
+            _, V = self._vectors([lead, x])
+            if len(V) == 2 and float(V[0] @ V[1]) >= self.threshold:
+                leader[x] = lead
+                members[lead].append(x)
+        return list(members.values())
+
+    def run_once(self):
+        stats = {"scanned": 0, "clusters": 0, "merged": 0, "concepts_updated": 0}
+        mapping = {}
+        for name, store in list(self.pm.faiss.partitions.items()):
+            stats["scanned"] += len(store.ids_map)
+            groups = self.clusters(self.candidate_pairs(store))
+            stats["clusters"] += len(groups)
+            for start in range(0, len(groups), self.apply_batch):
+                mapping.update(self.pm.merge(groups[start:start + self.apply_batch]))
+                if self.pause:
+                    time.sleep(self.pause)
+        stats["merged"] = len(mapping)
+        if self.cg is not None:
+            stats["concepts_updated"] = self.cg.remap_protos(mapping)
+            # متجهات المفاهيم التي تغيّر أعضاؤها = متوسط centroids الـ protos الباقية
+            if mapping:
+                keep = {self.cg.concept_of(pid) for pid in set(mapping.values())} - {None}
+                self.cg.embed_from_protos(self.pm, sorted(keep))
+        self.logger.info(f"Proto merge pass: {stats}")
+        return stats
@@ -0,0 +1,161 @@
+import os
+import json
+import mmap
+import numpy as np
+from collections.abc import MutableMapping
+
+IDX_DTYPE = np.dtype([("proto_id", "S32"), ("offset", "<i8"), ("row", "<i8")])
+
+
+class ProtoTable(MutableMapping):
+    """
+    proto_id -> metadata dict يُفك ترميزه عند أول وصول فقط.
+    اللقطة على القرص: protos.jsonl (mmap) + فهرس .idx.npy مرتب حسب proto_id
+    (offset السطر و row الـ centroid)، فالإقلاع لا يقرأ السطور نفسها.
+    السجلات المعدلة/الجديدة تعيش في _live وتطغى على اللقطة.
+    """
+
+    def __init__(self):
+        self._live = {}
+        self._deleted = set()
+        self._mm = None
+        self._idx = np.empty(0, dtype=IDX_DTYPE)
+        self._n = 0
+
+    @staticmethod
+    def idx_path(meta_file):
+        return meta_file + ".idx.npy"
+
+    def open_snapshot(self, meta_file):
+        self._idx = np.load(self.idx_path(meta_file), mmap_mode="r")
+        if len(self._idx):
+            with open(meta_file, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._n = len(self._idx)
+
+    # ---------------- snapshot lookups ----------------
+    def _find(self, proto_id):
+        if not len(self._idx):
+            return -1
+        key = proto_id.encode("utf-8")
+        pos = int(np.searchsorted(self._idx["proto_id"], key))
+        if pos < len(self._idx) and self._idx["proto_id"][pos] == key:
+            return pos
+        return -1
+
+    def _raw(self, pos):
+        start = int(self._idx["offset"][pos])
+        end = self._mm.find(b"\n", start)
+        return self._mm[start:end if end != -1 else len(self._mm)]
+
+    def in_snapshot(self, proto_id):
+        return proto_id not in self._deleted and self._find(proto_id) >= 0
+
+    def row_of(self, proto_id):
+        rec = self._live.get(proto_id)
+        if rec is not None:
+            return rec["row"]
+        if proto_id in self._deleted:
+            return None
+        pos = self._find(proto_id)
+        return int(self._idx["row"][pos]) if pos >= 0 else None
+
+    def snapshot_ids(self):
+        # كل proto_ids اللقطة (S32) بدون فك ترميز السجلات
+        return self._idx["proto_id"]
+
+    def snapshot_rows(self, keys):
+        """
+        rows الـ centroids لمصفوفة proto_ids (S32) من فهرس اللقطة مباشرة
+        (بحث ثنائي متجه)؛ -1 لما ليس في اللقطة. لا تشمل تعديلات _live.
+        """
+        keys = np.asarray(keys, dtype=IDX_DTYPE["proto_id"])
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self._idx) or not len(keys):
+            return rows
+        pos = np.minimum(np.searchsorted(self._idx["proto_id"], keys), len(self._idx) - 1)
+        found = self._idx["proto_id"][pos] == keys
+        rows[found] = self._idx["row"][pos[found]]
+        return rows
+
+    # ---------------- mapping API ----------------
+    def __getitem__(self, proto_id):
+        rec = self._live.get(proto_id)
+        if rec is not None:
+            return rec
+        if proto_id not in self._deleted:
+            pos = self._find(proto_id)
+            if pos >= 0:
+                rec = json.loads(self._raw(pos))
+                self._live[proto_id] = rec
+                return rec
+        raise KeyError(proto_id)
+
+    def __setitem__(self, proto_id, rec):
+        if proto_id not in self:
+            self._n += 1
+        self._deleted.discard(proto_id)
+        self._live[proto_id] = rec
+
+    def __delitem__(self, proto_id):
+        if proto_id not in self:
+            raise KeyError(proto_id)
+        self._live.pop(proto_id, None)
+        if self._find(proto_id) >= 0:
+            self._deleted.add(proto_id)
+        self._n -= 1
+
+    def __contains__(self, proto_id):
+        return proto_id in self._live or self.in_snapshot(proto_id)
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        yield from list(self._live)
+        for key in self._idx["proto_id"].tolist():
+            pid = key.decode("utf-8")
+            if pid not in self._live and pid not in self._deleted:
+                yield pid
+
+    # ---------------- persistence ----------------
+    def freeze(self):
+        """
+        نسخة ثابتة للكتابة (تحت القفل): السجلات الحية تُنسخ سطحيًا،
+        وسجلات اللقطة غير المفكوكة تُمرر كبايتات خام بدون json.
+        """
+        live = {pid: dict(rec) for pid, rec in self._live.items()}
+        return live, set(self._deleted), self._idx, self._mm
+
+    @staticmethod
+    def write_snapshot(meta_file, frozen):
+        live, deleted, idx, mm = frozen
+        keys, offsets, rows = [], [], []
+        tmp = meta_file + ".tmp"
+        with open(tmp, "wb") as f:
+            for pid, rec in live.items():
+                keys.append(pid.encode("utf-8"))
+                offsets.append(f.tell())
+                rows.append(rec["row"])
+                f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+            for pos, key in enumerate(idx["proto_id"].tolist()):
+                pid = key.decode("utf-8")
+                if pid in live or pid in deleted:
+                    continue
+                start = int(idx["offset"][pos])
+                end = mm.find(b"\n", start)
+                keys.append(key)
+                offsets.append(f.tell())
+                rows.append(int(idx["row"][pos]))
+                f.write(mm[start:end if end != -1 else len(mm)] + b"\n")
+            size = f.tell()
+        new_idx = np.empty(len(keys), dtype=IDX_DTYPE)
+        new_idx["proto_id"] = keys
+        new_idx["offset"] = offsets
+        new_idx["row"] = rows
+        new_idx.sort(order="proto_id")
+        idx_tmp = meta_file + ".idx.tmp.npy"
+        np.save(idx_tmp, new_idx)
+        os.replace(tmp, meta_file)
+        os.replace(idx_tmp, ProtoTable.idx_path(meta_file))
+        return size
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class RequestBatcher:
+    """
+    تجميع ديناميكي للطلبات الفردية المتزامنة (threads الـ API): تنتظر في طابور حتى
+    max_batch عنصر أو max_wait_ms من أقدم طلب، ثم handler(payloads) مرة واحدة يعيد
+    نتيجة لكل عنصر بنفس الترتيب (نتيجة من نوع Exception تُرفع لطالبها فقط).
+    thread واحد ينفّذ الدفعات بالتتابع، فالطلبات التي تصل أثناء دفعة تُجمع للتالية
+    ويكبر حجم الدفعة مع الضغط بينما يبقى الانتظار محدودًا. max_batch <= 1 = استدعاء مباشر.
+    """
+
+    WAIT_WINDOW = 4096  # آخر N قيمة انتظار لحساب p50/p99
+
+    def __init__(self, handler, max_batch=64, max_wait_ms=2.0, name="RequestBatcher"):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.logger = logging.getLogger(name)
+        self._cond = threading.Condition()
+        self._pending = deque()  # (payload, future, وقت الوصول)
+        self._thread = None
+        self._closed = False
+        self._waits = deque(maxlen=self.WAIT_WINDOW)
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+        self.errors = 0
+
+    def submit(self, payload):
+        fut = Future()
+        if self.max_batch <= 1:
+            self._run([(payload, fut, time.monotonic())])
+            return fut
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name=self.name)
+                self._thread.start()
+            self._pending.append((payload, fut, time.monotonic()))
+            self._cond.notify()
+        return fut
+
+    def __call__(self, payload):
+        return self.submit(payload).result()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            n = min(len(self._pending), self.max_batch)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._run(batch)
+
+    def _run(self, batch):
+        start = time.monotonic()
+        try:
+            results = self.handler([req[0] for req in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name} handler returned {len(results)} results for {len(batch)} requests")
+        except Exception as e:
+            self.logger.exception(f"{self.name} batch of {len(batch)} failed")
+            self.errors += 1
+            results = [e] * len(batch)
+        self.batches += 1
+        self.items += len(batch)
+        self.max_seen = max(self.max_seen, len(batch))
+        self._waits.extend(start - req[2] for req in batch)
+        for (_, fut, _), res in zip(batch, results):
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def pct(q):
+            return 1000.0 * waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "queued": len(self._pending),
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_seen,
+            "wait_p50_ms": pct(0.5),
+            "wait_p99_ms": pct(0.99),
+            "errors": self.errors,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
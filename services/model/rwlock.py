@@ -0,0 +1,54 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    قفل قراء/كاتب مع أولوية للكاتب: عدد غير محدود من القراء بالتوازي،
+    والكاتب ينتظر خروجهم ويمنع دخول قراء جدد حتى ينتهي (فلا يجوع).
+    `with lock:` = قفل كتابة (بديل مباشر لـ threading.Lock)، و lock.read() للقراءة.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
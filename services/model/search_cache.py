@@ -0,0 +1,71 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def embedding_key(vec):
+    # بصمة سريعة لبايتات المتجه المطبَّع (float32)
+    return hashlib.blake2b(vec.tobytes(), digest_size=16).digest()
+
+
+class SearchCache:
+    """
+    LRU + TTL لنتائج البحث. كل مدخل يحمل generation الفهرس وقت حسابه،
+    وأي تعديل للفهرس يرفع الـ generation فتصبح المدخلات القديمة غير صالحة
+    (تُحذف عند أول قراءة لها بدل مسح الكاش كله).
+    """
+
+    def __init__(self, max_entries=100000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                gen, expires, value = entry
+                if gen == generation and expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value):
+        with self._lock:
+            self._data[key] = (generation, time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
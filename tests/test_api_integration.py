@@ -95,4 +95,38 @@ def test_auth_fail():
         json={"input": "hello", "modality": "text"},
         headers={"X-API-KEY": "wrong"}
     )
-    assert r.status_code == 403
\ No newline at end of file
+    assert r.status_code == 403
+
+
+def test_search_endpoints():
+    emb = requests.post(
+        f"{BASE}/encode",
+        json={"input": "search me", "modality": "text"},
+        headers={"X-API-KEY": API_KEY}
+    ).json()["embedding"]
+    pid = requests.post(
+        f"{BASE}/assign",
+        json={"embedding": emb, "modality": "text"},
+        headers={"X-API-KEY": API_KEY}
+    ).json()["proto_id"]
+
+    r = requests.post(f"{BASE}/search", json={"embedding": emb, "k": 3, "modality": "text"}, headers={"X-API-KEY": API_KEY})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["ids"][0] == pid and len(body["ids"]) == len(body["sims"])
+
+    r = requests.post(f"{BASE}/search/batch", json={"embeddings": [emb, emb], "min_sim": 0.99}, headers={"X-API-KEY": API_KEY})
+    assert r.status_code == 200
+    assert all(pid in res["ids"] for res in r.json()["results"])
+
+    r = requests.post(f"{BASE}/search/batch", json={"embeddings": [emb], "min_sim": -2}, headers={"X-API-KEY": API_KEY})
+    assert r.status_code == 400
+
+    r = requests.post(f"{BASE}/search", json={"embedding": [0.1, 0.2]}, headers={"X-API-KEY": API_KEY})
+    assert r.status_code == 400
+
+
+def test_rank_rejects_malformed_seed_sets():
+    for seeds in ([[1, 2]], [{"c_00000": "x"}], ["c_00000"], [["c_00000"]] * 1000):
+        r = requests.post(f"{BASE}/concepts/rank", json={"seeds": seeds}, headers={"X-API-KEY": API_KEY})
+        assert r.status_code == 400
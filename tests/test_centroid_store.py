@@ -0,0 +1,78 @@
+from services.model.centroid_store import CentroidStore
+from services.model.proto_memory import ProtoMemory
+from services.model.faiss_partitions import PartitionedFaissStore
+from services.model import proto_memory
+import numpy as np
+import faiss
+
+
+def test_update_means_matches_numpy_mean():
+    rng = np.random.default_rng(0)
+    cs = CentroidStore(8)
+    members = rng.standard_normal((6, 8)).astype(np.float32)
+    cs.append(members[:1])
+    rows = [0, 0, 0]
+    cs.update_means(rows[:2], members[1:3], [3, 3])
+    cs.update_means([0], members[3:4], [4])
+    np.testing.assert_allclose(cs.get([0])[0], members[:4].mean(axis=0), atol=1e-5)
+
+
+def test_float16_storage_and_reload(tmp_path):
+    cs = CentroidStore(4, dtype="float16")
+    cs.append(np.arange(8, dtype=np.float32).reshape(2, 4))
+    assert cs._tail.dtype == np.float16
+    path = str(tmp_path / "c.npy")
+    cs.write(path, 2)
+    cs2 = CentroidStore(4, dtype="float16")
+    cs2.load(path)
+    cs2.update_means([1], np.zeros((1, 4), dtype=np.float32), [2])
+    out = cs2.get([0, 1])
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out[1], np.arange(4, 8) / 2)
+
+
+def test_centroids_track_members_and_sync_to_faiss(tmp_path, monkeypatch):
+    monkeypatch.setattr(proto_memory, "CENTROID_SYNC_EVERY", 10)
+    rng = np.random.default_rng(1)
+    base = rng.standard_normal(384).astype(np.float32)
+    X = base + 0.1 * rng.standard_normal((21, 384)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    ids = pm.assign_batch(X[:11], "text") + [pm.assign(x, "text") for x in X[11:]]
+    assert len(set(ids)) == 1
+    pid = ids[0]
+    np.testing.assert_allclose(pm.centroids.get([pm.protos.row_of(pid)])[0], X.mean(axis=0), atol=1e-5)
+    # 20 تحديثًا = مزامنتان: متجه FAISS هو المتوسط المطبَّع بدل أول عضو
+    store = pm.faiss.partition("text")
+    pos = list(faiss.vector_to_array(store.index.id_map)).index(store.ids_map.lookup(pid))
+    vec = store.index.index.reconstruct(pos)
+    m = X.mean(axis=0)
+    np.testing.assert_allclose(vec, m / np.linalg.norm(m), atol=1e-5)
+
+    # إعادة التشغيل من الـ WAL تعيد نفس المتوسط والعدد
+    pm2 = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    assert pm2.protos[pid]["count"] == 21
+    np.testing.assert_allclose(pm2.centroids.get([pm2.protos.row_of(pid)])[0], X.mean(axis=0), atol=1e-5)
+    pm2.checkpoint()
+    pm3 = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    np.testing.assert_allclose(pm3.centroids.get([pm3.protos.row_of(pid)])[0], X.mean(axis=0), atol=1e-5)
+
+
+def test_compressed_index_rerank_keeps_threshold_semantics(tmp_path):
+    rng = np.random.default_rng(2)
+    X = rng.standard_normal((400, 384)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    pm.faiss = PartitionedFaissStore(384, str(tmp_path / "sq.bin"), index_type="sq8", migrate_at=300)
+    ids = pm.assign_batch(X, "text")
+    pm.faiss.wait_for_migration()
+    assert pm.faiss.compressed
+
+    q = X[7] + 0.3 * rng.standard_normal(384).astype(np.float32)
+    q /= np.linalg.norm(q)
+    got, sims = pm.search(q, k=3)
+    assert got[0] == ids[7]
+    # التشابه المعاد دقيق (cosine مع الـ centroid) لا تقريب SQ8
+    np.testing.assert_allclose(sims[0], float(X[7] @ q), atol=1e-5)
+    assert pm.assign(X[7], "text") == ids[7] and pm.protos[ids[7]]["count"] == 2
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+from services.model.concept_graph import ConceptGraph
+
+
+def test_link_reuses_concept_via_index(tmp_path):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    c1 = cg.link("p_1", None, labels=["animal"])
+    c2 = cg.link("p_2", None, labels=["plant"])
+    assert cg.link("p_1", None) == c1
+    assert cg.concept_of("p_2") == c2
+    assert cg.concept_of("p_missing") is None
+    assert cg.concepts_with_label("animal") == {c1}
+
+
+def test_indexes_rebuilt_on_load(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path)
+    c1 = cg.link("p_1", None, labels=["animal"])
+    cg.flush()
+    cg2 = ConceptGraph(path=path)
+    assert cg2.concept_of("p_1") == c1
+    assert cg2.concepts_with_label("animal") == {c1}
+    assert cg2.link("p_1", None) == c1
+
+
+def test_remap_updates_proto_index(tmp_path):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    c1 = cg.link("p_1", None)
+    c2 = cg.link("p_2", None)
+    assert cg.remap_protos({"p_2": "p_1"}) == 1
+    assert cg.concept_of("p_2") is None
+    assert cg.concept_of("p_1") == c1
+    assert cg.G.nodes[c2]["proto_refs"] == ["p_1"]
+
+
+def test_query_filters_by_label(tmp_path):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    a = cg.link("p_1", None, labels=["animal"])
+    b = cg.link("p_2", None, labels=["plant"])
+    c = cg.link("p_3", None, labels=["animal"])
+    cg.add_relation(a, b, "near")
+    cg.add_relation(b, c, "near")
+    ids = {r["concept_id"] for r in cg.query(a, depth=2, types=["animal"])}
+    assert ids == {a, c}
+    assert len(cg.query(a, depth=2)) == 3
+
+
+def test_journal_persists_edges_and_refs(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path, group_wait=0)
+    a = cg.link("p_1", None, labels=["animal"])
+    b = cg.link("p_2", None)
+    cg.add_relation(a, b, "is_a", 0.7)
+    cg.remap_protos({"p_2": "p_1"})
+    size = os.path.getsize(path)
+    cg.link("p_3", None)
+    assert os.path.getsize(path) > size  # إلحاق وليس إعادة كتابة
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "edge", "a": ')  # سجل مبتور
+
+    cg2 = ConceptGraph(path=path)
+    assert cg2.G.number_of_nodes() == 3
+    assert cg2.G.edges[a, b] == {"rel_type": "is_a", "weight": 0.7}
+    assert cg2.G.nodes[b]["proto_refs"] == ["p_1"]
+    assert cg2.concept_of("p_3") == "c_00002"
+
+
+def test_group_commit_and_compaction(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path, group_size=4, group_wait=10)
+    ids = [cg.link(f"p_{i}", None) for i in range(3)]
+    assert not os.path.exists(path)  # الدفعة لم تمتلئ بعد
+    cg.add_relation(ids[0], ids[1], "near")
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+    for i in range(3):
+        cg.add_relation(ids[0], ids[1], "near", weight=i)  # نفس الحافة: سجلات زائدة
+    cg.checkpoint()
+    assert os.path.getsize(path) == 0  # العقد والحافة في اللقطة الثنائية
+    assert os.path.exists(str(tmp_path / "cg.snap"))
+    cg2 = ConceptGraph(path=path)
+    assert cg2.G.edges[ids[0], ids[1]]["weight"] == 2
+
+
+def test_link_batch_dedupes_against_index(tmp_path):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"), group_wait=0)
+    c0 = cg.link("p_0", None, labels=["animal"])
+    ids = cg.link_batch(["p_1", "p_0", "p_2", "p_1"], labels=[["plant"], None, ["animal"], ["plant"]])
+    assert ids[1] == c0 and ids[0] == ids[3] and len(set(ids)) == 3
+    assert cg.G.number_of_nodes() == 3
+    assert cg.concepts_with_label("animal") == {c0, ids[2]}
+    assert cg.add_relations_batch([(ids[0], ids[2], "near"), (ids[2], c0, "is_a", 0.5)]) == 2
+    assert cg.link("p_2", None) == ids[2]
+
+    cg2 = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    assert cg2.G.number_of_nodes() == 3
+    assert cg2.G.edges[ids[2], c0] == {"rel_type": "is_a", "weight": 0.5}
+    assert cg2.concept_of("p_1") == ids[0]
+
+
+def test_link_batch_nodes_do_not_share_provenance(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path, group_wait=0)
+    a, b = cg.link_batch(["p_0", "p_1"], provenance={"src": "bulk"})
+    cg.G.nodes[a]["provenance"]["edited"] = True
+    assert cg.G.nodes[b]["provenance"] == {"src": "bulk"}
+    # نفس الشيء بعد إعادة تطبيق سجل "nodes" من الـ journal
+    cg2 = ConceptGraph(path=path)
+    cg2.G.nodes[a]["provenance"]["edited"] = True
+    assert cg2.G.nodes[b]["provenance"] == {"src": "bulk"}
+
+
+def test_nearest_combines_ann_and_hops(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((4, 384)).astype(np.float32)
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path, group_wait=0)
+    ids = cg.link_batch(["p_0", "p_1", "p_2"], labels=[["a"], ["b"], ["a"]], embeddings=X[:3])
+    d = cg.link("p_3", X[3], labels=["b"])
+    cg.add_relation(ids[0], d, "near")
+    cg.add_relation(d, ids[1], "near")
+
+    res = cg.nearest(X[0] + 0.01, k=1, depth=2)
+    assert [r["concept_id"] for r in res] == [ids[0], d, ids[1]]
+    assert [r["distance"] for r in res] == [0, 1, 2]
+    assert res[0]["similarity"] > 0.99 and all(r["via"] == ids[0] for r in res)
+    assert [r["concept_id"] for r in cg.nearest(X[0], k=1, depth=2, types=["b"])] == [d, ids[1]]
+
+    cg.set_embeddings([ids[2]], X[0])  # متجه صريح يستبدل السابق
+    assert {r["concept_id"] for r in cg.nearest(X[0], k=2, depth=0)} == {ids[0], ids[2]}
+
+    # المتجهات تُستعاد من الـ journal (قبل checkpoint) ومن الفهرس المحفوظ (بعده)
+    cg2 = ConceptGraph(path=path)
+    assert cg2.nearest(X[3], k=1, depth=0)[0]["concept_id"] == d
+    cg2.checkpoint()
+    cg3 = ConceptGraph(path=path)
+    assert len(cg3.vectors.ids_map) == 4
+    assert {r["concept_id"] for r in cg3.nearest(X[0], k=2, depth=0)} == {ids[0], ids[2]}
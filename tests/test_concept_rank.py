@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from services.model.concept_graph import ConceptGraph
+from services.model.concept_rank import ConceptRanker
+
+
+def _graph(tmp_path, backend="networkx"):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"), backend=backend)
+    rng = np.random.default_rng(0)
+    ids = cg.link_batch([f"p_{i}" for i in range(40)])
+    a, b = rng.integers(0, 38, 80), rng.integers(0, 38, 80)  # آخر عقدتين بلا حواف (dangling)
+    cg.add_relations_batch([(ids[x], ids[y], "near", float(w)) for x, y, w in zip(a, b, rng.random(80) + 0.1)])
+    return cg, ids
+
+
+def _dense_ppr(cg, seeds, alpha=0.85, iters=500):
+    ids = list(cg.G.nodes())
+    pos = {n: i for i, n in enumerate(ids)}
+    W = np.zeros((len(ids), len(ids)))
+    for a, b, data in cg.G.edges(data=True):
+        W[pos[a], pos[b]] = W[pos[b], pos[a]] = data["weight"]
+    deg = W.sum(axis=1)
+    s = np.zeros(len(ids))
+    s[[pos[x] for x in seeds]] = 1.0 / len(seeds)
+    p = s.copy()
+    for _ in range(iters):
+        walk = W @ np.where(deg > 0, p / np.where(deg > 0, deg, 1), 0)
+        p = alpha * walk + (1 - alpha + alpha * p[deg == 0].sum()) * s
+    return {n: p[pos[n]] for n in ids}
+
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_ppr_matches_dense_reference(tmp_path, backend):
+    cg, ids = _graph(tmp_path, backend)
+    ranker = ConceptRanker(cg)
+    seed_sets = [[ids[0]], [ids[3], ids[7]], {ids[39]: 1.0}]
+    results = ranker.personalized_pagerank(seed_sets, top_k=40, tol=1e-12, max_iter=500)
+    for seeds, res in zip(seed_sets, results):
+        ref = _dense_ppr(cg, list(seeds))
+        assert abs(sum(r["score"] for r in res) - 1.0) < 1e-6
+        for r in res:
+            assert abs(r["score"] - ref[r["concept_id"]]) < 1e-8
+    # بذرة معزولة: كل الكتلة تبقى عليها
+    assert results[2] == [{"concept_id": ids[39], "score": pytest.approx(1.0)}]
+
+
+def test_spreading_activation_and_cache(tmp_path):
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    a, b, c, d = cg.link_batch(["p_a", "p_b", "p_c", "p_d"])
+    cg.add_relations_batch([(a, b, "r", 3.0), (a, c, "r", 1.0), (c, d, "r", 1.0)])
+    ranker = ConceptRanker(cg)
+    res = ranker.spreading_activation([[a]], steps=1, decay=0.5, exclude_seeds=True)[0]
+    assert [r["concept_id"] for r in res] == [b, c]  # الوزن يحدد التوزيع
+    assert res[0]["score"] == pytest.approx(0.375) and res[1]["score"] == pytest.approx(0.125)
+
+    ranker.spreading_activation([[a]], steps=1, decay=0.5, exclude_seeds=True)
+    assert ranker.cache.hits == 1
+    cg.add_relation(b, d, "r", 1.0)  # أي تعديل يبطل الكاش ويعيد بناء المصفوفة
+    res = ranker.spreading_activation([[a]], steps=2, decay=0.5, exclude_seeds=True)[0]
+    assert d in [r["concept_id"] for r in res]
+    assert ranker.cache.hits == 1
+
+
+def test_bounded_memory_blocks_match_single_block(tmp_path):
+    cg, ids = _graph(tmp_path)
+    seed_sets = [[ids[i]] for i in range(12)] + [{ids[1]: 2.0, ids[5]: 1.0}]
+    full = ConceptRanker(cg, cache_size=0).personalized_pagerank(seed_sets, top_k=40)
+    # ميزانية صغيرة جدًا: مجموعة بذور واحدة لكل كتلة وبضع حواف في كل جمع
+    small = ConceptRanker(cg, cache_size=0, mem_bytes=64)
+    assert small.personalized_pagerank(seed_sets, top_k=40) == full
+    assert small.spreading_activation(seed_sets) == ConceptRanker(cg, cache_size=0).spreading_activation(seed_sets)
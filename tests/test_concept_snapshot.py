@@ -0,0 +1,81 @@
+import json
+import os
+import pytest
+from services.model.concept_graph import ConceptGraph
+
+
+def _build(path, backend):
+    cg = ConceptGraph(path=path, group_wait=0, backend=backend)
+    a = cg.link("p_1", None, labels=["animal", "pet"], confidence=0.9, provenance={"src": "test"})
+    b = cg.link("p_2", None, labels=["animal"])
+    c = cg.link("p_3", None)
+    cg.add_relation(a, b, "is_a", weight=2.0)
+    cg.add_relation(b, c, None)
+    cg.add_relation(c, c, "self")
+    cg.G.nodes[c]["note"] = {"k": [1, 2]}  # خاصية خارج الأعمدة -> extras
+    cg.add_relation("x_1", a, "near")  # عقدة بلا خصائص
+    return cg, (a, b, c)
+
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_snapshot_roundtrip(tmp_path, backend, mmap):
+    path = str(tmp_path / "cg.jsonl")
+    cg, (a, b, c) = _build(path, backend)
+    cg.checkpoint()
+    cg2 = ConceptGraph(path=path, backend=backend, mmap=mmap)
+    assert sorted(cg2.G.nodes()) == sorted(cg.G.nodes())
+    for n in cg.G.nodes():
+        assert dict(cg2.G.nodes[n]) == dict(cg.G.nodes[n])
+    assert cg2.G.number_of_edges() == 4
+    assert cg2.G.edges[a, b] == {"rel_type": "is_a", "weight": 2.0}
+    assert cg2.G.edges[c, c]["rel_type"] == "self"
+    assert cg2.G.edges[b, c]["rel_type"] is None
+    assert cg2.G.nodes[c]["note"] == {"k": [1, 2]}
+    assert "labels" not in cg2.G.nodes["x_1"]
+    assert cg2.concept_of("p_2") == b
+    assert cg2.concepts_with_label("animal") == {a, b}
+    # تعديل فوق لقطة mmap ثم إعادة التحميل (اللقطة + الـ journal)
+    cg2.add_relation(a, c, "near", weight=3.0)
+    cg2.add_relation(a, b, "is_a", weight=5.0)
+    d = cg2.link("p_4", None, labels=["pet"])
+    cg2.flush()
+    cg3 = ConceptGraph(path=path, backend=backend)
+    assert cg3.G.edges[a, c]["weight"] == 3.0 and cg3.G.edges[a, b]["weight"] == 5.0
+    assert cg3.concepts_with_label("pet") == {a, d}
+    # الـ backend الآخر يقرأ نفس اللقطة
+    other = ConceptGraph(path=path, backend="csr" if backend == "networkx" else "networkx")
+    assert other.G.number_of_edges() == 5 and other.concept_of("p_4") == d
+
+
+def test_convert_legacy_jsonl(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    # الصيغة القديمة: سطر لكل عقدة (بدون op) وسطر لكل حافة
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps({"concept_id": f"c_{i:05d}", "labels": ["old"], "proto_refs": [f"p_{i}"],
+                                "confidence": 0.5, "provenance": {}, "last_updated": 1.0}) + "\n")
+        f.write(json.dumps({"op": "edge", "a": "c_00000", "b": "c_00002", "rel_type": "near", "weight": 1.0}) + "\n")
+    cg = ConceptGraph(path=path)
+    cg.checkpoint()
+    assert os.path.getsize(path) == 0
+    cg2 = ConceptGraph(path=path, backend="csr")
+    assert cg2.concept_of("p_1") == "c_00001"
+    assert cg2.G.nodes["c_00002"]["last_updated"] == 1.0
+    assert [r["concept_id"] for r in cg2.query("c_00000")] == ["c_00000", "c_00002"]
+    assert cg2.link("p_9", None) == "c_00003"
+
+
+def test_invalid_journal_records_are_reported(tmp_path, caplog):
+    path = str(tmp_path / "cg.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "node", "concept_id": "c_00000", "proto_refs": ["p_0"]}) + "\n")
+        f.write(json.dumps({"op": "edges", "a": ["c_00000"]}) + "\n")  # سجل كامل لكن ناقص الحقول
+        f.write(json.dumps({"op": "vecs"}) + "\n")
+        f.write(json.dumps({"op": "node", "concept_id": "c_00001"}) + "\n")
+        f.write(json.dumps({"op": "edges", "a": ["c_00000"], "b": ["c_00001"], "rel_type": ["near"], "weight": [1.0]}) + "\n")
+    with caplog.at_level("WARNING"):
+        cg = ConceptGraph(path=path)
+    assert set(cg.G.nodes) == {"c_00000", "c_00001"}
+    assert cg.G.number_of_edges() == 1 and cg.G.has_edge("c_00000", "c_00001")
+    assert "Skipped 2 invalid concept journal records" in caplog.text and "KeyError" in caplog.text
@@ -0,0 +1,79 @@
+import networkx as nx
+import numpy as np
+from services.model.csr_graph import CSRGraph
+from services.model.concept_graph import ConceptGraph
+
+
+def _random_edges(rng, n, m):
+    return [(f"c_{a}", f"c_{b}", f"r{int(r)}", float(w))
+            for a, b, r, w in zip(rng.integers(0, n, m), rng.integers(0, n, m), rng.integers(0, 5, m), rng.random(m))]
+
+
+def test_k_hop_matches_networkx():
+    rng = np.random.default_rng(0)
+    G, C = nx.Graph(), CSRGraph(delta_max=50)  # compact عدة مرات أثناء الإضافة
+    for i in range(300):
+        G.add_node(f"c_{i}")
+        C.add_node(f"c_{i}")
+    for a, b, r, w in _random_edges(rng, 300, 400):
+        G.add_edge(a, b, rel_type=r, weight=w)
+        C.add_edge(a, b, rel_type=r, weight=w)
+    assert C.number_of_edges() == G.number_of_edges()
+    for src in ("c_0", "c_17", "c_250"):
+        for depth in (1, 2, 3, None):
+            assert C.k_hop(src, depth) == nx.single_source_shortest_path_length(G, src, cutoff=depth)
+    for a, b, data in G.edges(data=True):
+        got = C.edges[a, b]
+        assert got["rel_type"] == data["rel_type"]
+        assert np.isclose(got["weight"], data["weight"])
+    assert len(C.edges(data=True)) == G.number_of_edges()
+
+
+def test_edge_update_in_delta_and_csr():
+    C = CSRGraph(delta_max=1000)
+    C.add_edge("a", "b", rel_type="x", weight=1.0)
+    C.compact()
+    C.add_edge("b", "a", rel_type="y", weight=2.0)  # تحديث حافة موجودة في CSR
+    assert C.number_of_edges() == 1
+    assert C.edges["a", "b"] == {"rel_type": "y", "weight": 2.0}
+    C.compact()
+    assert C.edges["b", "a"] == {"rel_type": "y", "weight": 2.0}
+    assert C.edges(data=True) == [("a", "b", {"rel_type": "y", "weight": 2.0})]
+
+
+def test_concept_graph_csr_backend(tmp_path):
+    path = str(tmp_path / "cg.jsonl")
+    cg = ConceptGraph(path=path, group_wait=0, backend="csr")
+    a = cg.link("p_1", None, labels=["animal"], confidence=0.5)
+    b = cg.link("p_2", None, labels=["plant"])
+    c = cg.link("p_3", None, labels=["animal"])
+    cg.add_relation(a, b, "near")
+    cg.add_relation(b, c, "near")
+    assert cg.link("p_1", None) == a
+    assert {r["concept_id"] for r in cg.query(a, depth=2, types=["animal"])} == {a, c}
+    assert cg.remap_protos({"p_3": "p_1"}) == 1
+    node = cg.query(c, depth=0)[0]
+    assert node["proto_refs"] == ["p_1"] and node["labels"] == ["animal"] and node["confidence"] == 0.5
+    cg.checkpoint()
+
+    cg2 = ConceptGraph(path=path, backend="csr")
+    assert cg2.G.number_of_edges() == 2
+    assert cg2.concept_of("p_2") == b
+    assert [r["concept_id"] for r in cg2.query(a, depth=2)] == [a, b, c]
+
+
+def test_add_edges_bulk_matches_networkx():
+    rng = np.random.default_rng(1)
+    edges = _random_edges(rng, 200, 1000)
+    G, C = nx.Graph(), CSRGraph()
+    C.add_edge("c_0", "c_1", rel_type="old", weight=9.0)  # في الـ delta قبل الدفعة
+    G.add_edge("c_0", "c_1", rel_type="old", weight=9.0)
+    half = len(edges) // 2
+    for chunk in (edges[:half], edges[half:] + edges[:10]):
+        G.add_edges_from((a, b, {"rel_type": r, "weight": w}) for a, b, r, w in chunk)
+        C.add_edges([e[0] for e in chunk], [e[1] for e in chunk], [e[2] for e in chunk], [e[3] for e in chunk])
+    assert C.number_of_edges() == G.number_of_edges()
+    for a, b, data in G.edges(data=True):
+        assert C.edges[a, b]["rel_type"] == data["rel_type"]
+        assert np.isclose(C.edges[a, b]["weight"], data["weight"])
+    assert C.k_hop("c_5", 3) == nx.single_source_shortest_path_length(G, "c_5", cutoff=3)
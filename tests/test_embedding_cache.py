@@ -0,0 +1,66 @@
+import numpy as np
+from services.model.embedding_cache import EmbeddingCache
+from services.model.encoders import MultiModalEncoders, content_digest
+
+
+def _keys(n):
+    return [content_digest("text", f"t{i}") for i in range(n)]
+
+
+def test_memory_tier_byte_budget():
+    cache = EmbeddingCache(max_bytes=3 * 4 * 8, disk_dir="", dim=8, version="v1")
+    keys = _keys(4)
+    cache.put_many(keys[:3], np.ones((3, 8)))
+    assert cache.get_many(keys[:1])[0] is not None  # keys[0] يصبح الأحدث
+    cache.put_many(keys[3:], np.zeros((1, 8)))
+    got = cache.get_many(keys)
+    assert [v is not None for v in got] == [True, False, True, True]
+    st = cache.stats()
+    assert st["bytes"] == 3 * 32 and st["evictions"] == 1 and st["memory_hits"] == 4 and st["misses"] == 1
+
+
+def test_disk_tier_persists_and_invalidates(tmp_path):
+    d = str(tmp_path / "emb")
+    keys = _keys(3000)  # أكبر من السعة الابتدائية: يختبر نمو الملف
+    X = np.random.default_rng(0).random((3000, 8), dtype=np.float32)
+    EmbeddingCache(max_bytes=0, disk_dir=d, dim=8, version="v1").put_many(keys, X)
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_dir=d, dim=8, version="v1")
+    got = cache.get_many(keys[:2] + keys[2999:])
+    assert np.array_equal(np.stack(got), X[[0, 1, 2999]])
+    assert cache.stats()["disk_hits"] == 3
+    assert cache.get_many(keys[:1])[0] is not None and cache.stats()["memory_hits"] == 1
+    # نسخة أخرى تلحق بمفاتيح كتبتها غيرها على نفس المجلد
+    other = EmbeddingCache(max_bytes=0, disk_dir=d, dim=8, version="v1")
+    extra = [content_digest("text", "new")]
+    other.put_many(extra, np.full((1, 8), 7.0))
+    assert cache.get_many(extra)[0][0] == 7.0
+    # مجلد أنشأه إصدار آخر يُفرَّغ عند الفتح فقط
+    stale = EmbeddingCache(max_bytes=0, disk_dir=d, dim=8, version="v2")
+    assert stale.stats()["disk_entries"] == 0 and stale.get_many(keys[:1]) == [None]
+
+
+def test_encoder_uses_cache(tmp_path):
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_dir=str(tmp_path / "emb"), version="v1")
+    enc = MultiModalEncoders(cache=cache, version="v1")
+    plain = MultiModalEncoders(cache=EmbeddingCache(max_bytes=0, disk_dir=""))
+    inputs = ["a", "b", "a", b"\x89PNG...."]
+    first = enc.encode_batch(inputs)
+    assert np.array_equal(first, plain.encode_batch(inputs))
+    assert cache.stats()["misses"] == 4 and cache.stats()["disk_entries"] == 3
+    assert np.array_equal(enc.encode_batch(inputs), first)
+    assert cache.stats()["memory_hits"] == 4
+    assert np.array_equal(enc.encode("b"), first[1])
+
+
+def test_versions_share_cache_without_wiping(tmp_path):
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_dir=str(tmp_path / "emb"), version="v1")
+    old = MultiModalEncoders(cache=cache, version="v1")
+    new = MultiModalEncoders(cache=cache, version="v2")
+    inputs = ["a", "b"]
+    assert content_digest("text", "a", version="v1") != content_digest("text", "a", version="v2")
+    for _ in range(3):
+        old.encode_batch(inputs)
+        new.encode_batch(inputs)
+    st = cache.stats()
+    # مفتاح لكل (إصدار، محتوى): 4 إخفاقات فقط، والتبديل بين الإصدارين لا يمسح شيئًا
+    assert st["misses"] == 4 and st["memory_hits"] == 8 and st["disk_entries"] == 4
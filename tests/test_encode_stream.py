@@ -0,0 +1,69 @@
+import io
+import numpy as np
+import pytest
+from services.model.embedding_cache import EmbeddingCache
+from services.model.encoders import MultiModalEncoders
+
+WAV = b"RIFF" + bytes(range(256)) * 40  # ~10 KB
+
+
+class Pipe(io.RawIOBase):
+    # مصدر غير قابل للـ seek يعيد قراءات قصيرة
+    def __init__(self, data):
+        self._buf = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        return self._buf.read(min(n, 1000) if n > 0 else n)
+
+
+def _enc():
+    return MultiModalEncoders(cache=EmbeddingCache(max_bytes=0, disk_dir=""))
+
+
+def test_single_window_matches_bytes(tmp_path):
+    enc = _enc()
+    path = tmp_path / "clip.bin"
+    path.write_bytes(WAV)
+    expected = enc.encode(WAV)
+    assert np.array_equal(enc.encode_file(str(path)), expected)
+    assert np.array_equal(enc.encode(path), expected)  # PathLike
+    assert np.array_equal(enc.encode_file(io.BytesIO(WAV)), expected)
+    assert np.array_equal(enc.encode_file(Pipe(WAV)), expected)
+
+
+def test_windows_pooled_consistently(tmp_path):
+    enc = _enc()
+    path = tmp_path / "clip.bin"
+    path.write_bytes(WAV)
+    window = 1024
+    windows = [WAV[i:i + window] for i in range(0, len(WAV), window)]
+    expected = enc._encode_group("audio", windows).mean(axis=0)
+    for src in (str(path), io.BytesIO(WAV), Pipe(WAV)):
+        assert np.allclose(enc.encode_file(src, window=window), expected, atol=1e-6)
+
+
+def test_sniff_from_header_and_name(tmp_path):
+    enc = _enc()
+    png = tmp_path / "noext"
+    png.write_bytes(b"\x89PNG" + b"\x00" * 100)
+    assert np.array_equal(enc.encode_file(str(png)), enc.encode_image(png.read_bytes()))
+    named = tmp_path / "raw.wav"
+    named.write_bytes(b"\x00" * 100)
+    assert np.array_equal(enc.encode_file(str(named)), enc.encode_audio(named.read_bytes()))
+    with pytest.raises(ValueError):
+        enc.encode_file(io.BytesIO(b"\x00" * 100))
+
+
+def test_stream_cache_skips_encoding(tmp_path):
+    enc = MultiModalEncoders(cache=EmbeddingCache(max_bytes=1 << 20, disk_dir=""))
+    path = tmp_path / "clip.wav"
+    path.write_bytes(WAV)
+    first = enc.encode_file(str(path), window=1024)
+    calls = []
+    enc._encode_group = lambda *a: calls.append(a)
+    assert np.array_equal(enc.encode_file(str(path), window=1024), first)
+    assert np.array_equal(enc.encode_file(io.BytesIO(WAV), window=1024), first)
+    assert not calls and enc.cache.stats()["memory_hits"] == 2
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from services.model.encoders import MultiModalEncoders
+
+PNG = b"\x89PNG" + b"\x00" * 32
+WAV = b"RIFF" + b"\x01" * 32
+
+
+def test_encode_batch_matrix_matches_single():
+    enc = MultiModalEncoders()
+    inputs = ["a", PNG, "b", WAV, "a"]
+    M = enc.encode_batch(inputs)
+    assert M.shape == (5, enc.dim) and M.dtype == np.float32 and M.flags["C_CONTIGUOUS"]
+    for row, inp in zip(M, inputs):
+        assert np.array_equal(row, enc.encode(inp))
+    assert np.array_equal(M[0], M[4]) and not np.array_equal(M[0], M[2])
+    assert np.array_equal(M[1], enc.encode_image(PNG))
+    # نفس البايتات بـ modality مختلفة -> متجه مختلف
+    assert not np.array_equal(enc.encode(PNG, "audio"), M[1])
+    assert enc.encode_batch([]).shape == (0, enc.dim)
+    with pytest.raises(ValueError):
+        enc.encode_batch(["ok", b"\x00\x00"])
+
+
+def test_encode_deterministic_across_processes():
+    code = ("from services.model.encoders import MultiModalEncoders;"
+            "print(MultiModalEncoders().encode('stable text')[:4].tolist())")
+    outs = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                           env={"PYTHONHASHSEED": seed, "PYTHONPATH": "."}).stdout for seed in ("1", "2")}
+    assert len(outs) == 1
+    assert outs.pop().strip() == str(MultiModalEncoders().encode("stable text")[:4].tolist())
+
+
+def test_encode_thread_safe():
+    enc = MultiModalEncoders()
+    texts = [f"t{i}" for i in range(64)]
+    expected = enc.encode_batch(texts)
+    with ThreadPoolExecutor(8) as ex:
+        got = list(ex.map(enc.encode, texts * 4))
+    assert np.array_equal(np.stack(got), np.concatenate([expected] * 4))
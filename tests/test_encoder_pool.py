@@ -0,0 +1,65 @@
+import threading
+import numpy as np
+import pytest
+from services.model.embedding_cache import EmbeddingCache
+from services.model.encoder_pool import EncoderPool
+from services.model.encoders import MultiModalEncoders
+
+
+@pytest.fixture(scope="module")
+def pool():
+    p = EncoderPool(workers=2, max_batch=16, max_wait_ms=20)
+    yield p
+    p.close()
+
+
+def _local():
+    return MultiModalEncoders(cache=EmbeddingCache(max_bytes=0, disk_dir=""))
+
+
+def test_pool_matches_inprocess(pool):
+    enc = MultiModalEncoders(cache=EmbeddingCache(max_bytes=0, disk_dir=""), pool=pool)
+    inputs = [f"t{i}" for i in range(40)] + [b"\x89PNG" + bytes([i]) for i in range(5)]
+    got = enc.encode_batch(inputs)
+    assert got.dtype == np.float32 and got.shape == (45, enc.dim)
+    assert np.array_equal(got, _local().encode_batch(inputs))  # 40 نصًا > max_batch: تُقسَّم
+    with pytest.raises(RuntimeError):
+        pool.encode("text", [123])  # خطأ العامل يصل إلى الطالب
+    assert np.array_equal(pool.encode("text", ["ok"]), _local().encode_batch(["ok"]))
+
+
+def test_pool_micro_batches_concurrent_requests(pool):
+    before = pool.stats()
+    texts = [f"c{i}" for i in range(32)]
+    futures = [None] * len(texts)
+
+    def submit(i):
+        futures[i] = pool.submit("text", [texts[i]])
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    got = np.concatenate([f.result() for f in futures])
+    assert np.array_equal(got, _local().encode_batch(texts))
+    st = pool.stats()
+    assert st["items"] - before["items"] == 32
+    assert st["batches"] - before["batches"] < 32  # الطلبات الفردية جُمعت
+    assert st["alive"] == 2 and st["avg_batch_size"] > 1
+
+
+def test_dead_worker_is_restarted_without_leaking_its_pipe():
+    p = EncoderPool(workers=1, max_batch=4, max_wait_ms=1)
+    try:
+        p.encode("text", ["warm"])
+        old_conn, old_proc = p._conns[0], p._procs[0]
+        old_proc.kill()
+        old_proc.join()
+        with pytest.raises(RuntimeError):
+            p.encode("text", ["lost"])
+        assert old_conn.closed and p._conns[0] is not old_conn
+        assert np.array_equal(p.encode("text", ["after"]), _local().encode_batch(["after"]))
+        st = p.stats()
+        assert st["restarts"] == 1 and st["errors"] == 1 and st["alive"] == 1
+    finally:
+        p.close()
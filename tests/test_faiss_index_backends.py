@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from services.model.faiss_store import FaissStore, index_type_of
+
+
+@pytest.mark.parametrize("index_type", ["sq8", "fp16", "pq", "ivf_flat", "ivf_pq", "hnsw"])
+def test_online_migration_keeps_ids(tmp_path, index_type):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((1200, 32)).astype(np.float32)
+    fs = FaissStore(32, str(tmp_path / "idx.bin"), index_type=index_type, migrate_at=1000, nprobe=64, pq_m=4)
+    fs.add_batch(X[:1000], [f"p_{i:05d}" for i in range(1000)])
+    # إضافات وحذف أثناء الترحيل في الخلفية
+    for i in range(1000, 1200):
+        fs.add(X[i], f"p_{i:05d}")
+    fs.remove("p_00005")
+    fs.wait_for_migration()
+
+    assert index_type_of(fs.index) == index_type
+    assert fs.search(X[1100], k=1)[0] == ["p_01100"]
+    assert "p_00005" not in fs.search(X[5], k=3)[0]
+
+    fs.save()
+    fs2 = FaissStore(32, str(tmp_path / "idx.bin"), index_type=index_type, migrate_at=1000)
+    assert index_type_of(fs2.index) == index_type
+    assert fs2.search(X[10], k=1)[0] == ["p_00010"]
+
+
+def test_flat_never_migrates(tmp_path):
+    fs = FaissStore(8, str(tmp_path / "idx.bin"), index_type="flat", migrate_at=1)
+    fs.add_batch(np.random.rand(10, 8), [str(i) for i in range(10)])
+    assert fs._migration is None
+    assert index_type_of(fs.index) == "flat"
+
+
+def test_update_batch_does_not_duplicate_hnsw_ids(tmp_path):
+    rng = np.random.default_rng(1)
+    X = rng.standard_normal((60, 16)).astype(np.float32)
+    pids = [f"p_{i:05d}" for i in range(50)]
+    fs = FaissStore(16, str(tmp_path / "idx.bin"), index_type="hnsw", migrate_at=50)
+    fs.add_batch(X[:50], pids)
+    fs.wait_for_migration()
+    assert index_type_of(fs.index) == "hnsw"
+    # مزامنة centroids متكررة: لا تضيف نسخًا جديدة بنفس الـ id
+    for _ in range(5):
+        fs.update_batch(X[50:60], pids[:10])
+    assert fs.index.ntotal == 50
+    got = fs.search(X[0], k=10)[0]
+    assert len(got) == len(set(got))
+
+
+def test_hnsw_removed_nearest_does_not_duplicate_on_assign(tmp_path):
+    from services.model.proto_memory import ProtoMemory
+
+    rng = np.random.default_rng(2)
+    X = rng.standard_normal((40, 384)).astype(np.float32)
+    pm = ProtoMemory(index_file=str(tmp_path / "faiss.bin"), meta_file=str(tmp_path / "protos.jsonl"), threshold=0.99)
+    pm.faiss.store_kwargs = {"index_type": "hnsw", "migrate_at": 2}
+    a = X[0] / np.linalg.norm(X[0])
+    b = 0.9 * a + 0.3 * X[1] / np.linalg.norm(X[1])
+    ids = pm.assign_batch(np.vstack([a, b, X[2:]]), "text")
+    pm.faiss.wait_for_migration()
+    assert index_type_of(pm.faiss.partition("text").index) == "hnsw" and len(set(ids)) == 40
+    pm.threshold = 0.8
+
+    # الأقرب يُدمج في proto آخر بعيد: متجهه يبقى في HNSW بلا mapping
+    pm.assign(X[5], "text")
+    assert pm.merge([[ids[0], ids[5]]]) == {ids[0]: ids[5]}
+    assert pm.faiss.ntotal == 40 and len(pm.faiss) == 39
+    before = len(pm.protos)
+    assert pm.assign(a + 0.01 * X[3], "text") == ids[1]
+    assert pm.assign_batch((a + 0.01 * X[4])[None], "text") == [ids[1]]
+    assert len(pm.protos) == before
+    assert ids[0] not in pm.search(a, k=3, modality="text")[0]
@@ -0,0 +1,115 @@
+import os
+import pickle
+import numpy as np
+import pytest
+from services.model.id_map import IdMap
+from services.model.faiss_store import FaissStore
+
+
+def test_append_remove_reload(tmp_path):
+    path = str(tmp_path / "idx.ids")
+    m = IdMap(path)
+    m.add_many(np.arange(1, 101), [f"p_{i:05d}" for i in range(100)])
+    m.flush()
+    size_after_first = os.path.getsize(path)
+    m.add(101, "p_00100")
+    assert m.pop("p_00003") == 4
+    m.flush()
+    # الإلحاق يكتب سجلين فقط وليس الجدول كاملًا
+    assert os.path.getsize(path) - size_after_first == 2 * 40
+
+    m2 = IdMap(path)
+    m2.load()
+    assert len(m2) == 100
+    assert m2.get(4) is None and m2.lookup("p_00003") is None
+    assert m2.get(101) == "p_00100" and m2.lookup("p_00100") == 101
+    assert m2.next_int_id == 102
+    assert m2.get_many([[1, -1, 4]]) == [["p_00000", None, None]]
+
+    m2.compact()
+    m3 = IdMap(path)
+    m3.load()
+    assert dict(m3.items()) == dict(m2.items())
+
+
+def test_legacy_pickle_is_converted(tmp_path):
+    path = str(tmp_path / "idx.ids")
+    with open(path, "wb") as f:
+        pickle.dump({"ids_map": {1: "p_00000", 2: "p_00001"}, "next_int_id": 5}, f)
+    m = IdMap(path)
+    m.load()
+    assert m.lookup("p_00001") == 2 and m.next_int_id == 5
+    m2 = IdMap(path)
+    m2.load()
+    assert dict(m2.items()) == {1: "p_00000", 2: "p_00001"}
+
+
+def test_proto_id_too_long(tmp_path):
+    with pytest.raises(ValueError):
+        IdMap(str(tmp_path / "x.ids")).add(1, "p" * 40)
+
+
+def test_store_remove_and_reload(tmp_path):
+    fs = FaissStore(8, str(tmp_path / "idx.bin"))
+    X = np.random.rand(5, 8).astype(np.float32)
+    fs.add_batch(X, [f"p_{i}" for i in range(5)])
+    fs.remove("p_2")
+    fs.save()
+    fs2 = FaissStore(8, str(tmp_path / "idx.bin"))
+    assert "p_2" not in fs2.ids_map and len(fs2.ids_map) == 4
+    assert fs2.search(X[4], k=1)[0] == ["p_4"]
+    fs2.add(X[2], "p_new")
+    assert fs2.ids_map.lookup("p_new") == 6
+
+
+def test_store_remove_batch_and_reload(tmp_path):
+    fs = FaissStore(8, str(tmp_path / "idx.bin"))
+    X = np.random.rand(6, 8).astype(np.float32)
+    fs.add_batch(X, [f"p_{i}" for i in range(6)])
+    fs.save()
+    fs.remove_batch(["p_1", "p_3", "missing", "p_3"])
+    assert fs.index.ntotal == 4 and len(fs.ids_map) == 4
+    # الحذف محفوظ في ذيل .ids حتى بدون save()
+    fs2 = FaissStore(8, str(tmp_path / "idx.bin"))
+    assert "p_1" not in fs2.ids_map and "p_3" not in fs2.ids_map and len(fs2.ids_map) == 4
+
+
+def test_read_only_store_leaves_ids_file_untouched(tmp_path):
+    fs = FaissStore(8, str(tmp_path / "idx.bin"))
+    X = np.random.rand(6, 8).astype(np.float32)
+    fs.add_batch(X[:4], [f"p_{i}" for i in range(4)])
+    fs.save()
+    # .ids يسبق الفهرس المحفوظ (الحالة العادية بين checkpoints)
+    fs.add_batch(X[4:], ["p_4", "p_5"])
+    ids_file = str(tmp_path / "idx.bin.ids")
+    with open(ids_file, "rb") as f:
+        before = f.read()
+    ro = FaissStore(8, str(tmp_path / "idx.bin"), read_only=True)
+    assert len(ro.ids_map) == 4 and ro.search(X[1], k=1)[0] == ["p_1"]
+    with open(ids_file, "rb") as f:
+        assert f.read() == before
+    with pytest.raises(RuntimeError):
+        ro.add(X[0], "p_x")
+
+
+def test_reverse_index_is_compact_and_tracks_mutations(tmp_path):
+    import tracemalloc
+
+    n = 20000
+    m = IdMap(str(tmp_path / "idx.ids"))
+    m.add_many(np.arange(1, n + 1), [f"p_{i:05d}" for i in range(n)])
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    assert "p_00042" in m and m.lookup("p_19999") == n
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # مفاتيح S32 مرتبة + int64 = 40 بايت لكل proto؛ dict من str كان يقارب 110
+    assert retained < 48 * n
+
+    assert m.pop("p_00042") == 43
+    assert "p_00042" not in m and m.lookup("p_00042") is None
+    m.add(n + 1, "p_00042")
+    assert m.lookup("p_00042") == n + 1
+    assert "p_" + "x" * 40 not in m
+    assert list(m.lookup_many(["p_00000", "nope", "p_00042"])) == [1, 0, n + 1]
+    assert list(m.pop_many(["p_00001", "p_00001", "nope"])) == [2]
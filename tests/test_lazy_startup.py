@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from services.model.proto_memory import ProtoMemory
+from services.model.faiss_store import FaissStore
+
+
+def _pm(tmp_path, **kw):
+    return ProtoMemory(index_file=str(tmp_path / "faiss.bin"), meta_file=str(tmp_path / "protos.jsonl"), **kw)
+
+
+def test_snapshot_opens_lazily(tmp_path):
+    X = np.random.default_rng(2).standard_normal((50, 384)).astype(np.float32)
+    pm = _pm(tmp_path)
+    ids = pm.assign_batch(X, "text", metas=[{"i": i} for i in range(50)])
+    pm.assign(X[3], "text")
+    pm.checkpoint()
+
+    pm2 = _pm(tmp_path)
+    assert len(pm2.protos) == 50
+    assert not pm2.protos._live  # لا شيء مفكوك بعد الإقلاع
+    assert isinstance(pm2.centroids._base, np.memmap)
+    assert pm2.protos[ids[3]]["count"] == 2 and pm2.protos[ids[7]]["meta"] == {"i": 7}
+    assert len(pm2.protos._live) == 2
+    row = pm2.protos.row_of(ids[10])
+    assert np.allclose(pm2.centroids.get([row])[0], X[10] / np.linalg.norm(X[10]), atol=1e-6)
+    assert pm2.assign(X[10], "text") == ids[10]
+
+    # checkpoint ثانٍ ينسخ السجلات غير المفكوكة كما هي
+    pm2.checkpoint()
+    pm3 = _pm(tmp_path)
+    assert sorted(pm3.protos) == sorted(ids)
+    assert pm3.protos[ids[10]]["count"] == 2
+
+
+def test_legacy_jsonl_with_centroid_lists(tmp_path):
+    v = np.random.rand(384).astype(np.float32)
+    v /= np.linalg.norm(v)
+    pm = _pm(tmp_path)
+    pid = pm.assign(v, "text")
+    pm.checkpoint()
+    # صيغة قديمة: centroid داخل السطر، بدون idx/ckpt
+    rec = dict(pm.protos[pid])
+    rec.pop("row")
+    rec["centroid"] = v.tolist()
+    (tmp_path / "protos.jsonl").write_text(json.dumps(rec) + "\n")
+    for suffix in (".idx.npy", ".centroids.npy", ".ckpt"):
+        (tmp_path / ("protos.jsonl" + suffix)).unlink()
+
+    pm2 = _pm(tmp_path)
+    assert pm2.protos[pid]["row"] == 0
+    assert np.allclose(pm2.centroids.get([0])[0], v)
+
+
+def test_mmap_index_promoted_on_write(tmp_path):
+    X = np.random.default_rng(3).standard_normal((10, 384)).astype(np.float32)
+    fs = FaissStore(384, str(tmp_path / "faiss.bin"))
+    fs.add_batch(X[:5], [f"p_{i}" for i in range(5)])
+    fs.save()
+
+    fs2 = FaissStore(384, str(tmp_path / "faiss.bin"), mmap=True)
+    assert fs2._mmapped
+    assert fs2.search(X[1], k=1)[0] == ["p_1"]
+    fs2.add(X[6], "p_6")
+    assert not fs2._mmapped and fs2.index.ntotal == 6
+    assert fs2.search(X[6], k=1)[0] == ["p_6"]
@@ -0,0 +1,78 @@
+import glob
+import os
+import threading
+import numpy as np
+from services.model.proto_memory import ProtoMemory
+from services.model.faiss_store import FaissStore
+from services.model.faiss_partitions import PartitionedFaissStore
+
+
+def _pm(tmp_path, **kw):
+    return ProtoMemory(index_file=str(tmp_path / "faiss.bin"), meta_file=str(tmp_path / "protos.jsonl"), **kw)
+
+
+def test_modalities_do_not_match_each_other(tmp_path):
+    pm = _pm(tmp_path)
+    v = np.random.default_rng(0).standard_normal(384).astype(np.float32)
+    p_img = pm.assign(v, "image")
+    p_txt = pm.assign(v, "text")
+    assert p_img != p_txt
+    assert pm.assign(v, "text", cross_modal=True) in (p_img, p_txt)
+    # نفس المتجه بـ modalities مختلفة داخل دفعة واحدة
+    a, b = pm.assign_batch(np.stack([-v, -v]), ["audio", "video"])
+    assert a != b
+    assert pm.faiss.partition("image").index.ntotal == 1
+
+    assert pm.search(v, k=1, modality="image")[0] == [p_img]
+    assert set(pm.search(v, k=2)[0]) == {p_img, p_txt}  # cross-modal
+
+
+def test_legacy_global_index_is_split(tmp_path):
+    rng = np.random.default_rng(1)
+    X = rng.standard_normal((6, 384)).astype(np.float32)
+    pm = _pm(tmp_path)
+    ids = pm.assign_batch(X, ["text", "image"] * 3)
+    pm.checkpoint()
+    # تخطيط قديم: فهرس عام واحد في faiss.bin
+    for path in glob.glob(str(tmp_path / "faiss.*.bin*")):
+        os.remove(path)
+    legacy = FaissStore(384, str(tmp_path / "faiss.bin"))
+    legacy.add_batch(X, ids)
+    legacy.save()
+
+    pm2 = _pm(tmp_path)
+    assert sorted(pm2.faiss.partitions) == ["image", "text"]
+    assert os.path.exists(str(tmp_path / "faiss.bin.bak"))
+    assert pm2.search(X[1], k=1, modality="image")[0] == [ids[1]]
+    assert pm2.assign(X[2], "text") == ids[2]
+    assert len(_pm(tmp_path).protos) == 6
+
+
+def test_unknown_modalities_share_default_partition(tmp_path):
+    pm = _pm(tmp_path)
+    v = np.random.default_rng(2).standard_normal((3, 384)).astype(np.float32)
+    pm.assign_batch(v, ["video", "../../etc", "text"])
+    assert sorted(pm.faiss.partitions) == ["other", "text"]
+    pm.checkpoint()
+    # modality غير معروفة لا تنشئ ملفات partition خاصة بها
+    assert {os.path.basename(p).split(".")[1] for p in glob.glob(str(tmp_path / "faiss.*"))} == {"other", "text"}
+
+
+def test_cross_modal_search_while_partitions_are_created(tmp_path):
+    store = PartitionedFaissStore(8, str(tmp_path / "faiss.bin"), modalities=[f"m{i}" for i in range(200)])
+    X = np.random.default_rng(3).standard_normal((200, 8)).astype(np.float32)
+    errors = []
+
+    def reader():
+        try:
+            while len(store.partitions) < 200:
+                store.search_batch(X[:2], k=1)
+                store.generation()
+        except Exception as e:
+            errors.append(e)
+    t = threading.Thread(target=reader)
+    t.start()
+    for i in range(200):
+        store.add(X[i], f"p_{i}", f"m{i}")
+    t.join()
+    assert not errors and len(store.partitions) == 200
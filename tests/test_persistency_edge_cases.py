@@ -9,7 +9,7 @@ def test_missing_ids_file():
         m = ProtoMemory(index_file=index_file, meta_file=meta_file)
         pid1 = m.assign([0.1]*384, modality="text")
         m.checkpoint()
-        os.remove(index_file + ".ids")
+        os.remove(m.faiss.partition_file("text") + ".ids")
         # إعادة تحميل مع تحذير متوقع
         m2 = ProtoMemory(index_file=index_file, meta_file=meta_file)
         pid2 = m2.assign([0.2]*384, modality="text")
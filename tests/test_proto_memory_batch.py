@@ -0,0 +1,58 @@
+from services.model.proto_memory import ProtoMemory
+import numpy as np
+
+
+def test_assign_batch_matches_sequential(tmp_path):
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((50, 384)).astype(np.float32)
+    X = base[rng.integers(0, 50, 400)] + 0.05 * rng.standard_normal((400, 384)).astype(np.float32)
+
+    pm_seq = ProtoMemory(index_file=str(tmp_path / "seq.bin"), meta_file=str(tmp_path / "seq.jsonl"))
+    expected = [pm_seq.assign(x, "text") for x in X]
+
+    pm = ProtoMemory(index_file=str(tmp_path / "batch.bin"), meta_file=str(tmp_path / "batch.jsonl"))
+    got = pm.assign_batch(X, "text")
+
+    assert got == expected
+    assert len(pm.protos) == len(pm_seq.protos)
+    assert sum(p["count"] for p in pm.protos.values()) == len(X)
+    assert pm.faiss.ntotal == len(pm.protos)
+
+
+def test_assign_batch_dedups_inside_batch(tmp_path):
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    v = np.random.rand(384).astype(np.float32)
+    other = -v
+    ids = pm.assign_batch(np.stack([v, v * 1.01, other]), ["text", "text", "image"], metas=[{"i": 0}, None, None])
+    assert ids[0] == ids[1] != ids[2]
+    assert pm.protos[ids[0]]["count"] == 2
+    assert pm.protos[ids[2]]["modality"] == "image"
+    # دفعة لاحقة تطابق الـ protos الموجودة
+    assert pm.assign_batch(v.reshape(1, -1), "text") == [ids[0]]
+
+
+def _unit(v):
+    return v / np.linalg.norm(v)
+
+
+def test_assign_batch_prefers_closer_new_proto_over_index_match(tmp_path):
+    # e موجود في الفهرس؛ x1 بعيد عنه (0.6) فيصبح proto جديدًا، و x2 يطابق e (0.76)
+    # لكنه أقرب إلى x1 (0.975): بالتتابع يذهب إلى proto x1
+    rng = np.random.default_rng(0)
+    e, u, w = np.linalg.qr(rng.standard_normal((384, 3)))[0].T
+    x1 = _unit(0.6 * e + 0.8 * u)
+    b = (0.975 - 0.76 * 0.6) / 0.8
+    x2 = _unit(0.76 * e + b * u + np.sqrt(1 - 0.76 ** 2 - b ** 2) * w)
+    X = np.stack([x1, x2, x1 + 0.01 * w, e]).astype(np.float32)
+
+    pm_seq = ProtoMemory(index_file=str(tmp_path / "seq.bin"), meta_file=str(tmp_path / "seq.jsonl"), threshold=0.75)
+    pm_seq.assign(e, "text")
+    expected = [pm_seq.assign(x, "text") for x in X]
+
+    pm = ProtoMemory(index_file=str(tmp_path / "batch.bin"), meta_file=str(tmp_path / "batch.jsonl"), threshold=0.75)
+    pm.assign(e, "text")
+    got = pm.assign_batch(X, "text")
+    assert got == expected == ["p_00001", "p_00001", "p_00001", "p_00000"]
+    for pid in set(got):
+        np.testing.assert_allclose(pm.centroids.get([pm.protos.row_of(pid)]),
+                                   pm_seq.centroids.get([pm_seq.protos.row_of(pid)]), atol=1e-6)
@@ -0,0 +1,47 @@
+import numpy as np
+from services.model.proto_memory import ProtoMemory
+from services.model.proto_merge import ProtoMerger
+from services.model.concept_graph import ConceptGraph
+
+
+def _pm(tmp_path):
+    # عتبة assign عالية: المتغيرات القريبة تصبح protos منفصلة (near-duplicates)
+    return ProtoMemory(index_file=str(tmp_path / "faiss.bin"), meta_file=str(tmp_path / "protos.jsonl"), threshold=0.99)
+
+
+def test_merge_near_duplicates(tmp_path):
+    rng = np.random.default_rng(0)
+    bases = rng.standard_normal((5, 384)).astype(np.float32)
+    X = np.repeat(bases, 3, axis=0) + 0.2 * rng.standard_normal((15, 384)).astype(np.float32)
+    pm = _pm(tmp_path)
+    ids = pm.assign_batch(X, "text")
+    assert len(set(ids)) == 15
+    pm.assign(X[1], "text")  # proto 1 يصبح count=2 فيبقى عند الدمج
+    cg = ConceptGraph(path=str(tmp_path / "cg.jsonl"))
+    concepts = [cg.link(pid, None) for pid in ids[:3]]
+
+    stats = ProtoMerger(pm, cg, threshold=0.9, pause=0).run_once()
+    assert stats["merged"] == 10 and len(pm.protos) == 5 and pm.faiss.ntotal == 5
+    keep = ids[1]
+    assert pm.protos[keep]["count"] == 4
+    C = pm.centroids
+    expected = (2 * X[1] / np.linalg.norm(X[1]) + X[0] / np.linalg.norm(X[0]) + X[2] / np.linalg.norm(X[2])) / 4
+    np.testing.assert_allclose(C.get([pm.protos.row_of(keep)])[0], expected, atol=1e-5)
+    assert all(cg.G.nodes[c]["proto_refs"] == [keep] for c in concepts)
+    assert cg.nearest(X[1], k=1, depth=0)[0]["concept_id"] in concepts  # متجهات المفاهيم من centroid الباقي
+    assert pm.search(X[0], k=1, modality="text")[0] == [keep]
+
+    # أرقام protos الجديدة لا تتكرر بعد الدمج
+    new = pm.assign(-bases[0], "text")
+    assert new not in ids
+    pm._wal.close()
+    pm2 = _pm(tmp_path)
+    assert set(pm2.protos) == set(pm.protos)
+    assert pm2.protos[keep]["count"] == 4
+
+
+def test_merge_does_not_cross_modalities(tmp_path):
+    v = np.random.default_rng(1).standard_normal(384).astype(np.float32)
+    pm = _pm(tmp_path)
+    pm.assign_batch(np.stack([v, v]), ["text", "image"])
+    assert ProtoMerger(pm, threshold=0.9, pause=0).run_once()["merged"] == 0
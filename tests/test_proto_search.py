@@ -0,0 +1,60 @@
+import numpy as np
+from services.model.proto_memory import ProtoMemory
+from services.model.faiss_store import FaissStore, normalize_rows
+
+
+def test_search_ids_and_sims_stay_aligned(tmp_path):
+    fs = FaissStore(8, str(tmp_path / "idx.bin"))
+    X = np.random.default_rng(0).standard_normal((3, 8)).astype(np.float32)
+    fs.add_batch(X, ["a", "b", "c"])
+    fs.remove("b")
+    ids, sims = fs.search(X[0], k=5)  # أكثر من الموجود: خانات -1
+    assert ids[0] == "a" and len(ids) == len(sims) == 2
+
+
+def test_range_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    X = normalize_rows(rng.standard_normal((300, 384)))
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    ids = pm.assign_batch(X, ["text", "image"] * 150)
+    Q = X[:4] + 0.5 * normalize_rows(rng.standard_normal((4, 384)))
+    S = normalize_rows(Q) @ X.T
+
+    got_ids, got_sims = pm.range_search(Q, 0.1)
+    for q in range(4):
+        expected = {ids[j] for j in np.flatnonzero(S[q] >= 0.1)}
+        assert set(got_ids[q]) == expected and len(got_sims[q]) == len(got_ids[q])
+        assert np.all(np.diff(got_sims[q]) <= 0)
+    text_ids, _ = pm.range_search(Q, 0.1, modality="text")
+    assert {ids[j] for j in np.flatnonzero(S[0] >= 0.1) if j % 2 == 0} == set(text_ids[0])
+    # limit: أعلى limit تشابهًا فقط لكل صف حتى مع عتبة تشمل الفهرس كله
+    lim_ids, lim_sims = pm.range_search(Q, -1.0, limit=5)
+    assert all(len(r) == 5 for r in lim_ids)
+    assert [ids[j] for j in np.argsort(-S[0])[:5]] == lim_ids[0]
+
+    top_ids, top_sims = pm.search_batch(Q, k=3)
+    assert [r[0] for r in top_ids] == ids[:4]
+    np.testing.assert_allclose(top_sims[0], np.sort(S[0])[::-1][:3], atol=1e-5)
+
+
+def test_range_fallback_for_indexes_without_range_search(tmp_path):
+    fs = FaissStore(16, str(tmp_path / "idx.bin"))
+    X = normalize_rows(np.random.default_rng(2).standard_normal((200, 16)))
+    fs.add_batch(X, [str(i) for i in range(200)])
+    lims, D, I = fs.index.range_search(X[:3], 0.05)
+    f_lims, f_D, f_I = fs._range_by_knn(X[:3], 0.05)
+    for q in range(3):
+        assert set(I[lims[q]:lims[q + 1]]) == set(f_I[f_lims[q]:f_lims[q + 1]])
+
+
+def test_rerank_skips_proto_merged_after_search(tmp_path, monkeypatch):
+    from services.model.faiss_partitions import PartitionedFaissStore
+
+    X = normalize_rows(np.random.default_rng(3).standard_normal((5, 384)))
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"), rerank=4)
+    ids = pm.assign_batch(X, "text")
+    monkeypatch.setattr(PartitionedFaissStore, "compressed", property(lambda self: True))
+    # دمج متزامن: أُزيل من الجدول بعد أن أعاده FAISS
+    del pm.protos[ids[0]]
+    got, sims = pm._search_uncached(X[:1], k=2)
+    assert ids[0] not in got[0] and len(got[0]) == 2 and np.all(np.isfinite(sims))
@@ -0,0 +1,83 @@
+import os
+import threading
+import numpy as np
+from services.model.proto_memory import ProtoMemory
+
+
+def _pm(tmp_path):
+    return ProtoMemory(index_file=str(tmp_path / "faiss.bin"), meta_file=str(tmp_path / "protos.jsonl"))
+
+
+def test_recover_wal_tail_after_crash(tmp_path):
+    rng = np.random.default_rng(1)
+    X = rng.standard_normal((6, 384)).astype(np.float32)
+    pm = _pm(tmp_path)
+    p0 = pm.assign(X[0], "text")
+    p1 = pm.assign(X[1], "text")
+    pm.checkpoint()
+    # بعد الـ checkpoint: أحداث في الـ WAL فقط (بدون حفظ كامل) ثم "انهيار"
+    pm.assign(X[0], "text")
+    p2 = pm.assign(X[2], "image", meta={"k": 1})
+    pm.update(p1, meta={"label": "x"})
+    pm._wal.close()
+
+    pm2 = _pm(tmp_path)
+    assert set(pm2.protos) == {p0, p1, p2}
+    assert pm2.protos[p0]["count"] == 2
+    assert pm2.protos[p2]["modality"] == "image"
+    assert pm2.protos[p1]["meta"] == {"label": "x"}
+    assert pm2.search(X[2], k=1)[0] == [p2]
+    # إعادة التطبيق مرة ثانية لا تغيّر شيئًا
+    pm3 = _pm(tmp_path)
+    assert pm3.protos[p0]["count"] == 2 and pm3.faiss.ntotal == 3
+
+
+def test_checkpoint_compacts_wal(tmp_path):
+    pm = _pm(tmp_path)
+    X = np.random.rand(4, 384).astype(np.float32) - 0.5
+    pm.assign_batch(X, "text")
+    assert os.path.getsize(pm.wal_file) > 0
+    pm.checkpoint()
+    assert os.path.getsize(pm.wal_file) == 0
+    pm.assign(X[0], "text")
+    pm._wal.close()
+    pm2 = _pm(tmp_path)
+    assert len(pm2.protos) == 4 and pm2.protos["p_00000"]["count"] == 2
+
+
+def test_truncated_wal_record_is_ignored(tmp_path):
+    pm = _pm(tmp_path)
+    pid = pm.assign(np.random.rand(384), "text")
+    pm._wal.close()
+    with open(pm.wal_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "assign", "proto_id": "p_0')
+    pm2 = _pm(tmp_path)
+    assert pid in pm2.protos and pm2.protos[pid]["count"] == 1
+    # الأحداث اللاحقة للقص تُستعاد
+    pm2.assign(np.random.rand(384), "text")
+    pm2._wal.close()
+    assert len(_pm(tmp_path).protos) == len(pm2.protos)
+
+
+def test_assign_during_checkpoint_is_not_applied_twice(tmp_path):
+    rng = np.random.default_rng(3)
+    base = rng.standard_normal(384).astype(np.float32)
+    X = base + 0.05 * rng.standard_normal((8, 384)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    pm = _pm(tmp_path)
+    pid = pm.assign(X[0], "text")
+    write_snapshot = pm.faiss.write_snapshot
+
+    def racing_write(index):
+        # assign من thread آخر بعد تثبيت seq وقبل كتابة الـ centroids
+        t = threading.Thread(target=lambda: [pm.assign(x, "text") for x in X[1:]])
+        t.start()
+        t.join()
+        write_snapshot(index)
+    pm.faiss.write_snapshot = racing_write
+    pm.checkpoint()
+    pm._wal.close()
+
+    pm2 = _pm(tmp_path)
+    assert pm2.protos[pid]["count"] == 8
+    np.testing.assert_allclose(pm2.centroids.get([pm2.protos.row_of(pid)])[0], X.mean(axis=0), atol=1e-5)
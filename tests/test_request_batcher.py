@@ -0,0 +1,90 @@
+import threading
+import time
+import pytest
+from services.model.request_batcher import RequestBatcher
+
+
+def _concurrent(batcher, payloads):
+    results = [None] * len(payloads)
+
+    def call(i):
+        try:
+            results[i] = batcher(payloads[i])
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(payloads))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_coalesces_concurrent_requests():
+    sizes = []
+
+    def handler(payloads):
+        sizes.append(len(payloads))
+        time.sleep(0.005)
+        return [p * 2 for p in payloads]
+    batcher = RequestBatcher(handler, max_batch=16, max_wait_ms=20)
+    assert _concurrent(batcher, list(range(64))) == [p * 2 for p in range(64)]
+    assert sum(sizes) == 64 and len(sizes) < 64 and max(sizes) <= 16
+    st = batcher.stats()
+    assert st["items"] == 64 and st["batches"] == len(sizes) and st["max_batch_size"] == max(sizes)
+    assert st["avg_batch_size"] > 1 and 0 <= st["wait_p50_ms"] <= st["wait_p99_ms"]
+    batcher.close()
+
+
+def test_errors_reach_only_their_caller():
+    def handler(payloads):
+        if "boom" in payloads:
+            raise RuntimeError("batch failed")
+        return [ValueError(p) if p == "bad" else p.upper() for p in payloads]
+    batcher = RequestBatcher(handler, max_batch=8, max_wait_ms=10)
+    out = _concurrent(batcher, ["a", "bad", "c"])
+    assert out[0] == "A" and out[2] == "C" and isinstance(out[1], ValueError)
+    with pytest.raises(RuntimeError):
+        batcher("boom")
+    assert batcher("d") == "D" and batcher.stats()["errors"] == 1
+    batcher.close()
+
+
+def test_single_request_waits_at_most_max_wait():
+    batcher = RequestBatcher(lambda p: p, max_batch=64, max_wait_ms=5)
+    start = time.monotonic()
+    assert batcher("x") == "x"
+    assert time.monotonic() - start < 0.5
+    direct = RequestBatcher(lambda p: [len(p)], max_batch=1)
+    assert direct("y") == 1 and direct._thread is None
+    batcher.close()
+
+
+def test_coalesced_assign_matches_unbatched(tmp_path, monkeypatch):
+    import numpy as np
+    from fastapi.testclient import TestClient
+    from services.api import main
+    from services.model.proto_memory import ProtoMemory
+
+    rng = np.random.default_rng(4)
+    e, u, w = np.linalg.qr(rng.standard_normal((384, 3)))[0].T
+    b = (0.975 - 0.76 * 0.6) / 0.8
+    x2 = 0.76 * e + b * u + np.sqrt(1 - 0.76 ** 2 - b ** 2) * w
+    near = [0.6 * e + 0.8 * u, x2, e + 0.05 * w, x2 + 0.01 * e]
+    payloads = [(np.asarray(v / np.linalg.norm(v), dtype=np.float32), "text") for v in near]
+
+    def fresh(name):
+        pm = ProtoMemory(index_file=str(tmp_path / f"{name}.bin"), meta_file=str(tmp_path / f"{name}.jsonl"),
+                         threshold=0.75)
+        pm.assign(e, "text")
+        monkeypatch.setattr(main, "pm", pm)
+
+    # دفعة واحدة: ما يسلمه assign_batcher لـ _assign_many عند تزامن الطلبات
+    fresh("batched")
+    batched = main._assign_many(payloads)
+    # طلبات /assign متتالية: كل دفعة بعنصر واحد
+    fresh("unbatched")
+    client = TestClient(main.app)
+    unbatched = [client.post("/assign", json={"embedding": v.tolist(), "modality": m},
+                             headers={"X-API-KEY": main.API_KEY}).json()["proto_id"] for v, m in payloads]
+    assert batched == unbatched
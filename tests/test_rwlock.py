@@ -0,0 +1,53 @@
+import threading
+import numpy as np
+from services.model.rwlock import RWLock
+from services.model.proto_memory import ProtoMemory
+
+
+def test_readers_share_writer_excludes():
+    lock = RWLock()
+    inside = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read():
+            inside.wait()  # ينجح فقط إذا كان القارئان داخل القفل معًا
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    state = []
+    with lock.read():
+        w = threading.Thread(target=lambda: (lock.acquire(), state.append("w"), lock.release()))
+        w.start()
+        w.join(0.2)
+        assert state == []  # الكاتب ينتظر خروج القارئ
+    w.join(5)
+    assert state == ["w"]
+
+
+def test_concurrent_search_during_writes(tmp_path):
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((200, 384)).astype(np.float32)
+    ids = pm.assign_batch(X[:100], "text")
+    errors = []
+
+    def reader():
+        try:
+            for i in range(100):
+                assert pm.search(X[i], k=1)[0] == [ids[i]]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(100, 200, 10):
+        pm.assign_batch(X[i:i + 10], "text")
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(pm.protos) == 200
@@ -0,0 +1,45 @@
+import numpy as np
+from services.model.search_cache import SearchCache
+from services.model.proto_memory import ProtoMemory
+
+
+def test_lru_eviction_and_generation():
+    c = SearchCache(max_entries=2, ttl=60)
+    c.put("a", 0, 1)
+    c.put("b", 0, 2)
+    assert c.get("a", 0) == 1
+    c.put("c", 0, 3)  # يطرد b (الأقدم استخدامًا)
+    assert c.get("b", 0) is None and c.evictions == 1
+    assert c.get("a", 1) is None and c.invalidations == 1
+    assert c.stats()["hits"] == 1
+
+
+def test_ttl_expiry():
+    c = SearchCache(max_entries=10, ttl=0)
+    c.put("a", 0, 1)
+    assert c.get("a", 0) is None
+
+
+def test_repeated_queries_skip_faiss_until_index_changes(tmp_path):
+    pm = ProtoMemory(index_file=str(tmp_path / "pm.bin"), meta_file=str(tmp_path / "pm.jsonl"))
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((3, 384)).astype(np.float32)
+    pid = pm.assign(X[0], "text")
+    calls = []
+    real = pm.faiss.search_batch
+    pm.faiss.search_batch = lambda *a, **kw: calls.append(1) or real(*a, **kw)
+
+    assert pm.assign(X[0], "text") == pid  # يحسب ويخزن
+    assert pm.assign(X[0], "text") == pid  # من الكاش
+    assert pm.search(X[0], k=1, modality="text")[0] == [pid]
+    assert pm.search(X[0], k=1, modality="text")[0] == [pid]
+    assert len(calls) == 1 and pm.protos[pid]["count"] == 3
+    # proto جديد في نفس الـ partition يبطل النتائج المخزنة
+    pm.assign(X[1], "text")
+    assert pm.assign(X[0], "text") == pid
+    assert len(calls) == 3
+    # تعديل partition أخرى لا يبطلها
+    pm.assign(X[2], "image")
+    pm.assign(X[0], "text")
+    assert len(calls) == 4
+    assert pm.search_cache.stats()["hit_rate"] > 0